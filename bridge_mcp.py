@@ -9,10 +9,19 @@ Key Features:
 - Works across all Claude Code/Desktop sessions
 """
 
-from fastmcp import FastMCP
+from fastmcp import FastMCP, Context
+from fastmcp.utilities.types import Image
 import asyncio
+import base64
+import hashlib
+import itertools
 import json
 import os
+import random
+import sys
+import time
+from collections import deque
+from contextlib import asynccontextmanager
 from typing import Optional, Dict, Any
 import httpx
 
@@ -21,12 +30,494 @@ try:
     from config import agent_storage, config
 except ImportError:
     # Fallback for when running standalone
-    import sys
     from pathlib import Path
     sys.path.insert(0, str(Path(__file__).parent))
     from config import agent_storage, config
 
-mcp = FastMCP("Bridge MCP")
+# Chunk layout / hashing / delta encoding shared with the agent's file endpoints
+from local_agent_tools.file_transfer import sha256_file, PART_SUFFIX
+from local_agent_tools import file_sync
+
+# ============================================
+# HTTP CLIENT POOL (one long-lived client per agent)
+# ============================================
+
+try:
+    import h2  # noqa: F401  (optional, enables HTTP/2 in httpx)
+    HAS_HTTP2 = True
+except ImportError:
+    HAS_HTTP2 = False
+
+
+class AgentClientPool:
+    """
+    Keeps one keep-alive httpx.AsyncClient per agent for the life of the relay.
+    Clients are rebuilt if the agent's URL changes or the event loop changes
+    (e.g. the one-off loop used for discovery at import time).
+    """
+
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._meta: Dict[str, tuple] = {}
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=config.get("max_connections_per_agent", 10),
+            max_keepalive_connections=config.get("max_keepalive_per_agent", 5),
+            keepalive_expiry=config.get("keepalive_expiry", 30.0),
+        )
+
+    def get(self, agent_id: str, base_url: str) -> httpx.AsyncClient:
+        """Get (or create) the pooled client for an agent."""
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(agent_id)
+        if client is not None and not client.is_closed and self._meta.get(agent_id) == (base_url, loop):
+            return client
+
+        if client is not None and not client.is_closed:
+            stale_loop = self._meta.get(agent_id, (None, None))[1]
+            if stale_loop is loop:
+                loop.create_task(client.aclose())
+
+        client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=config.get("connection_timeout", 30),
+            limits=self._limits(),
+            http2=HAS_HTTP2 and config.get("http2", False),
+        )
+        self._clients[agent_id] = client
+        self._meta[agent_id] = (base_url, loop)
+        return client
+
+    async def close(self, agent_id: str):
+        """Close the client for a single agent (e.g. after unregister)."""
+        client = self._clients.pop(agent_id, None)
+        self._meta.pop(agent_id, None)
+        if client is not None and not client.is_closed:
+            await client.aclose()
+
+    async def aclose(self):
+        """Close every pooled client. Called on relay shutdown."""
+        for agent_id in list(self._clients.keys()):
+            try:
+                await self.close(agent_id)
+            except Exception:
+                pass
+
+
+client_pool = AgentClientPool()
+
+# ============================================
+# BINARY PAYLOADS (optional msgpack envelope for large results)
+# ============================================
+
+try:
+    import msgpack
+    HAS_MSGPACK = True
+except ImportError:
+    HAS_MSGPACK = False
+
+MSGPACK_TYPE = "application/msgpack"
+
+
+def use_binary(binary: bool) -> bool:
+    """Whether to ask the agent for the msgpack envelope on this request."""
+    return binary and HAS_MSGPACK and config.get("binary_payloads", True)
+
+
+def has_bytes(value) -> bool:
+    """Does a request payload carry raw bytes (e.g. an upload chunk)?"""
+    if isinstance(value, (bytes, bytearray)):
+        return True
+    if isinstance(value, dict):
+        return any(has_bytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return any(has_bytes(v) for v in value)
+    return False
+
+
+def base64_bytes(value):
+    """Base64-encode raw bytes so a payload can go out as JSON (no msgpack)."""
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode()
+    if isinstance(value, dict):
+        return {k: base64_bytes(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [base64_bytes(v) for v in value]
+    return value
+
+
+def decode_response(response: httpx.Response) -> dict:
+    """Decode an agent reply according to its Content-Type."""
+    if response.headers.get("content-type", "").startswith(MSGPACK_TYPE):
+        return msgpack.unpackb(response.content, raw=False)
+    return response.json()
+
+# ============================================
+# WEBSOCKET COMMAND CHANNEL (optional, falls back to HTTP)
+# ============================================
+
+try:
+    import aiohttp
+    HAS_WEBSOCKET = True
+except ImportError:
+    HAS_WEBSOCKET = False
+
+
+class ChannelSendError(ConnectionError):
+    """The request never left the relay, so it is safe to retry over HTTP."""
+
+
+class AgentChannel:
+    """
+    One persistent WebSocket to an agent's /ws endpoint. Requests carry an id
+    and many can be in flight; replies are matched back to their futures.
+    Unsolicited agent events are kept in `events`.
+    """
+
+    def __init__(self, base_url: str, token: Optional[str]):
+        self.base_url = base_url
+        self.token = token
+        self.loop = None
+        self.events = deque(maxlen=100)
+        self._session = None
+        self._ws = None
+        self._reader: Optional[asyncio.Task] = None
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+
+    @property
+    def connected(self) -> bool:
+        return self._ws is not None and not self._ws.closed
+
+    async def connect(self, timeout: float):
+        self.loop = asyncio.get_running_loop()
+        self._session = aiohttp.ClientSession()
+        headers = {"Authorization": f"Bearer {self.token}"} if self.token else {}
+        url = self.base_url.replace("http", "ws", 1).rstrip("/") + "/ws"
+        try:
+            self._ws = await asyncio.wait_for(
+                self._session.ws_connect(url, headers=headers, heartbeat=30, max_msg_size=0), timeout
+            )
+        except BaseException:
+            await self._session.close()
+            raise
+        self._reader = self.loop.create_task(self._read())
+
+    async def _read(self):
+        try:
+            async for msg in self._ws:
+                if msg.type == aiohttp.WSMsgType.TEXT:
+                    data = json.loads(msg.data)
+                elif msg.type == aiohttp.WSMsgType.BINARY and HAS_MSGPACK:
+                    data = msgpack.unpackb(msg.data, raw=False)
+                else:
+                    continue
+                future = self._pending.pop(data.get("id"), None)
+                if future is not None:
+                    if not future.done():
+                        future.set_result(data)
+                elif "event" in data:
+                    self.events.append(data)
+        except Exception:
+            pass
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("WebSocket channel to agent closed"))
+            self._pending.clear()
+
+    async def request(self, path: str, body: dict, timeout: float, binary: bool = False) -> dict:
+        request_id = str(next(self._ids))
+        future = self.loop.create_future()
+        self._pending[request_id] = future
+        message = {"id": request_id, "path": path, "body": body}
+        if binary:
+            message["accept"] = MSGPACK_TYPE
+        try:
+            try:
+                if has_bytes(body):
+                    if HAS_MSGPACK:
+                        await self._ws.send_bytes(msgpack.packb(message, use_bin_type=True))
+                    else:
+                        await self._ws.send_json(base64_bytes(message))
+                else:
+                    await self._ws.send_json(message)
+            except Exception as e:
+                raise ChannelSendError(str(e))
+            reply = await asyncio.wait_for(future, timeout)
+            return reply.get("body", {})
+        finally:
+            self._pending.pop(request_id, None)
+            if future.done() and not future.cancelled():
+                future.exception()  # the channel closed before we awaited it; already handled
+
+    async def close(self):
+        if self._ws is not None:
+            await self._ws.close()
+        if self._reader is not None:
+            self._reader.cancel()
+        if self._session is not None:
+            await self._session.close()
+
+
+class AgentChannelPool:
+    """
+    WebSocket channels keyed by agent. Agents without a working /ws (older
+    agents, proxies that strip upgrades) are retried only every
+    `websocket_retry_interval` seconds; callers use HTTP meanwhile.
+    """
+
+    def __init__(self):
+        self._channels: Dict[str, AgentChannel] = {}
+        self._retry_after: Dict[str, float] = {}
+        self._locks: Dict[str, tuple] = {}  # agent id -> (lock, loop)
+
+    async def get(self, agent_id: str, base_url: str, token: Optional[str]) -> Optional[AgentChannel]:
+        """Get a connected channel, or None if HTTP should be used."""
+        if not HAS_WEBSOCKET or not config.get("use_websocket", True):
+            return None
+        loop = asyncio.get_running_loop()
+        channel = self._channels.get(agent_id)
+        if channel and channel.connected and channel.loop is loop \
+                and (channel.base_url, channel.token) == (base_url, token):
+            return channel
+        if time.time() < self._retry_after.get(agent_id, 0):
+            return None
+
+        lock, lock_loop = self._locks.get(agent_id, (None, None))
+        if lock is None or lock_loop is not loop:
+            lock = asyncio.Lock()
+            self._locks[agent_id] = (lock, loop)
+        async with lock:
+            channel = self._channels.get(agent_id)
+            if channel and channel.connected and channel.loop is loop \
+                    and (channel.base_url, channel.token) == (base_url, token):
+                return channel
+            if channel is not None:
+                self._channels.pop(agent_id, None)
+                if channel.loop is loop:
+                    await channel.close()
+            channel = AgentChannel(base_url, token)
+            try:
+                await channel.connect(config.get("websocket_connect_timeout", 2.0))
+            except Exception:
+                self._retry_after[agent_id] = time.time() + config.get("websocket_retry_interval", 60)
+                return None
+            self._retry_after.pop(agent_id, None)
+            self._channels[agent_id] = channel
+            return channel
+
+    async def close(self, agent_id: str):
+        channel = self._channels.pop(agent_id, None)
+        self._retry_after.pop(agent_id, None)
+        if channel is not None:
+            await channel.close()
+
+    async def aclose(self):
+        for agent_id in list(self._channels.keys()):
+            try:
+                await self.close(agent_id)
+            except Exception:
+                pass
+
+
+channel_pool = AgentChannelPool()
+
+# ============================================
+# AGENT HEALTH MONITOR (cached liveness)
+# ============================================
+
+class AgentHealthMonitor:
+    """
+    Background task that probes every registered agent (and the local
+    auto-discovery URL) and keeps a liveness table in memory, so picking
+    an agent for a command never does network I/O.
+    
+    Healthy agents are re-probed every `health_check_interval` seconds;
+    failing ones back off exponentially (with jitter) up to `health_check_max_backoff`.
+    """
+
+    def __init__(self):
+        self.liveness: Dict[str, Dict[str, Any]] = {}
+        self.in_flight: Dict[str, int] = {}  # commands this relay has outstanding per agent
+        self.sticky: Dict[tuple, str] = {}   # (session group, tags) -> agent id
+        self._task: Optional[asyncio.Task] = None
+        self._swept: Optional[asyncio.Event] = None  # set once the task's first sweep is done
+
+    def _next_delay(self, failures: int) -> float:
+        interval = config.get("health_check_interval", 15)
+        delay = min(interval * (2 ** failures), config.get("health_check_max_backoff", 300))
+        return delay * random.uniform(0.5, 1.0) if failures else delay * random.uniform(0.9, 1.1)
+
+    def is_alive(self, agent_id: str) -> Optional[bool]:
+        """Cached liveness: True/False, or None if never probed."""
+        entry = self.liveness.get(agent_id)
+        return entry["alive"] if entry else None
+
+    def mark(self, agent_id: str, alive: bool, latency_ms: float = None,
+             persist: bool = True, health: dict = None):
+        """Record a probe (or relayed command) outcome, plus any /health payload."""
+        entry = self.liveness.get(agent_id)
+        was_alive = entry["alive"] if entry else None
+        failures = 0 if alive else (entry["failures"] + 1 if entry else 1)
+        now = time.time()
+        self.liveness[agent_id] = {
+            "alive": alive,
+            "failures": failures,
+            "checked_at": now,
+            "next_check": now + self._next_delay(failures),
+            "latency_ms": latency_ms,
+            "tags": health.get("tags", []) if health else (entry or {}).get("tags", []),
+            "load": health.get("load", {}) if health else (entry or {}).get("load", {}),
+        }
+        if persist and was_alive != alive and agent_storage.get(agent_id) is not None:
+            agent_storage.update_status(agent_id, "connected" if alive else "disconnected")
+
+    async def probe(self, agent_id: str, url: str) -> bool:
+        """Probe one agent's /health endpoint."""
+        start = time.perf_counter()
+        try:
+            client = client_pool.get(agent_id, url)
+            response = await client.get("/health", timeout=config.get("health_check_timeout", 2.0))
+            alive = response.status_code == 200
+            health = response.json() if alive else None
+        except Exception:
+            alive, health = False, None
+        latency_ms = round((time.perf_counter() - start) * 1000, 1) if alive else None
+        self.mark(agent_id, alive, latency_ms, health=health)
+        return alive
+
+    def tags(self, agent_id: str) -> list:
+        """Tags the agent advertised on its last successful /health."""
+        return (self.liveness.get(agent_id) or {}).get("tags", [])
+
+    async def sweep(self):
+        """Probe every agent whose next check is due (concurrently)."""
+        now = time.time()
+        targets = {aid: info["callback_url"] for aid, info in agent_storage.get_all().items()}
+        # Auto-discovery: watch the default localhost agent even before it registers
+        if config.get("auto_connect_localhost", True) and "local" not in targets:
+            targets["local"] = f"http://127.0.0.1:{config.get('local_agent_port', 8006)}"
+        
+        due = [
+            (aid, url) for aid, url in targets.items()
+            if self.liveness.get(aid, {}).get("next_check", 0) <= now
+        ]
+        if due:
+            await asyncio.gather(*(self.probe(aid, url) for aid, url in due))
+        
+        local = self.liveness.get("local")
+        if local and local["alive"] and agent_storage.get("local") is None:
+            agent_storage.register("local", targets["local"], "Local PC (Auto-discovered)")
+            agent_storage.update_status("local", "connected")
+        
+        for aid in list(self.liveness.keys()):
+            if aid not in targets:
+                del self.liveness[aid]
+
+    async def _run(self):
+        swept = self._swept
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                print(f"[Health] Sweep failed: {e}", file=sys.stderr)
+            swept.set()
+            upcoming = [e["next_check"] for e in self.liveness.values()]
+            wait = (min(upcoming) - time.time()) if upcoming else config.get("health_check_interval", 15)
+            await asyncio.sleep(max(0.5, min(wait, config.get("health_check_interval", 15))))
+
+    def ensure_running(self):
+        """Start the background task on the current loop if it isn't running."""
+        if self._task is None or self._task.done() or self._task.get_loop() is not asyncio.get_running_loop():
+            self._swept = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def ready(self):
+        """
+        On a fresh relay, wait (up to the probe timeout) for the first sweep so
+        agents that are already up can be picked; afterwards this returns at once.
+        """
+        self.ensure_running()
+        if self.liveness or self._swept.is_set():
+            return
+        try:
+            await asyncio.wait_for(self._swept.wait(), config.get("health_check_timeout", 2.0) + 0.5)
+        except asyncio.TimeoutError:
+            pass
+
+    async def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def load(self, agent_id: str) -> int:
+        """Last reported load (in-flight + queued) plus what this relay has outstanding."""
+        reported = (self.liveness.get(agent_id) or {}).get("load", {})
+        return reported.get("in_flight", 0) + reported.get("queue_depth", 0) + self.in_flight.get(agent_id, 0)
+
+    def begin(self, agent_id: str):
+        self.in_flight[agent_id] = self.in_flight.get(agent_id, 0) + 1
+
+    def end(self, agent_id: str):
+        self.in_flight[agent_id] = max(0, self.in_flight.get(agent_id, 0) - 1)
+
+    def pick(self, agents: Dict[str, dict], tags: list = None, sticky_group: str = None) -> Optional[str]:
+        """
+        Choose an agent for an untargeted command from cached state only.
+        
+        Candidates must carry every requested tag. Stateful session groups
+        (e.g. the Playwright browser) stick to the agent they started on while
+        it stays up; otherwise the least-loaded healthy agent wins (ties go to
+        local, then registration order). With no healthy agent: first not yet
+        probed, then first registered.
+        """
+        candidates = [aid for aid in agents if all(t in self.tags(aid) for t in tags)] if tags else list(agents)
+        if not candidates:
+            return None
+        
+        sticky_key = (sticky_group, tuple(tags or ()))
+        if sticky_group:
+            aid = self.sticky.get(sticky_key)
+            if aid in candidates and self.is_alive(aid) is not False:
+                return aid
+        
+        prefer_local = config.get("auto_connect_localhost", True)
+        alive = [aid for aid in candidates if self.is_alive(aid)]
+        if alive:
+            order = {aid: i for i, aid in enumerate(candidates)}
+            chosen = min(alive, key=lambda aid: (
+                self.load(aid), 0 if prefer_local and aid == "local" else 1, order[aid]
+            ))
+        else:
+            chosen = next((aid for aid in candidates if self.is_alive(aid) is None), candidates[0])
+        
+        if sticky_group:
+            self.sticky[sticky_key] = chosen
+        return chosen
+
+
+health_monitor = AgentHealthMonitor()
+
+
+@asynccontextmanager
+async def relay_lifespan(server):
+    """Relay lifecycle: start the health monitor, release pooled connections on shutdown."""
+    health_monitor.ensure_running()
+    try:
+        yield
+    finally:
+        await health_monitor.stop()
+        await channel_pool.aclose()
+        await client_pool.aclose()
+
+
+mcp = FastMCP("Bridge MCP", lifespan=relay_lifespan)
 
 # ============================================
 # AUTO-DISCOVERY ON STARTUP
@@ -40,15 +531,16 @@ async def auto_discover_local_agent():
     local_url = f"http://127.0.0.1:{config.get('local_agent_port', 8006)}"
     
     try:
-        async with httpx.AsyncClient(timeout=2.0) as client:
-            response = await client.get(f"{local_url}/health")
-            if response.status_code == 200:
-                # Local agent is running! Auto-register if not already
-                existing = agent_storage.get("local")
-                if not existing or existing.get("callback_url") != local_url:
-                    agent_storage.register("local", local_url, "Local PC (Auto-discovered)")
-                agent_storage.update_status("local", "connected")
-                return True
+        client = client_pool.get("local", local_url)
+        response = await client.get("/health", timeout=2.0)
+        if response.status_code == 200:
+            # Local agent is running! Auto-register if not already
+            existing = agent_storage.get("local")
+            if not existing or existing.get("callback_url") != local_url:
+                agent_storage.register("local", local_url, "Local PC (Auto-discovered)")
+            agent_storage.update_status("local", "connected")
+            health_monitor.mark("local", True)
+            return True
     except:
         pass
     return False
@@ -66,9 +558,12 @@ except:
 @mcp.resource("desktop://screenshot/latest")
 async def get_latest_screenshot() -> str:
     """Get the most recent screenshot as base64 data."""
-    result = await relay_command(None, "screenshot", {})
+    result = await fetch_screenshot(None, {})
     if "image" in result:
-        return f"data:image/png;base64,{result['image']}"
+        image = result["image"]
+        if isinstance(image, bytes):
+            image = base64.b64encode(image).decode()
+        return f"data:image/{result.get('format', 'png')};base64,{image}"
     return "Screenshot not available"
 
 @mcp.resource("desktop://windows")
@@ -92,9 +587,9 @@ async def get_agent_logs() -> str:
     callback_url = agent["callback_url"]
     
     try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.get(f"{callback_url}/logs")
-            return response.text
+        client = client_pool.get(agent_id, callback_url)
+        response = await client.get("/logs", timeout=5.0)
+        return response.text
     except:
         return "Logs unavailable"
 
@@ -118,10 +613,10 @@ async def get_session_context() -> str:
     callback_url = agent["callback_url"]
     
     try:
-        async with httpx.AsyncClient(timeout=5.0) as client:
-            response = await client.get(f"{callback_url}/session/context")
-            data = response.json()
-            return data.get("summary", "No session context available")
+        client = client_pool.get(agent_id, callback_url)
+        response = await client.get("/session/context", timeout=5.0)
+        data = response.json()
+        return data.get("summary", "No session context available")
     except:
         return "Session context unavailable"
 
@@ -144,6 +639,7 @@ Available capabilities:
 - browser_click(selector) - Click web elements
 - get_desktop_state() - See open windows
 - run_powershell(cmd) - Execute commands (requires approval)
+- batch(actions) - Run several steps in one round trip
 
 Instructions:
 1. Take a screenshot first to see the current state
@@ -226,7 +722,7 @@ def register_agent(agent_id: str, callback_url: str, agent_name: str = "My PC")
     return agent_storage.register(agent_id, callback_url, agent_name)
 
 @mcp.tool
-def unregister_agent(agent_id: str) -> dict:
+async def unregister_agent(agent_id: str) -> dict:
     """
     Remove a registered agent.
     
@@ -236,6 +732,8 @@ def unregister_agent(agent_id: str) -> dict:
     Returns:
         Removal confirmation
     """
+    await channel_pool.close(agent_id)
+    await client_pool.close(agent_id)
     return agent_storage.unregister(agent_id)
 
 @mcp.tool
@@ -253,16 +751,41 @@ def list_agents() -> dict:
         "config_location": str(agent_storage.agents_file)
     }
 
+async def probe_agent_health(aid: str, info: dict, timeout: float) -> tuple:
+    """Probe one agent's /health. Returns (agent_id, result, storage_status)."""
+    url = info['callback_url']
+    start = time.perf_counter()
+    try:
+        client = client_pool.get(aid, url)
+        response = await client.get("/health", timeout=timeout)
+        latency_ms = round((time.perf_counter() - start) * 1000, 1)
+        if response.status_code == 200:
+            health = response.json()
+            return aid, {
+                "status": "healthy", "url": url, "latency_ms": latency_ms,
+                "tags": health.get("tags", []), "load": health.get("load", {})
+            }, "connected"
+        return aid, {"status": "error", "code": response.status_code, "latency_ms": latency_ms}, "error"
+    except httpx.ConnectError:
+        return aid, {"status": "disconnected", "url": url}, "disconnected"
+    except httpx.TimeoutException:
+        return aid, {"status": "timeout", "url": url}, "disconnected"
+    except Exception as e:
+        return aid, {"status": "error", "error": str(e)}, None
+
 @mcp.tool
-async def check_agent_health(agent_id: str = None) -> dict:
+async def check_agent_health(agent_id: str = None, concurrency: int = None,
+                             deadline: float = None, ctx: Context = None) -> dict:
     """
     Check if an agent is online and responding.
     
     Args:
         agent_id: Optional. Agent to check (checks all if not specified)
+        concurrency: Optional. Max probes in flight at once
+        deadline: Optional. Seconds to wait overall; slower agents report "timeout"
     
     Returns:
-        Health status of agent(s)
+        Health status of agent(s), with round-trip latency
     """
     results = {}
     agents = agent_storage.get_all()
@@ -271,22 +794,44 @@ async def check_agent_health(agent_id: str = None) -> dict:
         if agent_id not in agents:
             return {"error": f"Agent {agent_id} not registered"}
         agents = {agent_id: agents[agent_id]}
+    if not agents:
+        return results
+    
+    concurrency = concurrency or config.get("health_check_concurrency", 20)
+    deadline = deadline or config.get("health_check_deadline", 15)
+    per_agent_timeout = min(5.0, deadline)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    
+    async def bounded(aid, info):
+        async with semaphore:
+            return await probe_agent_health(aid, info, per_agent_timeout)
+    
+    tasks = [asyncio.create_task(bounded(aid, info)) for aid, info in agents.items()]
+    statuses = {}
+    try:
+        # Stream results back as progress notifications as they arrive
+        for done in asyncio.as_completed(tasks, timeout=deadline):
+            aid, result, status = await done
+            results[aid] = result
+            if status:
+                statuses[aid] = status
+                health_monitor.mark(aid, status == "connected", result.get("latency_ms"),
+                                    persist=False, health=result if status == "connected" else None)
+            if ctx:
+                await ctx.report_progress(len(results), len(agents), f"{aid}: {result['status']}")
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        for task in tasks:
+            task.cancel()
     
     for aid, info in agents.items():
-        try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.get(f"{info['callback_url']}/health")
-                if response.status_code == 200:
-                    agent_storage.update_status(aid, "connected")
-                    results[aid] = {"status": "healthy", "url": info['callback_url']}
-                else:
-                    agent_storage.update_status(aid, "error")
-                    results[aid] = {"status": "error", "code": response.status_code}
-        except httpx.ConnectError:
-            agent_storage.update_status(aid, "disconnected")
-            results[aid] = {"status": "disconnected", "url": info['callback_url']}
-        except Exception as e:
-            results[aid] = {"status": "error", "error": str(e)}
+        if aid not in results:
+            results[aid] = {"status": "timeout", "url": info['callback_url']}
+    
+    # One batched write for the whole sweep
+    if statuses:
+        agent_storage.update_statuses(statuses)
     
     return results
 
@@ -307,114 +852,393 @@ def set_default_agent(agent_id: str) -> dict:
 # COMMAND RELAY (Uses Persistent Storage)
 # ============================================
 
-async def relay_command(agent_id: Optional[str], command: str, params: dict) -> dict:
+async def relay_command(agent_id: Optional[str], command: str, params: dict,
+                        binary: bool = False, timeout: float = None) -> dict:
     """
     Relay a command to a local agent.
     Uses persistent storage to find agents.
+    With binary=True, large results (images) may come back as raw bytes.
+    """
+    return await relay_request(agent_id, "/execute", {"command": command, "params": params},
+                               timeout=timeout, binary=binary)
+
+def sticky_group(payload: dict) -> Optional[str]:
+    """Session group for stateful commands that must keep hitting the same agent."""
+    command = payload.get("command")
+    if command is None and payload.get("items"):
+        command = payload["items"][0].get("command")
+    for prefix in config.get("sticky_command_prefixes", ["browser_", "screenshot_delta"]):
+        if command and command.startswith(prefix):
+            return prefix
+    return None
+
+async def resolve_agent(agent_id: Optional[str], payload: dict):
+    """
+    Resolve the target agent for a request.
+    Returns (agent_id, agent_info, None) or (None, None, error_dict).
     """
     agents = agent_storage.get_all()
     
-    # If no agent specified, try to find one
-    if not agent_id:
-        # First, try auto-discovery
-        if config.get("auto_connect_localhost", True):
-            if await auto_discover_local_agent():
-                agent_id = "local"
-        
-        # Use first available agent
-        if not agent_id and agents:
-            agent_id = list(agents.keys())[0]
+    # If no agent specified (or only "tag:a,b"), pick one from the cached
+    # liveness table (discovery and probing happen in the background health monitor)
+    if not agent_id or agent_id.startswith("tag:"):
+        tags = [t for t in agent_id[4:].split(",") if t] if agent_id else []
+        await health_monitor.ready()
+        agents = agent_storage.get_all()  # the first sweep may have registered "local"
+        agent_id = health_monitor.pick(agents, tags=tags, sticky_group=sticky_group(payload))
     
     if not agent_id or agent_id not in agents:
-        return {
+        return None, None, {
             "error": "No agents available",
             "hint": "Start local_agent.py on your Windows PC. It will auto-register.",
             "registered_agents": list(agents.keys()) if agents else [],
             "config_file": str(agent_storage.agents_file)
         }
+    return agent_id, agents[agent_id], None
+
+def auth_headers(agent: dict) -> dict:
+    token = agent.get("token")
+    return {"Authorization": f"Bearer {token}"} if token else {}
+
+async def relay_request(agent_id: Optional[str], path: str, payload: dict,
+                        timeout: float = None, binary: bool = False) -> dict:
+    """
+    POST a JSON payload to an agent endpoint (/execute, /execute_batch, ...).
+    Resolves the agent the same way for every endpoint.
+    With binary=True the reply may be msgpack, so bytes values stay raw.
+    """
+    agent_id, agent, error = await resolve_agent(agent_id, payload)
+    if error:
+        return error
     
-    agent = agents[agent_id]
     callback_url = agent["callback_url"]
     token = agent.get("token")
+    headers = auth_headers(agent)
+    binary = use_binary(binary)
+    if binary:
+        headers["Accept"] = f"{MSGPACK_TYPE}, application/json"
     
-    headers = {}
-    if token:
-        headers["Authorization"] = f"Bearer {token}"
-    
+    health_monitor.begin(agent_id)
     try:
-        async with httpx.AsyncClient(timeout=config.get("connection_timeout", 30)) as client:
-            response = await client.post(
-                f"{callback_url}/execute",
-                json={"command": command, "params": params},
-                headers=headers
-            )
-            agent_storage.update_status(agent_id, "connected")
-            return response.json()
+        # Prefer the persistent WebSocket channel; fall back to plain HTTP
+        channel = await channel_pool.get(agent_id, callback_url, token)
+        if channel is not None:
+            try:
+                result = await channel.request(
+                    path, payload, timeout or config.get("connection_timeout", 30), binary=binary
+                )
+                agent_storage.update_status(agent_id, "connected")
+                health_monitor.mark(agent_id, True)
+                return result
+            except ChannelSendError:
+                pass  # Nothing was sent - safe to retry over HTTP
+        
+        client = client_pool.get(agent_id, callback_url)
+        extra = {"timeout": timeout} if timeout else {}
+        if has_bytes(payload):
+            if HAS_MSGPACK:
+                headers["Content-Type"] = MSGPACK_TYPE
+                extra["content"] = msgpack.packb(payload, use_bin_type=True)
+            else:
+                extra["json"] = base64_bytes(payload)
+        else:
+            extra["json"] = payload
+        response = await client.post(path, headers=headers, **extra)
+        agent_storage.update_status(agent_id, "connected")
+        health_monitor.mark(agent_id, True)
+        return decode_response(response)
     except httpx.ConnectError:
         agent_storage.update_status(agent_id, "disconnected")
+        health_monitor.mark(agent_id, False)
         return {
             "error": f"Cannot connect to agent '{agent_id}' at {callback_url}",
             "hint": "Make sure local_agent.py is running on your PC"
         }
+    except asyncio.TimeoutError:
+        return {"error": f"Timed out waiting for agent '{agent_id}'"}
     except Exception as e:
         return {"error": str(e)}
+    finally:
+        health_monitor.end(agent_id)
+
+def image_response(result: dict, image_format: str = "png"):
+    """
+    Turn an agent result carrying an "image" into MCP image content.
+    Raw bytes (msgpack path) pass straight through; base64 (JSON path) is decoded.
+    Any other fields are returned alongside as JSON.
+    """
+    image = result.get("image") if isinstance(result, dict) else None
+    if image is None:
+        return result
+    data = image if isinstance(image, bytes) else base64.b64decode(image)
+    content = Image(data=data, format=image_format)
+    meta = {k: v for k, v in result.items() if k != "image"}
+    return [content, meta] if meta else content
+
+# job_id -> agent running it, for streamed jobs this relay has open (shell_cancel routing)
+stream_jobs: Dict[str, str] = {}
+
+async def relay_stream(agent_id: Optional[str], command: str, params: dict,
+                       timeout: float, ctx: Context = None) -> dict:
+    """
+    Run a shell command (or file_grep) through the agent's /execute_stream
+    endpoint. Output chunks and matches are forwarded as MCP progress
+    notifications as they arrive; the collected output is returned when
+    the command ends.
+    """
+    payload = {"command": command, "params": params}
+    agent_id, agent, error = await resolve_agent(agent_id, payload)
+    if error:
+        return error
+    
+    out = {"stdout": [], "stderr": []}
+    files = []
+    result = {"agent_id": agent_id}
+    received = 0
+    health_monitor.begin(agent_id)
+    try:
+        client = client_pool.get(agent_id, agent["callback_url"])
+        async with client.stream(
+            "POST", "/execute_stream", json=payload, headers=auth_headers(agent),
+            timeout=httpx.Timeout(timeout + 10, connect=10)
+        ) as response:
+            if response.status_code != 200:
+                await response.aread()
+                return response.json()
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if "stream" in event:
+                    out[event["stream"]].append(event["data"])
+                    received += len(event["data"])
+                    if ctx:
+                        await ctx.report_progress(received, None, event["data"][-1000:])
+                elif isinstance(event.get("matches"), list):
+                    files.append(event)
+                    received += len(event["matches"])
+                    if ctx:
+                        first = event["matches"][0]
+                        await ctx.report_progress(received, None, f"{event['path']}:{first['line']}: {first['text'][:200]}")
+                elif event.get("event") == "started":
+                    if "job_id" in event:
+                        result["job_id"] = event["job_id"]
+                        stream_jobs[event["job_id"]] = agent_id
+                    if ctx:
+                        await ctx.report_progress(0, None, f"started job {event.get('job_id', command)} on agent {agent_id}")
+                elif event.get("event") in ("exit", "error"):
+                    result.update({k: v for k, v in event.items() if k != "event"})
+        health_monitor.mark(agent_id, True)
+    except httpx.ConnectError:
+        health_monitor.mark(agent_id, False)
+        return {"error": f"Cannot connect to agent '{agent_id}' at {agent['callback_url']}"}
+    except Exception as e:
+        result["error"] = str(e)
+    finally:
+        health_monitor.end(agent_id)
+        stream_jobs.pop(result.get("job_id"), None)
+    
+    if command == "file_grep":
+        result["files"] = files
+        return result
+    result["stdout"] = "".join(out["stdout"])
+    result["stderr"] = "".join(out["stderr"])
+    return result
 
 # ============================================
 # PC CONTROL TOOLS (Same as before, but using persistent storage)
 # ============================================
 
+# agent_id ("" = routed) -> last full screenshot result, served again when the agent says it is unchanged
+screenshot_cache: Dict[str, dict] = {}
+
+async def fetch_screenshot(agent_id: Optional[str], params: dict) -> dict:
+    """
+    Screenshot through the agent, revalidating the cached copy: the cached
+    etag goes along as if_none_match, and if the screen (and options) are
+    the same the agent skips encoding and the cached image is returned.
+    """
+    key = agent_id or ""
+    cached = screenshot_cache.get(key)
+    if cached:
+        params = {**params, "if_none_match": cached["etag"]}
+    result = await relay_command(agent_id, "screenshot", params, binary=True)
+    if not isinstance(result, dict):
+        return result
+    if result.get("unchanged") and cached:
+        return {**cached, "unchanged": True, "capture_ms": result.get("capture_ms"),
+                "hash_ms": result.get("hash_ms"), "encode_ms": 0}
+    if "etag" in result and "image" in result:
+        screenshot_cache[key] = result
+    return result
+
+@mcp.tool
+async def screenshot(format: str = "png", quality: int = None, scale: float = None, max_dimension: int = None,
+                     region: list[int] = None, grayscale: bool = False, agent_id: str = None):
+    """
+    Take a screenshot of the PC desktop.
+    
+    Args:
+        format: "png" (lossless), "jpeg" (smallest, fastest) or "webp"
+        quality: 1-100 for jpeg/webp (default 75; 100 = lossless webp)
+        scale: Shrink factor, e.g. 0.5 for half size
+        max_dimension: Shrink so the longer side is at most this many pixels
+        region: Only capture [x, y, width, height]
+        grayscale: Drop colour
+    
+    The result includes "scale" and "offset": screen_x = offset[0] + image_x / scale
+    (same for y), so clicks on a scaled or cropped image map back to the screen.
+    "unchanged": true means the screen is identical to the previous screenshot.
+    """
+    params = {"format": format, "quality": quality, "scale": scale, "max_dimension": max_dimension,
+              "region": region, "grayscale": grayscale}
+    result = await fetch_screenshot(agent_id, {k: v for k, v in params.items() if v is not None})
+    return image_response(result, result.get("format", "png") if isinstance(result, dict) else "png")
+
+# (agent_id, session) -> id of the last frame handed to the client, so deltas always build on it
+delta_frames: Dict[tuple, str] = {}
+
+def delta_params(agent_id: Optional[str], session: Optional[str], keyframe: bool, ctx: Context = None) -> dict:
+    """session / base_frame / keyframe for a delta capture (a keyframe if the client has no frame yet)."""
+    if session is None:
+        try:
+            session = ctx.session_id if ctx else None
+        except Exception:
+            session = None
+        session = session or "default"
+    base_frame = delta_frames.get((agent_id or "", session))
+    params = {"session": session, "keyframe": keyframe or base_frame is None}
+    if base_frame is not None:
+        params["base_frame"] = base_frame
+    return params
+
+def delta_response(agent_id: Optional[str], result: dict):
+    """Record the new frame id and turn a delta result into image content (one image per tile)."""
+    if not isinstance(result, dict) or "frame" not in result:
+        return result
+    delta_frames[(agent_id or "", result["session"])] = result["frame"]
+    if result.get("keyframe"):
+        return image_response(result, result["format"])
+
+    content = []
+    tiles = []
+    for part in result.pop("tiles", []):
+        data = part.pop("image")
+        content.append(Image(data=data if isinstance(data, bytes) else base64.b64decode(data),
+                             format=result["format"]))
+        tiles.append(part)
+    result["tiles"] = tiles
+    return content + [result]
+
 @mcp.tool
-async def screenshot(agent_id: str = None) -> dict:
-    """Take a screenshot of the PC desktop."""
-    return await relay_command(agent_id, "screenshot", {})
+async def screenshot_delta(keyframe: bool = False, format: str = "png", quality: int = None, scale: float = None,
+                           max_dimension: int = None, grayscale: bool = False, session: str = None,
+                           agent_id: str = None, ctx: Context = None):
+    """
+    Screenshot that only returns the parts of the screen that changed since
+    your previous screenshot_delta call.
+
+    Returns one image per changed rectangle, with "tiles" listing each one's
+    x, y, width and height (in the same order), or one full image with
+    "keyframe": true (first call, keyframe=True, or when most of the screen
+    changed). No images and an empty "tiles" list means nothing changed.
+
+    Args:
+        keyframe: Force a full frame
+        format, quality, scale, max_dimension, grayscale: As for screenshot
+        session: Separate frame history (defaults to this MCP session)
+    """
+    params = {**delta_params(agent_id, session, keyframe, ctx), "format": format, "quality": quality,
+              "scale": scale, "max_dimension": max_dimension, "grayscale": grayscale}
+    result = await relay_command(agent_id, "screenshot_delta", {k: v for k, v in params.items() if v is not None},
+                                 binary=True)
+    return delta_response(agent_id, result)
+
+async def relay_input(agent_id: Optional[str], command: str, params: dict, observe=False, ctx: Context = None):
+    """
+    Relay an input command. With `observe`, the agent waits for the screen
+    to settle afterwards and the capture comes back with the action result
+    (one round trip instead of action + screenshot).
+    """
+    if not observe:
+        return await relay_command(agent_id, command, params)
+    options = dict(observe) if isinstance(observe, dict) else {}
+    if options.get("delta"):
+        options.update(delta_params(agent_id, options.get("session"), options.get("keyframe", False), ctx))
+    result = await relay_command(agent_id, command, {**params, "observe": options or True}, binary=True,
+                                 timeout=config.get("connection_timeout", 30) + options.get("timeout", 3))
+    observed = result.pop("observe", None) if isinstance(result, dict) else None
+    if not isinstance(observed, dict) or "error" in observed:
+        if observed:
+            result["observe"] = observed
+        return result
+    if options.get("delta"):
+        response = delta_response(agent_id, observed)
+    else:
+        response = image_response(observed, observed.get("format", "png"))
+    if not isinstance(response, list):
+        response = [response]
+    meta = response[-1] if isinstance(response[-1], dict) else {}
+    images = response[:-1] if meta else response
+    return images + [{**result, "observe": meta}]
 
 @mcp.tool
-async def click(x: int, y: int, button: str = "left", agent_id: str = None) -> dict:
-    """Click at screen coordinates."""
-    return await relay_command(agent_id, "click", {"x": x, "y": y, "button": button})
+async def click(x: int, y: int, button: str = "left", observe: bool | dict = False,
+                agent_id: str = None, ctx: Context = None):
+    """
+    Click at screen coordinates.
+    
+    observe: After the action, wait for the screen to settle and return a screenshot
+             with the result (one call instead of click + screenshot). True, or options
+             {"quiet_ms": 300, "timeout": 3, "format": "jpeg", "max_dimension": 1280,
+              "region": [x, y, w, h], "delta": true (only changed tiles, as screenshot_delta)}
+    """
+    return await relay_input(agent_id, "click", {"x": x, "y": y, "button": button}, observe, ctx)
 
 @mcp.tool
-async def double_click(x: int, y: int, agent_id: str = None) -> dict:
-    """Double-click at screen coordinates."""
-    return await relay_command(agent_id, "double_click", {"x": x, "y": y})
+async def double_click(x: int, y: int, observe: bool | dict = False, agent_id: str = None, ctx: Context = None):
+    """Double-click at screen coordinates. observe: as for click."""
+    return await relay_input(agent_id, "double_click", {"x": x, "y": y}, observe, ctx)
 
 @mcp.tool
-async def right_click(x: int, y: int, agent_id: str = None) -> dict:
-    """Right-click at screen coordinates."""
-    return await relay_command(agent_id, "right_click", {"x": x, "y": y})
+async def right_click(x: int, y: int, observe: bool | dict = False, agent_id: str = None, ctx: Context = None):
+    """Right-click at screen coordinates. observe: as for click."""
+    return await relay_input(agent_id, "right_click", {"x": x, "y": y}, observe, ctx)
 
 @mcp.tool
-async def type_text(text: str, agent_id: str = None) -> dict:
-    """Type text using keyboard."""
-    return await relay_command(agent_id, "type_text", {"text": text})
+async def type_text(text: str, observe: bool | dict = False, agent_id: str = None, ctx: Context = None):
+    """Type text using keyboard. observe: as for click."""
+    return await relay_input(agent_id, "type_text", {"text": text}, observe, ctx)
 
 @mcp.tool
-async def press_key(key: str, agent_id: str = None) -> dict:
-    """Press a keyboard key."""
-    return await relay_command(agent_id, "press_key", {"key": key})
+async def press_key(key: str, observe: bool | dict = False, agent_id: str = None, ctx: Context = None):
+    """Press a keyboard key. observe: as for click."""
+    return await relay_input(agent_id, "press_key", {"key": key}, observe, ctx)
 
 @mcp.tool
-async def hotkey(keys: str, agent_id: str = None) -> dict:
-    """Press a keyboard shortcut (e.g., 'ctrl,c' for copy)."""
-    return await relay_command(agent_id, "hotkey", {"keys": keys})
+async def hotkey(keys: str, observe: bool | dict = False, agent_id: str = None, ctx: Context = None):
+    """Press a keyboard shortcut (e.g., 'ctrl,c' for copy). observe: as for click."""
+    return await relay_input(agent_id, "hotkey", {"keys": keys}, observe, ctx)
 
 @mcp.tool
-async def scroll(direction: str, amount: int = 3, agent_id: str = None) -> dict:
-    """Scroll the screen."""
-    return await relay_command(agent_id, "scroll", {"direction": direction, "amount": amount})
+async def scroll(direction: str, amount: int = 3, observe: bool | dict = False,
+                 agent_id: str = None, ctx: Context = None):
+    """Scroll the screen. observe: as for click."""
+    return await relay_input(agent_id, "scroll", {"direction": direction, "amount": amount}, observe, ctx)
 
 @mcp.tool
-async def move_mouse(x: int, y: int, agent_id: str = None) -> dict:
-    """Move mouse to coordinates without clicking."""
-    return await relay_command(agent_id, "move_mouse", {"x": x, "y": y})
+async def move_mouse(x: int, y: int, observe: bool | dict = False, agent_id: str = None, ctx: Context = None):
+    """Move mouse to coordinates without clicking (observe: e.g. to see a hover tooltip; as for click)."""
+    return await relay_input(agent_id, "move_mouse", {"x": x, "y": y}, observe, ctx)
 
 @mcp.tool
-async def drag(start_x: int, start_y: int, end_x: int, end_y: int, agent_id: str = None) -> dict:
-    """Drag from one point to another."""
-    return await relay_command(agent_id, "drag", {
+async def drag(start_x: int, start_y: int, end_x: int, end_y: int, observe: bool | dict = False,
+               agent_id: str = None, ctx: Context = None):
+    """Drag from one point to another. observe: as for click."""
+    return await relay_input(agent_id, "drag", {
         "start_x": start_x, "start_y": start_y,
         "end_x": end_x, "end_y": end_y
-    })
+    }, observe, ctx)
 
 @mcp.tool
 async def get_desktop_state(agent_id: str = None) -> dict:
@@ -452,19 +1276,75 @@ async def app_list(agent_id: str = None) -> dict:
     return await relay_command(agent_id, "app_list", {})
 
 @mcp.tool
-async def run_powershell(command: str, agent_id: str = None) -> dict:
-    """Execute a PowerShell command."""
-    return await relay_command(agent_id, "run_powershell", {"command": command})
+async def run_powershell(command: str, timeout: float = 30, session: str = None, stream: bool = False,
+                         max_output: int = 10 * 1024 * 1024, agent_id: str = None, ctx: Context = None) -> dict:
+    """
+    Execute a PowerShell command in a warm PowerShell session.
+    Pass `session` (any name) to keep cwd/variables between calls.
+    Use stream=True for long-running commands: output arrives as progress
+    updates (the first names the job id and its agent), `timeout` and
+    `max_output` (bytes) apply, and the job can be stopped with shell_cancel(job_id).
+    """
+    if stream:
+        params = {"command": command, "timeout": timeout, "max_output": max_output}
+        return await relay_stream(agent_id, "run_powershell", params, timeout, ctx)
+    params = {"command": command, "timeout": timeout, "session": session}
+    return await relay_command(agent_id, "run_powershell", params, timeout=timeout + 10)
 
 @mcp.tool
-async def run_cmd(command: str, agent_id: str = None) -> dict:
-    """Execute a CMD command."""
-    return await relay_command(agent_id, "run_cmd", {"command": command})
+async def run_cmd(command: str, timeout: float = 30, session: str = None, stream: bool = False,
+                  max_output: int = 10 * 1024 * 1024, agent_id: str = None, ctx: Context = None) -> dict:
+    """
+    Execute a CMD command in a warm CMD session.
+    Pass `session` (any name) to keep the working directory between calls.
+    Use stream=True for long-running commands (see run_powershell).
+    """
+    if stream:
+        params = {"command": command, "timeout": timeout, "max_output": max_output}
+        return await relay_stream(agent_id, "run_cmd", params, timeout, ctx)
+    params = {"command": command, "timeout": timeout, "session": session}
+    return await relay_command(agent_id, "run_cmd", params, timeout=timeout + 10)
+
+@mcp.tool
+async def shell_cancel(job_id: str, agent_id: str = None) -> dict:
+    """
+    Cancel a streaming shell command by its job id. Jobs streamed through
+    this relay are found on their agent; otherwise pass `agent_id` (reported
+    in the job's "started" progress update).
+    """
+    if not agent_id:
+        agent_id = stream_jobs.get(job_id)
+        if agent_id is None:
+            return {"error": f"Job '{job_id}' is not streaming through this relay; pass agent_id"}
+    return await relay_command(agent_id, "shell_cancel", {"job_id": job_id})
 
 @mcp.tool
-async def file_read(path: str, agent_id: str = None) -> dict:
-    """Read contents of a file."""
-    return await relay_command(agent_id, "file_read", {"path": path})
+async def file_read(path: str, offset: int = None, length: int = None, lines: list[int] = None,
+                    tail: int = None, binary: bool = False, encoding: str = "utf-8",
+                    max_bytes: int = None, agent_id: str = None) -> dict:
+    """
+    Read a file, or part of one.
+    
+    Args:
+        path: File path on the agent
+        offset, length: Byte range to read
+        lines: [start, end] 1-based inclusive line range (end may be omitted)
+        tail: Return the last N lines
+        binary: Return raw bytes (base64 "data") instead of decoded text;
+                binary files are detected automatically
+        encoding: Text encoding (default utf-8)
+        max_bytes: Cap on bytes returned (the agent caps each call at 4 MB)
+    
+    The result includes size, mtime, next_offset and eof; pass
+    offset=next_offset to page through large files.
+    """
+    params = {"path": path, "offset": offset, "length": length, "lines": lines,
+              "tail": tail, "binary": binary, "encoding": encoding, "max_bytes": max_bytes}
+    result = await relay_command(agent_id, "file_read", {k: v for k, v in params.items() if v is not None},
+                                 binary=True)
+    if isinstance(result.get("data"), bytes):
+        result["data"] = base64.b64encode(result["data"]).decode()
+    return result
 
 @mcp.tool
 async def file_write(path: str, content: str, agent_id: str = None) -> dict:
@@ -472,9 +1352,113 @@ async def file_write(path: str, content: str, agent_id: str = None) -> dict:
     return await relay_command(agent_id, "file_write", {"path": path, "content": content})
 
 @mcp.tool
-async def file_list(directory: str, agent_id: str = None) -> dict:
-    """List files in a directory."""
-    return await relay_command(agent_id, "file_list", {"directory": directory})
+async def file_patch(path: str, diff: str = None, edits: list[dict] = None, expected_sha256: str = None,
+                     dry_run: bool = False, agent_id: str = None) -> dict:
+    """
+    Edit a text file in place by sending only the change.
+    
+    Args:
+        path: File path on the agent
+        diff: Unified diff for this file (hunks are located even if lines moved)
+        edits: Instead of a diff, a list of
+               {"start_line": a, "end_line": b, "content": "..."} (replace lines a..b,
+               numbered as in the unpatched file; end_line = a - 1 inserts) or
+               {"old": "...", "new": "..."} (replace one exact, unique occurrence)
+        expected_sha256: Only patch if the file still has this hash
+                         (file_read returns it); on mismatch nothing is written
+        dry_run: Check that the patch applies without writing
+    
+    Returns the new sha256 (use it for the next patch), size and line counts.
+    """
+    params = {"path": path, "diff": diff, "edits": edits, "expected_sha256": expected_sha256, "dry_run": dry_run}
+    return await relay_command(agent_id, "file_patch", {k: v for k, v in params.items() if v is not None})
+
+@mcp.tool
+async def file_search(query: str, mode: str = "name", root: str = None, limit: int = 50,
+                      agent_id: str = None) -> dict:
+    """
+    Find files on an agent from its background index (milliseconds, no disk walk).
+    
+    Args:
+        query: Name substring or glob ("*.pdf") for mode="name";
+               text to look for in mode="content"
+        mode: "name" or "content" (content needs a root indexed with content=True)
+        root: Limit to one indexed root
+        limit: Max results (default 50)
+    
+    Use file_index to add roots first.
+    """
+    params = {"query": query, "mode": mode, "root": root, "limit": limit}
+    return await relay_command(agent_id, "file_search", {k: v for k, v in params.items() if v is not None})
+
+@mcp.tool
+async def file_grep(directory: str, pattern: str, regex: bool = True, ignore_case: bool = False,
+                    include: list[str] = None, exclude: list[str] = None, max_matches: int = 1000,
+                    max_bytes: int = None, context: int = 0, timeout: float = 300,
+                    agent_id: str = None, ctx: Context = None) -> dict:
+    """
+    Search file contents under a directory on an agent (parallel, native;
+    faster than findstr / Select-String). Matches stream in as progress
+    notifications while the search runs.
+
+    Args:
+        directory: Directory to search recursively
+        pattern: Regular expression (or plain text with regex=False)
+        ignore_case: Case-insensitive match
+        include: Only files matching these globs (e.g. ["*.py", "src/*.cs"])
+        exclude: Skip files/folders matching these globs
+                 (default skips .git, node_modules, __pycache__ ...; [] searches everything)
+        max_matches: Stop after this many matching lines
+        max_bytes: Stop after reading this many bytes in total (default 1 GB)
+        context: Lines of context before/after each match (max 10)
+        timeout: Stop searching after this many seconds
+
+    Binary files are skipped. Returns {"files": [{"path", "matches": [{"line", "column", "text"}]}],
+    files_searched, matches, truncated, duration}.
+    """
+    params = {"directory": directory, "pattern": pattern, "regex": regex, "ignore_case": ignore_case,
+              "include": include, "exclude": exclude, "max_matches": max_matches,
+              "max_bytes": max_bytes, "context": context, "timeout": timeout}
+    return await relay_stream(agent_id, "file_grep", {k: v for k, v in params.items() if v is not None},
+                              timeout, ctx)
+
+@mcp.tool
+async def file_index(action: str = "status", root: str = None, content: bool = False,
+                     agent_id: str = None) -> dict:
+    """
+    Manage an agent's background file index.
+    
+    Args:
+        action: "status", "add", "remove" or "rescan" (queued; watch "scanning" in status)
+        root: Directory to add/remove/rescan
+        content: With "add", also index text contents for mode="content" searches
+    """
+    return await relay_command(agent_id, "file_index", {"action": action, "root": root, "content": content})
+
+@mcp.tool
+async def file_list(directory: str, depth: int = 0, pattern: str = None, extensions: list[str] = None,
+                    entry_type: str = None, include_hidden: bool = True, sort: str = "name",
+                    reverse: bool = False, limit: int = 1000, cursor: str = None,
+                    agent_id: str = None) -> dict:
+    """
+    List a directory with each entry's type, size and mtime.
+    
+    Args:
+        directory: Directory path on the agent
+        depth: Levels of subdirectories to include (0 = this directory only, -1 = all)
+        pattern: Glob on entry names (e.g. "*.log")
+        extensions: Only these extensions (e.g. [".py", ".txt"])
+        entry_type: Only "file", "dir" or "link" entries
+        include_hidden: Include dotfiles / hidden files
+        sort: "name", "path", "size" or "mtime"
+        reverse: Sort descending (e.g. largest or newest first)
+        limit: Entries per page (max 10000)
+        cursor: next_cursor from the previous page
+    """
+    params = {"directory": directory, "depth": depth, "pattern": pattern, "extensions": extensions,
+              "entry_type": entry_type, "include_hidden": include_hidden, "sort": sort,
+              "reverse": reverse, "limit": limit, "cursor": cursor}
+    return await relay_command(agent_id, "file_list", {k: v for k, v in params.items() if v is not None})
 
 @mcp.tool
 async def clipboard_copy(text: str, agent_id: str = None) -> dict:
@@ -486,6 +1470,363 @@ async def clipboard_paste(agent_id: str = None) -> dict:
     """Get clipboard contents."""
     return await relay_command(agent_id, "clipboard_paste", {})
 
+# ============================================
+# FILE TRANSFER (chunked, resumable, verified)
+# ============================================
+
+def read_chunk(path: str, offset: int, size: int) -> tuple:
+    """(data, sha256) for one chunk of a relay-side file."""
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read(size)
+    return data, hashlib.sha256(data).hexdigest()
+
+def write_chunk(path: str, offset: int, data: bytes, sha256: str) -> bool:
+    """Verify a downloaded chunk and write it at its offset. False on checksum mismatch."""
+    if hashlib.sha256(data).hexdigest() != sha256:
+        return False
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        f.write(data)
+    return True
+
+def open_download_part(part: str, meta: dict) -> set:
+    """
+    Chunks already downloaded into `part` for this exact file version,
+    or an empty set after (re)creating a preallocated part file.
+    """
+    try:
+        with open(part + ".json", encoding="utf-8") as f:
+            saved = json.load(f)
+        if all(saved.get(k) == meta[k] for k in ("sha256", "size", "chunk_size")) \
+                and os.path.getsize(part) == meta["size"]:
+            return set(saved.get("received", []))
+    except (OSError, ValueError):
+        pass
+    os.makedirs(os.path.dirname(os.path.abspath(part)), exist_ok=True)
+    with open(part, "wb") as f:
+        f.truncate(meta["size"])
+    return set()
+
+def save_download_part(part: str, meta: dict, received: set):
+    tmp = part + ".json.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"sha256": meta["sha256"], "size": meta["size"], "chunk_size": meta["chunk_size"],
+                   "received": sorted(received)}, f)
+    os.replace(tmp, part + ".json")
+
+async def transfer_chunks(indices: list, transfer_one, total: int, concurrency: int,
+                          ctx: Context = None) -> dict:
+    """
+    Run `transfer_one(index)` (returns an error string or None) for every
+    chunk, `concurrency` at a time, retrying each a few times.
+    Returns {index: last_error} for chunks that never succeeded.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    retries = max(1, config.get("transfer_retries", 3))
+    failed = {}
+    done = total - len(indices)
+    
+    async def run(index):
+        nonlocal done
+        async with semaphore:
+            for _ in range(retries):
+                try:
+                    error = await transfer_one(index)
+                except Exception as e:
+                    error = str(e)
+                if not error:
+                    break
+            else:
+                failed[index] = error
+                return
+        done += 1
+        if ctx:
+            await ctx.report_progress(done, total, f"chunk {index + 1}/{total}")
+    
+    await asyncio.gather(*(run(i) for i in indices))
+    return failed
+
+@mcp.tool
+async def file_upload(source: str, destination: str, chunk_size: int = None, concurrency: int = None,
+                      agent_id: str = None, ctx: Context = None) -> dict:
+    """
+    Upload a file from the relay machine to an agent in verified chunks.
+    
+    Chunks are sent in parallel and checked with SHA-256, then the whole
+    file is checked before it replaces `destination`. Re-running the same
+    upload after a failure resumes from the chunks already on the agent.
+    
+    Args:
+        source: Path of the file on the relay machine
+        destination: Path to write on the agent
+        chunk_size: Bytes per chunk (default 4 MB)
+        concurrency: Chunks in flight at once (default 4)
+        agent_id: Target agent
+    """
+    if not os.path.isfile(source):
+        return {"error": f"Local file not found: {source}"}
+    # Pin one agent for the whole transfer
+    agent_id, _, error = await resolve_agent(agent_id, {"command": "upload_begin"})
+    if error:
+        return error
+    return await upload_file(agent_id, source, destination, chunk_size, concurrency, ctx)
+
+async def upload_file(agent_id: str, source: str, destination: str, chunk_size: int = None,
+                      concurrency: int = None, ctx: Context = None, mtime: float = None) -> dict:
+    """Chunked upload to one (already resolved) agent; see file_upload."""
+    start = time.monotonic()
+    size = os.path.getsize(source)
+    digest = await asyncio.to_thread(sha256_file, source)
+    begin = await relay_command(agent_id, "upload_begin", {
+        "path": destination, "size": size, "sha256": digest, "mtime": mtime,
+        "chunk_size": chunk_size or config.get("transfer_chunk_size"),
+    })
+    if "error" in begin:
+        return begin
+    upload_id, chunk_size, chunks = begin["upload_id"], begin["chunk_size"], begin["chunks"]
+    pending = sorted(set(range(chunks)) - set(begin["received"]))
+    
+    async def send(index: int) -> Optional[str]:
+        data, chunk_hash = await asyncio.to_thread(read_chunk, source, index * chunk_size, chunk_size)
+        result = await relay_command(agent_id, "upload_chunk", {
+            "upload_id": upload_id, "index": index, "sha256": chunk_hash, "data": data,
+        }, timeout=120)
+        return result.get("error")
+    
+    failed = await transfer_chunks(pending, send, chunks,
+                                   concurrency or config.get("transfer_concurrency", 4), ctx)
+    if failed:
+        return {"error": f"{len(failed)} chunks failed; run file_upload again to resume",
+                "agent_id": agent_id, "failed": dict(list(failed.items())[:10])}
+    
+    result = await relay_command(agent_id, "upload_finish", {"upload_id": upload_id}, timeout=300)
+    if "error" not in result:
+        result.update({
+            "agent_id": agent_id,
+            "chunks": chunks,
+            "resumed_chunks": chunks - len(pending),
+            "bytes_sent": min(len(pending) * chunk_size, size),
+            "duration": round(time.monotonic() - start, 3),
+        })
+    return result
+
+@mcp.tool
+async def file_download(path: str, destination: str, chunk_size: int = None, concurrency: int = None,
+                        agent_id: str = None, ctx: Context = None) -> dict:
+    """
+    Download a file from an agent to the relay machine in verified chunks.
+    
+    Chunks are fetched in parallel as raw bytes and checked with SHA-256,
+    then the whole file is checked before it replaces `destination`.
+    Re-running the same download resumes from the chunks already saved.
+    
+    Args:
+        path: Path of the file on the agent
+        destination: Path to write on the relay machine
+        chunk_size: Bytes per chunk (default 4 MB)
+        concurrency: Chunks in flight at once (default 4)
+        agent_id: Target agent
+    """
+    agent_id, _, error = await resolve_agent(agent_id, {"command": "download_begin"})
+    if error:
+        return error
+    
+    start = time.monotonic()
+    meta = await relay_command(agent_id, "download_begin", {
+        "path": path, "chunk_size": chunk_size or config.get("transfer_chunk_size"),
+    }, timeout=300)
+    if "error" in meta:
+        return meta
+    chunk_size, chunks = meta["chunk_size"], meta["chunks"]
+    part = destination + PART_SUFFIX
+    received = await asyncio.to_thread(open_download_part, part, meta)
+    pending = sorted(set(range(chunks)) - received)
+    
+    async def fetch(index: int) -> Optional[str]:
+        result = await relay_command(agent_id, "download_chunk", {
+            "path": path, "index": index, "chunk_size": chunk_size, "mtime": meta["mtime"],
+        }, binary=True, timeout=120)
+        if "error" in result:
+            return result["error"]
+        data = result["data"] if isinstance(result["data"], bytes) else base64.b64decode(result["data"])
+        if not await asyncio.to_thread(write_chunk, part, index * chunk_size, data, result["sha256"]):
+            return f"Checksum mismatch on chunk {index}"
+        received.add(index)
+        save_download_part(part, meta, received)
+        return None
+    
+    failed = await transfer_chunks(pending, fetch, chunks,
+                                   concurrency or config.get("transfer_concurrency", 4), ctx)
+    if failed:
+        return {"error": f"{len(failed)} chunks failed; run file_download again to resume",
+                "agent_id": agent_id, "failed": dict(list(failed.items())[:10])}
+    
+    actual = await asyncio.to_thread(sha256_file, part)
+    if actual != meta["sha256"]:
+        os.remove(part + ".json")
+        return {"error": "Whole-file checksum mismatch", "expected": meta["sha256"], "actual": actual}
+    os.replace(part, destination)
+    os.remove(part + ".json")
+    return {
+        "status": "downloaded",
+        "agent_id": agent_id,
+        "path": destination,
+        "size": meta["size"],
+        "sha256": actual,
+        "chunks": chunks,
+        "resumed_chunks": chunks - len(pending),
+        "duration": round(time.monotonic() - start, 3),
+    }
+
+# Files up to this size are delta-encoded in memory; larger ones are sent whole. compute_delta
+# rolls byte by byte in Python (~1s of CPU for a fully rewritten 4 MB file), and the agent
+# skips block signatures above this size
+SYNC_DELTA_MAX = 4 * 1024 * 1024
+# Literal bytes per /execute_batch request of sync_apply items
+SYNC_BATCH_BYTES = 8 * 1024 * 1024
+SYNC_BATCH_ITEMS = 200
+
+def read_file_bytes(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+async def sync_to_agent(agent_id: str, source: str, destination: str, files: dict, delete: bool,
+                        checksum: bool, exclude: list, block_size: int, ctx: Context = None) -> dict:
+    """Delta-sync an already scanned source tree to one agent; see sync_directory."""
+    start = time.monotonic()
+    plan = await relay_command(agent_id, "sync_plan", {
+        "directory": destination, "files": files, "block_size": block_size,
+        "checksum": checksum, "exclude": exclude, "delta_max": SYNC_DELTA_MAX,
+    }, binary=True, timeout=300)
+    if "error" in plan:
+        return plan
+    
+    stats = {"agent_id": agent_id, "files": len(files), "unchanged": 0, "created": 0, "updated": 0,
+             "deleted": 0, "bytes_total": sum(size for size, _ in files.values()), "bytes_sent": 0}
+    failed = {}
+    batch = []  # (rel, status, item)
+    batch_bytes = 0
+    large = []
+    
+    async def flush():
+        nonlocal batch, batch_bytes
+        if not batch:
+            return
+        response = await relay_request(agent_id, "/execute_batch", {
+            "items": [item for _, _, item in batch], "mode": "continue",
+        }, timeout=300)
+        results = response.get("results") or [{"ok": False, "result": response}] * len(batch)
+        for (rel, status, _), outcome in zip(batch, results):
+            if outcome.get("ok"):
+                stats[status] += 1
+            else:
+                failed[rel] = (outcome.get("result") or {}).get("error", "skipped")
+        done = stats["created"] + stats["updated"] + len(failed)
+        if ctx:
+            await ctx.report_progress(done, len(files) - stats["unchanged"], f"synced {done} files")
+        batch, batch_bytes = [], 0
+    
+    for rel, entry in plan["files"].items():
+        size, mtime = files[rel]
+        if entry["status"] == "same":
+            stats["unchanged"] += 1
+            continue
+        status = "created" if entry["status"] == "missing" else "updated"
+        src = file_sync.local_path(source, rel)
+        delta = None
+        if entry["status"] == "changed" and size <= SYNC_DELTA_MAX and "signatures" in entry:
+            # Give up on the delta once more than half the file is literal
+            delta = await asyncio.to_thread(
+                file_sync.compute_delta, src, entry["signatures"], entry["size"], block_size,
+                max(64 * 1024, size // 2)
+            )
+        if delta is None:
+            if size > SYNC_BATCH_BYTES:
+                large.append((rel, status, mtime))
+                continue
+            data = await asyncio.to_thread(read_file_bytes, src)
+            delta = {"ops": [data] if data else [], "literal_bytes": len(data), "size": len(data),
+                     "sha256": hashlib.sha256(data).hexdigest()}
+        stats["bytes_sent"] += delta["literal_bytes"]
+        batch.append((rel, status, {"command": "sync_apply", "params": {
+            "directory": destination, "path": rel, "ops": delta["ops"], "size": delta["size"],
+            "sha256": delta["sha256"], "mtime": mtime, "block_size": block_size,
+        }}))
+        batch_bytes += delta["literal_bytes"]
+        if batch_bytes >= SYNC_BATCH_BYTES or len(batch) >= SYNC_BATCH_ITEMS:
+            await flush()
+    await flush()
+    
+    # Big new/rewritten files: resumable chunked upload
+    for rel, status, mtime in large:
+        result = await upload_file(agent_id, file_sync.local_path(source, rel),
+                                   destination.rstrip("/\\") + "/" + rel, ctx=ctx, mtime=mtime)
+        if "error" in result:
+            failed[rel] = result["error"]
+        else:
+            stats[status] += 1
+            stats["bytes_sent"] += result["bytes_sent"]
+    
+    if delete and plan.get("extra"):
+        removed = await relay_command(agent_id, "sync_delete", {"directory": destination, "paths": plan["extra"]})
+        stats["deleted"] = len(removed.get("deleted", []))
+        failed.update(removed.get("errors", {}))
+    elif plan.get("extra"):
+        stats["extra"] = plan["extra"][:100]
+    
+    stats["bytes_saved"] = stats["bytes_total"] - stats["bytes_sent"]
+    stats["duration"] = round(time.monotonic() - start, 3)
+    if failed:
+        stats["failed"] = dict(list(failed.items())[:50])
+    return stats
+
+@mcp.tool
+async def sync_directory(source: str, destination: str, delete: bool = False, checksum: bool = False,
+                         exclude: list[str] = None, block_size: int = None,
+                         agent_id: str = None, agents: list[str] | str = None, ctx: Context = None) -> dict:
+    """
+    Push a directory tree from the relay machine to an agent, rsync-style.
+    
+    Files with the same size and mtime are skipped. Changed files are
+    compared block by block (rolling checksums), so only the changed bytes
+    are sent. Each file is checked with SHA-256 and replaced atomically.
+    
+    Args:
+        source: Directory on the relay machine
+        destination: Directory on the agent
+        delete: Remove agent files that are not in the source
+        checksum: Compare contents even when size and mtime match
+        exclude: Glob patterns to skip (e.g. [".git", "*.pyc"])
+        block_size: Delta block size in bytes (default 4096)
+        agent_id: Target agent
+        agents: Sync to several agents instead ("all", "tag:<name>" or a list of ids)
+    
+    Reports created/updated/unchanged/deleted counts and bytes sent vs. saved.
+    """
+    if not os.path.isdir(source):
+        return {"error": f"Local directory not found: {source}"}
+    block_size = block_size or file_sync.DEFAULT_BLOCK_SIZE
+    files = await asyncio.to_thread(file_sync.scan_tree, source, exclude)
+    
+    if agents is None:
+        agent_id, _, error = await resolve_agent(agent_id, {"command": "sync_plan"})
+        if error:
+            return error
+        return await sync_to_agent(agent_id, source, destination, files, delete, checksum,
+                                   exclude, block_size, ctx)
+    
+    targets = select_agents(agents)
+    if not targets:
+        return {"error": f"No agents match {agents!r}", "registered_agents": list(agent_storage.get_all().keys())}
+    results = await asyncio.gather(*(
+        sync_to_agent(aid, source, destination, files, delete, checksum, exclude, block_size)
+        for aid in targets
+    ), return_exceptions=True)
+    return {"results": {
+        aid: ({"error": str(r)} if isinstance(r, Exception) else r) for aid, r in zip(targets, results)
+    }}
+
 # ============================================
 # BROWSER TOOLS (Playwright - Advanced)
 # ============================================
@@ -511,9 +1852,9 @@ async def browser_press(key: str, agent_id: str = None) -> dict:
     return await relay_command(agent_id, "browser_press", {"key": key})
 
 @mcp.tool
-async def browser_screenshot(agent_id: str = None) -> dict:
+async def browser_screenshot(agent_id: str = None):
     """Take a screenshot of the browser page."""
-    return await relay_command(agent_id, "browser_screenshot", {})
+    return image_response(await relay_command(agent_id, "browser_screenshot", {}, binary=True))
 
 @mcp.tool
 async def browser_content(agent_id: str = None) -> dict:
@@ -535,6 +1876,148 @@ async def wait(seconds: float, agent_id: str = None) -> dict:
     """Wait for specified seconds."""
     return await relay_command(agent_id, "wait", {"seconds": seconds})
 
+def wait_screenshot_options(screenshot: bool, format: str, max_dimension: Optional[int]):
+    """The `screenshot` param of the agent's wait commands: False, or the options for the final frame."""
+    if not screenshot:
+        return False
+    return {k: v for k, v in {"format": format, "max_dimension": max_dimension}.items() if v is not None}
+
+@mcp.tool
+async def wait_for_change(region: list[int] = None, threshold: float = 0.001, timeout: float = 10,
+                          interval_ms: int = 100, screenshot: bool = False, format: str = "jpeg",
+                          max_dimension: int = None, agent_id: str = None):
+    """
+    Wait (on the agent) until the screen changes, e.g. a dialog appears or a
+    page starts loading. Returns as soon as it happens, instead of looping
+    on wait + screenshot.
+
+    Args:
+        region: Only watch [x, y, width, height]
+        threshold: Fraction of the (downsampled) screen that must change;
+                   the default ignores a blinking caret or clock
+        timeout: Give up after this many seconds (max 300)
+        interval_ms: Sampling interval
+        screenshot: Attach the final frame (format / max_dimension as for screenshot)
+
+    Returns changed, changed_ratio, bbox ([x, y, w, h] of the change), elapsed_ms, timed_out.
+    """
+    params = {"region": region, "threshold": threshold, "timeout": timeout, "interval_ms": interval_ms,
+              "screenshot": wait_screenshot_options(screenshot, format, max_dimension)}
+    result = await relay_command(agent_id, "wait_for_change", {k: v for k, v in params.items() if v is not None},
+                                 binary=True, timeout=min(timeout, 300) + 30)
+    return image_response(result, result.get("format", "png") if isinstance(result, dict) else "png")
+
+@mcp.tool
+async def wait_for_stable(region: list[int] = None, quiet_ms: int = 500, threshold: float = 0.001,
+                          timeout: float = 10, interval_ms: int = 100, screenshot: bool = False,
+                          format: str = "jpeg", max_dimension: int = None, agent_id: str = None):
+    """
+    Wait (on the agent) until the screen stops changing, e.g. a page has
+    finished loading or an animation ended.
+
+    Args:
+        region: Only watch [x, y, width, height]
+        quiet_ms: How long nothing may change before the screen counts as stable
+        threshold: Changes smaller than this fraction of the screen are ignored
+        timeout: Give up after this many seconds (max 300)
+        interval_ms: Sampling interval
+        screenshot: Attach the final frame (format / max_dimension as for screenshot)
+
+    Returns stable, elapsed_ms, last_change_ms, timed_out.
+    """
+    params = {"region": region, "quiet_ms": quiet_ms, "threshold": threshold, "timeout": timeout,
+              "interval_ms": interval_ms, "screenshot": wait_screenshot_options(screenshot, format, max_dimension)}
+    result = await relay_command(agent_id, "wait_for_stable", {k: v for k, v in params.items() if v is not None},
+                                 binary=True, timeout=min(timeout, 300) + 30)
+    return image_response(result, result.get("format", "png") if isinstance(result, dict) else "png")
+
+@mcp.tool
+async def batch(actions: list[dict], stop_on_error: bool = True, agent_id: str = None) -> dict:
+    """
+    Run several commands in one round trip.
+    
+    Args:
+        actions: Ordered list of {"command": name, "params": {...}},
+                 e.g. [{"command": "click", "params": {"x": 10, "y": 20}},
+                       {"command": "type_text", "params": {"text": "hi"}},
+                       {"command": "press_key", "params": {"key": "enter"}}]
+        stop_on_error: Stop at the first failing item (otherwise run them all)
+        agent_id: Optional. Agent to run the batch on (an id, or "tag:<name>" to route by tag)
+    
+    Returns:
+        Per-item results in order
+    """
+    return await relay_request(agent_id, "/execute_batch", {
+        "items": actions,
+        "mode": "stop_on_error" if stop_on_error else "continue"
+    })
+
+def select_agents(selector) -> list:
+    """
+    Resolve an agent selector to agent ids:
+    "all", "tag:<name>", a single agent id, or a list of ids.
+    """
+    agents = agent_storage.get_all()
+    if isinstance(selector, (list, tuple)):
+        return [aid for aid in selector if aid in agents]
+    if not selector or selector == "all":
+        return list(agents.keys())
+    if selector.startswith("tag:"):
+        tag = selector[4:]
+        return [aid for aid in agents if tag in health_monitor.tags(aid)]
+    return [selector] if selector in agents else []
+
+@mcp.tool
+async def broadcast(command: str, params: dict = None, agents: list[str] | str = "all",
+                    timeout: float = 30, concurrency: int = None, ctx: Context = None) -> dict:
+    """
+    Run the same command on many agents at once.
+    
+    Args:
+        command: Command name (e.g. "run_powershell", "get_screen_size", "app_list")
+        params: Command parameters
+        agents: "all", "tag:<name>", an agent id, or a list of agent ids
+        timeout: Per-agent timeout in seconds
+        concurrency: Optional. Max agents contacted at once
+    
+    Returns:
+        Map of agent id -> result; agents that time out are listed in "timed_out"
+    """
+    targets = select_agents(agents)
+    if not targets:
+        return {"error": f"No agents match selector {agents!r}", "registered_agents": list(agent_storage.get_all().keys())}
+    
+    semaphore = asyncio.Semaphore(max(1, concurrency or config.get("broadcast_concurrency", 10)))
+    payload = {"command": command, "params": params or {}}
+    
+    async def dispatch(aid):
+        async with semaphore:
+            try:
+                # HTTP timeout a little past the deadline so wait_for decides what "timed out" means
+                request = relay_request(aid, "/execute", payload, timeout=timeout + 1)
+                return aid, await asyncio.wait_for(request, timeout)
+            except asyncio.TimeoutError:
+                return aid, None
+    
+    results, timed_out = {}, []
+    for done in asyncio.as_completed([dispatch(aid) for aid in targets]):
+        aid, result = await done
+        if result is None:
+            timed_out.append(aid)
+        else:
+            results[aid] = result
+        if ctx:
+            await ctx.report_progress(len(results) + len(timed_out), len(targets), aid)
+    
+    failed = [aid for aid, r in results.items() if isinstance(r, dict) and "error" in r]
+    return {
+        "command": command,
+        "results": results,
+        "succeeded": len(results) - len(failed),
+        "failed": failed,
+        "timed_out": timed_out
+    }
+
 # ============================================
 # INFO TOOLS
 # ============================================
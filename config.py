@@ -4,8 +4,13 @@ Bridge MCP - Configuration Management
 Handles persistent configuration and agent storage.
 """
 
+import atexit
 import json
 import os
+import sqlite3
+import tempfile
+import threading
+import time
 from pathlib import Path
 from typing import Dict, Any, Optional
 
@@ -26,38 +31,114 @@ def get_agents_file() -> Path:
     """Get the path to the agents storage file."""
     return get_config_dir() / 'agents.json'
 
+def get_agents_db() -> Path:
+    """Get the path to the SQLite agent registry (optional backend)."""
+    return get_config_dir() / 'agents.db'
+
 def get_config_file() -> Path:
     """Get the path to the main config file."""
     return get_config_dir() / 'config.json'
 
 
 class AgentStorage:
-    """Persistent storage for registered agents."""
+    """
+    Persistent storage for registered agents.
+    
+    Agents are kept in memory and only re-read when agents.json changes on
+    disk (mtime/size). Status updates are coalesced and flushed after a short
+    debounce; every write goes through a temp file + rename so other
+    processes never see a half-written file.
+    """
+    
+    FLUSH_DELAY = 0.5  # seconds to coalesce status writes
     
     def __init__(self):
         self.agents_file = get_agents_file()
         self._agents: Dict[str, Dict[str, Any]] = {}
+        self._signature: Optional[tuple] = None
+        self._pending_status: Dict[str, str] = {}
+        self._flush_timer: Optional[threading.Timer] = None
+        self._lock = threading.RLock()
         self._load()
+        atexit.register(self.flush)
+    
+    def _file_signature(self) -> Optional[tuple]:
+        """(mtime, size) of the agents file, or None if missing."""
+        try:
+            st = self.agents_file.stat()
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
     
     def _load(self):
         """Load agents from file."""
         if self.agents_file.exists():
             try:
+                signature = self._file_signature()
                 with open(self.agents_file, 'r') as f:
                     self._agents = json.load(f)
+                self._signature = signature
             except (json.JSONDecodeError, IOError):
                 self._agents = {}
         else:
             self._agents = {}
             self._save()
+        
+        # Re-apply status updates that haven't been flushed yet
+        for agent_id, status in self._pending_status.items():
+            if agent_id in self._agents:
+                self._agents[agent_id]["status"] = status
+    
+    def _refresh(self):
+        """Reload only if another process changed the file since we last saw it."""
+        if self._file_signature() != self._signature:
+            self._load()
     
     def _save(self):
-        """Save agents to file."""
+        """Save agents to file atomically (temp file + rename)."""
+        tmp_path = None
         try:
-            with open(self.agents_file, 'w') as f:
+            fd, tmp_path = tempfile.mkstemp(
+                dir=str(self.agents_file.parent), prefix='.agents-', suffix='.tmp'
+            )
+            with os.fdopen(fd, 'w') as f:
                 json.dump(self._agents, f, indent=2)
-        except IOError as e:
+            for attempt in range(5):
+                try:
+                    os.replace(tmp_path, self.agents_file)
+                    break
+                except PermissionError:
+                    # Windows: the target may be briefly open in another process
+                    if attempt == 4:
+                        raise
+                    time.sleep(0.05)
+            tmp_path = None
+            self._signature = self._file_signature()
+            # Only now are the pending status updates on disk
+            self._pending_status.clear()
+        except (IOError, OSError) as e:
             print(f"Warning: Could not save agents: {e}")
+        finally:
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    
+    def _schedule_flush(self):
+        """Flush pending status writes after FLUSH_DELAY (debounced)."""
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(self.FLUSH_DELAY, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+    
+    def flush(self):
+        """Write any coalesced status updates to disk now."""
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if not self._pending_status:
+                return
+            self._refresh()
+            self._save()
     
     def register(self, agent_id: str, callback_url: str, agent_name: str = "My PC", token: str = None) -> dict:
         """Register an agent (persists to file)."""
@@ -66,22 +147,26 @@ class AgentStorage:
         import secrets
         import string
         
-        # Generate token if not provided and not existing
-        if not token:
-            existing = self._agents.get(agent_id)
-            if existing and "token" in existing:
-                token = existing["token"]
-            else:
-                alphabet = string.ascii_letters + string.digits
-                token = ''.join(secrets.choice(alphabet) for i in range(32))
-        
-        self._agents[agent_id] = {
-            "callback_url": callback_url,
-            "name": agent_name,
-            "status": "registered",
-            "token": token
-        }
-        self._save()
+        with self._lock:
+            self._refresh()
+            
+            # Generate token if not provided and not existing
+            if not token:
+                existing = self._agents.get(agent_id)
+                if existing and "token" in existing:
+                    token = existing["token"]
+                else:
+                    alphabet = string.ascii_letters + string.digits
+                    token = ''.join(secrets.choice(alphabet) for i in range(32))
+            
+            self._agents[agent_id] = {
+                "callback_url": callback_url,
+                "name": agent_name,
+                "status": "registered",
+                "token": token
+            }
+            self._pending_status.pop(agent_id, None)
+            self._save()
         return {
             "status": "registered",
             "agent_id": agent_id,
@@ -91,47 +176,263 @@ class AgentStorage:
     
     def unregister(self, agent_id: str) -> dict:
         """Remove an agent."""
-        if agent_id in self._agents:
-            del self._agents[agent_id]
-            self._save()
-            return {"status": "removed", "agent_id": agent_id}
+        with self._lock:
+            self._refresh()
+            if agent_id in self._agents:
+                del self._agents[agent_id]
+                self._pending_status.pop(agent_id, None)
+                self._save()
+                return {"status": "removed", "agent_id": agent_id}
         return {"error": f"Agent {agent_id} not found"}
     
     def get(self, agent_id: str) -> Optional[dict]:
         """Get an agent by ID."""
-        self._load()  # Reload to get updates from other processes
-        return self._agents.get(agent_id)
+        with self._lock:
+            self._refresh()  # Pick up updates from other processes
+            agent = self._agents.get(agent_id)
+            return dict(agent) if agent is not None else None
     
     def get_all(self) -> Dict[str, dict]:
         """Get all registered agents."""
-        self._load()  # Reload to get updates from other processes
-        return self._agents.copy()
+        with self._lock:
+            self._refresh()  # Pick up updates from other processes
+            return {aid: dict(info) for aid, info in self._agents.items()}
+    
+    def find(self, status: str = None, name: str = None) -> Dict[str, dict]:
+        """Get agents filtered by status and/or name."""
+        return {
+            aid: info for aid, info in self.get_all().items()
+            if (status is None or info.get("status") == status)
+            and (name is None or info.get("name") == name)
+        }
     
     def get_first(self) -> Optional[tuple]:
         """Get the first available agent."""
-        if self._agents:
-            agent_id = list(self._agents.keys())[0]
-            return agent_id, self._agents[agent_id]
+        with self._lock:
+            self._refresh()
+            if self._agents:
+                agent_id = next(iter(self._agents))
+                return agent_id, dict(self._agents[agent_id])
         return None
     
     def update_status(self, agent_id: str, status: str):
-        """Update agent status (connected/disconnected)."""
-        # Reload from file to get any updates from other processes (e.g., token from local_agent)
-        self._load()
-        if agent_id in self._agents:
-            self._agents[agent_id]["status"] = status
-            self._save()
+        """Update agent status (connected/disconnected). Written lazily."""
+        with self._lock:
+            # Pick up updates from other processes (e.g., token from local_agent)
+            self._refresh()
+            agent = self._agents.get(agent_id)
+            if agent is None or agent.get("status") == status:
+                return
+            agent["status"] = status
+            self._pending_status[agent_id] = status
+            self._schedule_flush()
+    
+    def update_statuses(self, statuses: Dict[str, str]):
+        """Update several agents' status in one write."""
+        with self._lock:
+            self._refresh()
+            changed = False
+            for agent_id, status in statuses.items():
+                agent = self._agents.get(agent_id)
+                if agent is None or agent.get("status") == status:
+                    continue
+                agent["status"] = status
+                self._pending_status[agent_id] = status
+                changed = True
+            if changed:
+                self._save()
     
     def set_default(self, agent_id: str) -> dict:
         """Set an agent as the default."""
-        if agent_id not in self._agents:
-            return {"error": f"Agent {agent_id} not found"}
+        with self._lock:
+            self._refresh()
+            if agent_id not in self._agents:
+                return {"error": f"Agent {agent_id} not found"}
+            
+            # Move to front by recreating dict
+            agent = self._agents.pop(agent_id)
+            self._agents = {agent_id: agent, **self._agents}
+            self._save()
+        return {"status": "default_set", "agent_id": agent_id}
+
+
+class SQLiteAgentStorage:
+    """
+    SQLite (WAL mode) agent registry with the same API as AgentStorage.
+    
+    Suited to large fleets: status changes touch one row, lookups by id,
+    status and name are indexed, several relay processes can read
+    concurrently, and the default agent is a column rather than dict order.
+    Enable with "storage_backend": "sqlite" in config.json.
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS agents (
+            id           TEXT PRIMARY KEY,
+            callback_url TEXT NOT NULL,
+            name         TEXT NOT NULL,
+            status       TEXT NOT NULL DEFAULT 'registered',
+            token        TEXT,
+            is_default   INTEGER NOT NULL DEFAULT 0,
+            updated_at   REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_agents_status ON agents(status);
+        CREATE INDEX IF NOT EXISTS idx_agents_name ON agents(name);
+        CREATE TABLE IF NOT EXISTS meta (
+            key   TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+    
+    def __init__(self, db_path: Path = None):
+        self.agents_file = db_path or get_agents_db()
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.agents_file), timeout=10, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        self._migrate_from_json()
+    
+    def _migrate_from_json(self):
+        """One-time import of an existing agents.json."""
+        with self._lock, self._conn:
+            done = self._conn.execute("SELECT value FROM meta WHERE key = 'migrated_json'").fetchone()
+            if done:
+                return
+            json_file = get_agents_file()
+            if json_file.exists():
+                try:
+                    with open(json_file, 'r') as f:
+                        agents = json.load(f)
+                except (json.JSONDecodeError, IOError):
+                    agents = {}
+                now = time.time()
+                for i, (agent_id, info) in enumerate(agents.items()):
+                    self._conn.execute(
+                        "INSERT OR IGNORE INTO agents (id, callback_url, name, status, token, is_default, updated_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (agent_id, info.get("callback_url", ""), info.get("name", agent_id),
+                         info.get("status", "registered"), info.get("token"), 1 if i == 0 else 0, now)
+                    )
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_json', ?)", (str(time.time()),))
+    
+    @staticmethod
+    def _row_to_agent(row) -> dict:
+        return {
+            "callback_url": row["callback_url"],
+            "name": row["name"],
+            "status": row["status"],
+            "token": row["token"]
+        }
+    
+    def _query(self, where: str = "", args: tuple = ()) -> Dict[str, dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM agents {where} ORDER BY is_default DESC, rowid", args
+            ).fetchall()
+        return {row["id"]: self._row_to_agent(row) for row in rows}
+    
+    def register(self, agent_id: str, callback_url: str, agent_name: str = "My PC", token: str = None) -> dict:
+        """Register an agent (persists to the database)."""
+        import secrets
+        import string
         
-        # Move to front by recreating dict
-        agent = self._agents.pop(agent_id)
-        self._agents = {agent_id: agent, **self._agents}
-        self._save()
+        with self._lock, self._conn:
+            if not token:
+                row = self._conn.execute("SELECT token FROM agents WHERE id = ?", (agent_id,)).fetchone()
+                if row and row["token"]:
+                    token = row["token"]
+                else:
+                    alphabet = string.ascii_letters + string.digits
+                    token = ''.join(secrets.choice(alphabet) for i in range(32))
+            
+            self._conn.execute(
+                "INSERT INTO agents (id, callback_url, name, status, token, updated_at) "
+                "VALUES (?, ?, ?, 'registered', ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET callback_url = excluded.callback_url, name = excluded.name, "
+                "status = 'registered', token = excluded.token, updated_at = excluded.updated_at",
+                (agent_id, callback_url, agent_name, token, time.time())
+            )
+        return {
+            "status": "registered",
+            "agent_id": agent_id,
+            "message": f"Agent '{agent_name}' registered and saved permanently",
+            "token": token
+        }
+    
+    def unregister(self, agent_id: str) -> dict:
+        """Remove an agent."""
+        with self._lock, self._conn:
+            cur = self._conn.execute("DELETE FROM agents WHERE id = ?", (agent_id,))
+        if cur.rowcount:
+            return {"status": "removed", "agent_id": agent_id}
+        return {"error": f"Agent {agent_id} not found"}
+    
+    def get(self, agent_id: str) -> Optional[dict]:
+        """Get an agent by ID."""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM agents WHERE id = ?", (agent_id,)).fetchone()
+        return self._row_to_agent(row) if row else None
+    
+    def get_all(self) -> Dict[str, dict]:
+        """Get all registered agents (default agent first)."""
+        return self._query()
+    
+    def find(self, status: str = None, name: str = None) -> Dict[str, dict]:
+        """Get agents filtered by status and/or name (indexed)."""
+        clauses, args = [], []
+        if status is not None:
+            clauses.append("status = ?")
+            args.append(status)
+        if name is not None:
+            clauses.append("name = ?")
+            args.append(name)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._query(where, tuple(args))
+    
+    def get_first(self) -> Optional[tuple]:
+        """Get the default agent, or the first registered one."""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM agents ORDER BY is_default DESC, rowid LIMIT 1").fetchone()
+        return (row["id"], self._row_to_agent(row)) if row else None
+    
+    def update_status(self, agent_id: str, status: str):
+        """Update agent status (connected/disconnected). No-op if unchanged."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE agents SET status = ?, updated_at = ? WHERE id = ? AND status != ?",
+                (status, time.time(), agent_id, status)
+            )
+    
+    def update_statuses(self, statuses: Dict[str, str]):
+        """Update several agents' status in one transaction."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE agents SET status = ?, updated_at = ? WHERE id = ? AND status != ?",
+                [(status, now, agent_id, status) for agent_id, status in statuses.items()]
+            )
+    
+    def set_default(self, agent_id: str) -> dict:
+        """Set an agent as the default."""
+        with self._lock, self._conn:
+            if not self._conn.execute("SELECT 1 FROM agents WHERE id = ?", (agent_id,)).fetchone():
+                return {"error": f"Agent {agent_id} not found"}
+            self._conn.execute("UPDATE agents SET is_default = (id = ?)", (agent_id,))
         return {"status": "default_set", "agent_id": agent_id}
+    
+    def flush(self):
+        """Writes are committed immediately; kept for API parity."""
+        pass
+
+
+def create_agent_storage(backend: str = None):
+    """Build the agent registry for the configured backend ("json" or "sqlite")."""
+    backend = backend or os.environ.get("BRIDGE_MCP_STORAGE") or config.get("storage_backend", "json")
+    if backend == "sqlite":
+        return SQLiteAgentStorage()
+    return AgentStorage()
 
 
 class Config:
@@ -141,7 +442,33 @@ class Config:
         "local_agent_port": 8006,
         "auto_connect_localhost": True,
         "connection_timeout": 30,
-        "default_agent_id": "local"
+        "default_agent_id": "local",
+        # Relay HTTP client pool (per agent)
+        "max_connections_per_agent": 10,
+        "max_keepalive_per_agent": 5,
+        "keepalive_expiry": 30.0,
+        "http2": False,
+        # Persistent WebSocket command channel (falls back to HTTP)
+        "use_websocket": True,
+        "websocket_connect_timeout": 2.0,
+        "websocket_retry_interval": 60,
+        # Ask agents for msgpack (raw bytes) instead of base64 JSON for images
+        "binary_payloads": True,
+        # Background agent health monitor
+        "health_check_interval": 15,
+        "health_check_timeout": 2.0,
+        "health_check_max_backoff": 300,
+        "health_check_concurrency": 20,
+        "health_check_deadline": 15,
+        "broadcast_concurrency": 10,
+        # Chunked file_upload / file_download
+        "transfer_chunk_size": 4 * 1024 * 1024,
+        "transfer_concurrency": 4,
+        "transfer_retries": 3,
+        # Untargeted commands starting with these stay on one agent (stateful sessions)
+        "sticky_command_prefixes": ["browser_", "screenshot_delta"],
+        # Agent registry backend: "json" (agents.json) or "sqlite" (agents.db)
+        "storage_backend": "json"
     }
     
     def __init__(self):
@@ -179,5 +506,5 @@ class Config:
 
 
 # Global instances
-agent_storage = AgentStorage()
 config = Config()
+agent_storage = create_agent_storage()
@@ -8,9 +8,15 @@ Usage: python local_agent.py
 """
 
 import asyncio
+import contextlib
 import json
 import base64
-import subprocess
+import os
+import platform
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from typing import Optional
 from aiohttp import web
@@ -50,6 +56,15 @@ async def auto_register_with_bridge():
         print(f"[Warning] Could not auto-register: {e}")
         print("[Info] Manual registration may be required")
 
+# Optional binary envelope for large results (raw bytes instead of base64 JSON)
+try:
+    import msgpack
+    HAS_MSGPACK = True
+except ImportError:
+    HAS_MSGPACK = False
+
+MSGPACK_TYPE = "application/msgpack"
+
 # Windows-specific imports (only work on Windows)
 try:
     import pyautogui
@@ -67,21 +82,85 @@ except ImportError as e:
     print("Run: pip install -r requirements-local.txt")
     exit(1)
 
+# Warm shell sessions for run_powershell / run_cmd / run_bash
+from local_agent_tools.shell_pool import shell_pool
+# Streamed (long-running) shell jobs
+from local_agent_tools.shell_stream import shell_jobs
+# Bounded / ranged file access
+from local_agent_tools import file_tools
+# Resumable chunked uploads / downloads
+from local_agent_tools.file_transfer import file_transfers
+# Delta (rsync-style) directory sync
+from local_agent_tools import file_sync
+# Optional background file name / content index
+from local_agent_tools.file_index import get_file_index, INDEX_DB
+# Parallel content search (findstr / Select-String replacement)
+from local_agent_tools import file_grep
+# Screenshot capture / encoding pipeline (format, quality, scale, region)
+from local_agent_tools import screen_capture
+# Tile-based delta screenshots against each session's last frame
+from local_agent_tools import screen_delta
+# Agent-side waits for the screen to change / settle
+from local_agent_tools import screen_wait
+
 # Configuration
 PORT = 8006
 HOST = "0.0.0.0"
+# Largest request body / WebSocket frame accepted (upload chunks go up to 16 MB, base64 adds a third)
+MAX_REQUEST_SIZE = 32 * 1024 * 1024
+
+# Roots for the background file index (os.pathsep-separated), and whether to index contents
+INDEX_ROOTS = [r for r in os.environ.get("BRIDGE_MCP_INDEX_ROOTS", "").split(os.pathsep) if r.strip()]
+INDEX_CONTENT = os.environ.get("BRIDGE_MCP_INDEX_CONTENT", "") in ("1", "true", "yes")
+
+# Routing tags advertised on /health (e.g. BRIDGE_MCP_AGENT_TAGS="office,gpu")
+AGENT_TAGS = sorted({platform.system().lower()} | {
+    t.strip() for t in os.environ.get("BRIDGE_MCP_AGENT_TAGS", "").split(",") if t.strip()
+})
+
+# Current load, advertised on /health for the relay's routing
+agent_load = {"in_flight": 0}
 
 # ============================================
 # TOOL IMPLEMENTATIONS
 # ============================================
 
-def execute_screenshot():
-    """Take a screenshot and return as base64."""
-    screenshot = pyautogui.screenshot()
-    buffer = BytesIO()
-    screenshot.save(buffer, format="PNG")
-    buffer.seek(0)
-    return {"image": base64.b64encode(buffer.read()).decode()}
+def execute_screenshot(format: str = "png", quality: int = None, scale: float = None, max_dimension: int = None,
+                       region=None, grayscale: bool = False, if_none_match: str = None):
+    """
+    Take a screenshot (image bytes; base64-encoded on the JSON path) plus scale/offset for mapping coordinates.
+    Returns just {"unchanged": true, "etag"} if the screen still matches the caller's etag.
+    """
+    return screen_capture.screenshot(format=format, quality=quality, scale=scale, max_dimension=max_dimension,
+                                     region=region, grayscale=grayscale, if_none_match=if_none_match)
+
+def execute_screenshot_delta(session: str = "default", keyframe: bool = False, base_frame: str = None,
+                             format: str = "png", quality: int = None, scale: float = None,
+                             max_dimension: int = None, grayscale: bool = False,
+                             tile: int = screen_delta.DEFAULT_TILE,
+                             keyframe_ratio: float = screen_delta.DEFAULT_KEYFRAME_RATIO):
+    """Screenshot as only the tiles that changed since this session's last frame (or a keyframe)."""
+    start = time.perf_counter()
+    img = screen_capture.capture()
+    capture_ms = round((time.perf_counter() - start) * 1000, 1)
+    img, applied = screen_capture.prepare(img, scale, max_dimension, grayscale)
+    result = screen_delta.frame_tracker.delta(
+        session, img, lambda part: screen_capture.encode(part, format, quality),
+        keyframe=keyframe, base_frame=base_frame, tile=tile, keyframe_ratio=keyframe_ratio)
+    result.update({"format": screen_capture.format_name(format), "scale": applied, "offset": [0, 0],
+                   "capture_ms": capture_ms})
+    return result
+
+def execute_wait_for_change(region=None, threshold: float = screen_wait.DEFAULT_THRESHOLD, timeout: float = 10,
+                            interval_ms: int = screen_wait.DEFAULT_INTERVAL_MS, screenshot=False):
+    """Block until the screen (or region) changes, sampling cheap downsampled frames."""
+    return screen_wait.wait_for_change(region, threshold, timeout, interval_ms, screenshot)
+
+def execute_wait_for_stable(region=None, quiet_ms: int = 500, threshold: float = screen_wait.DEFAULT_THRESHOLD,
+                            timeout: float = 10, interval_ms: int = screen_wait.DEFAULT_INTERVAL_MS,
+                            screenshot=False):
+    """Block until the screen (or region) has stopped changing for quiet_ms."""
+    return screen_wait.wait_for_stable(region, quiet_ms, threshold, timeout, interval_ms, screenshot)
 
 def execute_click(x: int, y: int, button: str = "left"):
     """Click at coordinates."""
@@ -248,34 +327,28 @@ def execute_app_list():
                 pass
     return {"apps": apps[:30]}
 
-def execute_run_powershell(command: str):
-    """Run PowerShell command."""
-    result = subprocess.run(
-        ["powershell", "-Command", command],
-        capture_output=True, text=True, timeout=30
-    )
-    return {
-        "stdout": result.stdout,
-        "stderr": result.stderr,
-        "returncode": result.returncode
-    }
+def execute_run_powershell(command: str, timeout: float = 30, session: str = None):
+    """Run PowerShell command in a warm session (named sessions keep state)."""
+    return shell_pool.run("powershell", command, timeout=timeout, session=session)
 
-def execute_run_cmd(command: str):
-    """Run CMD command."""
-    result = subprocess.run(
-        ["cmd", "/c", command],
-        capture_output=True, text=True, timeout=30
-    )
-    return {
-        "stdout": result.stdout,
-        "stderr": result.stderr,
-        "returncode": result.returncode
-    }
+def execute_run_cmd(command: str, timeout: float = 30, session: str = None):
+    """Run CMD command in a warm session (named sessions keep state)."""
+    return shell_pool.run("cmd", command, timeout=timeout, session=session)
+
+def execute_run_bash(command: str, timeout: float = 30, session: str = None):
+    """Run bash command in a warm session (Linux/macOS agents, WSL, Git Bash)."""
+    return shell_pool.run("bash", command, timeout=timeout, session=session)
 
-def execute_file_read(path: str):
-    """Read file contents."""
-    with open(path, "r", encoding="utf-8") as f:
-        return {"content": f.read()}
+def execute_shell_session_close(shell: str, session: str):
+    """Close a named shell session."""
+    return shell_pool.close_session(shell, session)
+
+def execute_file_read(path: str, offset: int = None, length: int = None, lines: list = None,
+                      tail: int = None, encoding: str = "utf-8", binary: bool = False,
+                      max_bytes: int = file_tools.MAX_READ_BYTES):
+    """Read a file, or a byte range / line range / tail of it (bounded per call)."""
+    return file_tools.read_file(path, offset=offset, length=length, lines=lines, tail=tail,
+                                encoding=encoding, binary=binary, max_bytes=max_bytes)
 
 def execute_file_write(path: str, content: str):
     """Write to file."""
@@ -283,11 +356,58 @@ def execute_file_write(path: str, content: str):
         f.write(content)
     return {"status": "written", "path": path}
 
-def execute_file_list(directory: str):
-    """List files in directory."""
-    import os
-    files = os.listdir(directory)
-    return {"files": files}
+def execute_file_patch(path: str, diff: str = None, edits: list = None, expected_sha256: str = None,
+                       encoding: str = "utf-8", dry_run: bool = False):
+    """Apply a unified diff or line/string edits in place (hash-checked, atomic)."""
+    return file_tools.patch_file(path, diff=diff, edits=edits, expected_sha256=expected_sha256,
+                                 encoding=encoding, dry_run=dry_run)
+
+def execute_file_list(directory: str, depth: int = 0, pattern: str = None, extensions: list = None,
+                      entry_type: str = None, include_hidden: bool = True, sort: str = "name",
+                      reverse: bool = False, limit: int = file_tools.DEFAULT_LIST_LIMIT, cursor: str = None):
+    """List a directory with type/size/mtime; recursive, filtered, sorted and paged."""
+    return file_tools.list_directory(directory, depth=depth, pattern=pattern, extensions=extensions,
+                                     entry_type=entry_type, include_hidden=include_hidden, sort=sort,
+                                     reverse=reverse, limit=limit, cursor=cursor)
+
+def execute_file_search(query: str, mode: str = "name", root: str = None, limit: int = 50):
+    """Search the file index by name (substring or glob) or content."""
+    return get_file_index().search(query, mode=mode, root=root, limit=limit)
+
+def execute_file_grep(directory: str, pattern: str, regex: bool = True, ignore_case: bool = False,
+                      include: list = None, exclude: list = None,
+                      max_matches: int = file_grep.DEFAULT_MAX_MATCHES, max_bytes: int = file_grep.DEFAULT_MAX_BYTES,
+                      max_file_size: int = file_grep.DEFAULT_MAX_FILE_SIZE, context: int = 0,
+                      timeout: float = None):
+    """Search file contents under a directory in parallel (see /execute_stream for streamed results)."""
+    return file_grep.grep(directory, pattern, regex=regex, ignore_case=ignore_case, include=include,
+                          exclude=exclude, max_matches=max_matches, max_bytes=max_bytes,
+                          max_file_size=max_file_size, context=context, timeout=timeout)
+
+def execute_file_index(action: str = "status", root: str = None, content: bool = False):
+    """Manage indexed roots: status, add, remove, rescan."""
+    index = get_file_index()
+    if action == "status":
+        return index.status()
+    if not root:
+        return {"error": f"'{action}' needs a root"}
+    if action == "add":
+        return index.add_root(root, content)
+    if action == "remove":
+        return index.remove_root(root)
+    if action == "rescan":
+        return index.request_scan(root)
+    return {"error": f"Unknown index action '{action}' (use status, add, remove or rescan)"}
+
+def start_file_index():
+    """Register roots from the environment and start the indexer (runs on the worker pool)."""
+    try:
+        index = get_file_index()
+        for root in INDEX_ROOTS:
+            print(f"[Index] {index.add_root(root, INDEX_CONTENT)}")
+        index.start()
+    except Exception as e:
+        print(f"[Index] Could not start file index: {e}")
 
 def execute_clipboard_copy(text: str):
     """Copy to clipboard."""
@@ -343,7 +463,7 @@ async def execute_browser_press(key: str):
 
 async def execute_browser_screenshot():
     if not HAS_PLAYWRIGHT: return {"error": "Playwright not installed"}
-    img = await browser_manager.screenshot()
+    img = await browser_manager.screenshot_bytes()
     return {"image": img}
 
 async def execute_browser_content():
@@ -359,7 +479,19 @@ def execute_wait(seconds: float):
 
 # Command dispatcher
 COMMANDS = {
-    "screenshot": lambda p: execute_screenshot(),
+    "screenshot": lambda p: execute_screenshot(p.get("format", "png"), p.get("quality"), p.get("scale"),
+                                               p.get("max_dimension"), p.get("region"), p.get("grayscale", False),
+                                               p.get("if_none_match")),
+    "screenshot_delta": lambda p: execute_screenshot_delta(
+        p.get("session", "default"), p.get("keyframe", False), p.get("base_frame"), p.get("format", "png"),
+        p.get("quality"), p.get("scale"), p.get("max_dimension"), p.get("grayscale", False),
+        p.get("tile", screen_delta.DEFAULT_TILE), p.get("keyframe_ratio", screen_delta.DEFAULT_KEYFRAME_RATIO)),
+    "wait_for_change": lambda p: execute_wait_for_change(
+        p.get("region"), p.get("threshold", screen_wait.DEFAULT_THRESHOLD), p.get("timeout", 10),
+        p.get("interval_ms", screen_wait.DEFAULT_INTERVAL_MS), p.get("screenshot", False)),
+    "wait_for_stable": lambda p: execute_wait_for_stable(
+        p.get("region"), p.get("quiet_ms", 500), p.get("threshold", screen_wait.DEFAULT_THRESHOLD),
+        p.get("timeout", 10), p.get("interval_ms", screen_wait.DEFAULT_INTERVAL_MS), p.get("screenshot", False)),
     "click": lambda p: execute_click(p["x"], p["y"], p.get("button", "left")),
     "double_click": lambda p: execute_double_click(p["x"], p["y"]),
     "right_click": lambda p: execute_right_click(p["x"], p["y"]),
@@ -376,11 +508,42 @@ COMMANDS = {
     "app_switch": lambda p: execute_app_switch(p["name"]),
     "app_close": lambda p: execute_app_close(p["name"]),
     "app_list": lambda p: execute_app_list(),
-    "run_powershell": lambda p: execute_run_powershell(p["command"]),
-    "run_cmd": lambda p: execute_run_cmd(p["command"]),
-    "file_read": lambda p: execute_file_read(p["path"]),
+    "run_powershell": lambda p: execute_run_powershell(p["command"], p.get("timeout", 30), p.get("session")),
+    "run_cmd": lambda p: execute_run_cmd(p["command"], p.get("timeout", 30), p.get("session")),
+    "run_bash": lambda p: execute_run_bash(p["command"], p.get("timeout", 30), p.get("session")),
+    "shell_sessions": lambda p: shell_pool.list_sessions(),
+    "shell_session_close": lambda p: execute_shell_session_close(p["shell"], p["session"]),
+    "shell_jobs": lambda p: shell_jobs.list_jobs(),
+    "shell_cancel": lambda p: shell_jobs.cancel(p["job_id"]),
+    "file_read": lambda p: execute_file_read(
+        p["path"], p.get("offset"), p.get("length"), p.get("lines"), p.get("tail"),
+        p.get("encoding", "utf-8"), p.get("binary", False), p.get("max_bytes", file_tools.MAX_READ_BYTES)),
     "file_write": lambda p: execute_file_write(p["path"], p["content"]),
-    "file_list": lambda p: execute_file_list(p["directory"]),
+    "file_patch": lambda p: execute_file_patch(p["path"], p.get("diff"), p.get("edits"), p.get("expected_sha256"),
+                                               p.get("encoding", "utf-8"), p.get("dry_run", False)),
+    "file_search": lambda p: execute_file_search(p["query"], p.get("mode", "name"), p.get("root"), p.get("limit", 50)),
+    "file_grep": lambda p: execute_file_grep(
+        p["directory"], p["pattern"], p.get("regex", True), p.get("ignore_case", False), p.get("include"),
+        p.get("exclude"), p.get("max_matches", file_grep.DEFAULT_MAX_MATCHES),
+        p.get("max_bytes", file_grep.DEFAULT_MAX_BYTES), p.get("max_file_size", file_grep.DEFAULT_MAX_FILE_SIZE),
+        p.get("context", 0), p.get("timeout")),
+    "file_index": lambda p: execute_file_index(p.get("action", "status"), p.get("root"), p.get("content", False)),
+    "file_list": lambda p: execute_file_list(
+        p["directory"], p.get("depth", 0), p.get("pattern"), p.get("extensions"), p.get("entry_type"),
+        p.get("include_hidden", True), p.get("sort", "name"), p.get("reverse", False),
+        p.get("limit", file_tools.DEFAULT_LIST_LIMIT), p.get("cursor")),
+    "upload_begin": lambda p: file_transfers.upload_begin(p["path"], p["size"], p["sha256"], p.get("chunk_size"),
+                                                          p.get("mtime")),
+    "upload_chunk": lambda p: file_transfers.upload_chunk(p["upload_id"], p["index"], p["data"], p.get("sha256")),
+    "upload_finish": lambda p: file_transfers.upload_finish(p["upload_id"]),
+    "upload_abort": lambda p: file_transfers.upload_abort(p["upload_id"]),
+    "download_begin": lambda p: file_transfers.download_begin(p["path"], p.get("chunk_size")),
+    "download_chunk": lambda p: file_transfers.download_chunk(p["path"], p["index"], p.get("chunk_size"), p.get("mtime")),
+    "sync_plan": lambda p: file_sync.sync_plan(p["directory"], p["files"], p.get("block_size", file_sync.DEFAULT_BLOCK_SIZE),
+                                               p.get("checksum", False), p.get("exclude"), p.get("delta_max")),
+    "sync_apply": lambda p: file_sync.apply_delta(p["directory"], p["path"], p["ops"], p["size"], p["sha256"],
+                                                  p.get("mtime"), p.get("block_size", file_sync.DEFAULT_BLOCK_SIZE)),
+    "sync_delete": lambda p: file_sync.delete_files(p["directory"], p["paths"]),
     "clipboard_copy": lambda p: execute_clipboard_copy(p["text"]),
     "clipboard_paste": lambda p: execute_clipboard_paste(),
     "chrome_open": lambda p: execute_chrome_open(p.get("url")),
@@ -396,6 +559,117 @@ COMMANDS = {
     "browser_content": lambda p: execute_browser_content(),
 }
 
+# ============================================
+# COMMAND EXECUTOR (keeps the event loop responsive)
+# ============================================
+
+# Commands driving a shared input device run one at a time, in order, on
+# that device's lane. Everything else runs in parallel on the worker pool.
+COMMAND_LANES = {
+    "click": "mouse",
+    "double_click": "mouse",
+    "right_click": "mouse",
+    "scroll": "mouse",
+    "move_mouse": "mouse",
+    "drag": "mouse",
+    "type_text": "keyboard",
+    "press_key": "keyboard",
+    "hotkey": "keyboard",
+    "clipboard_copy": "clipboard",
+    "clipboard_paste": "clipboard",
+}
+
+EXECUTOR_WORKERS = 8
+
+_thread_state = threading.local()
+
+def _init_worker_thread():
+    """Per-thread setup: uiautomation needs COM initialised on each thread that uses it."""
+    if HAS_UIAUTOMATION:
+        try:
+            _thread_state.uia = auto.UIAutomationInitializerInThread()
+        except Exception:
+            pass
+
+worker_pool = ThreadPoolExecutor(
+    max_workers=EXECUTOR_WORKERS, thread_name_prefix="agent-worker", initializer=_init_worker_thread
+)
+lane_executors = {
+    lane: ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"agent-{lane}", initializer=_init_worker_thread)
+    for lane in set(COMMAND_LANES.values())
+}
+
+# Input commands that take "observe": settle, then capture, in the same request
+OBSERVABLE_COMMANDS = {
+    "click", "double_click", "right_click", "scroll", "move_mouse", "drag",
+    "type_text", "press_key", "hotkey",
+}
+
+def execute_observe(observe) -> dict:
+    """
+    Wait for the screen to settle after an action, then capture it.
+    `observe` is True or {quiet_ms, timeout, threshold, region, format, quality,
+    scale, max_dimension, grayscale, delta, session, base_frame, keyframe}.
+    """
+    options = observe if isinstance(observe, dict) else {}
+    settle = screen_wait.wait_for_stable(
+        options.get("region"), options.get("quiet_ms", 300), options.get("threshold", screen_wait.DEFAULT_THRESHOLD),
+        options.get("timeout", 3), options.get("interval_ms", 50))
+    frame = {k: options[k] for k in ("format", "quality", "scale", "max_dimension", "grayscale") if k in options}
+    if options.get("delta"):
+        result = execute_screenshot_delta(options.get("session", "default"), options.get("keyframe", False),
+                                          options.get("base_frame"), **frame)
+    else:
+        result = screen_capture.screenshot(region=options.get("region"), **frame)
+    result.update({"stable": settle["stable"], "settle_ms": settle["elapsed_ms"]})
+    return result
+
+async def dispatch_command(command: str, params: dict):
+    """
+    Run a command off the event loop: on its device lane if it has one,
+    otherwise on the shared worker pool. Async (Playwright) commands are
+    awaited back on the loop. Input commands with "observe" also wait for
+    the screen to settle and attach a capture under "observe".
+    """
+    loop = asyncio.get_running_loop()
+    executor = lane_executors.get(COMMAND_LANES.get(command), worker_pool)
+    result = await loop.run_in_executor(executor, COMMANDS[command], params)
+    if asyncio.iscoroutine(result):
+        result = await result
+    observe = params.get("observe")
+    if observe and command in OBSERVABLE_COMMANDS and isinstance(result, dict) and "error" not in result:
+        try:
+            result["observe"] = await loop.run_in_executor(worker_pool, execute_observe, observe)
+        except Exception as e:
+            result["observe"] = {"error": str(e)}
+    return result
+
+class LoopLagMonitor:
+    """Samples how late the event loop wakes up, so blocking calls show up in /health."""
+
+    def __init__(self, interval: float = 0.1, window: int = 600):
+        self.interval = interval
+        self.samples = deque(maxlen=window)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - start - self.interval) * 1000)
+
+    def stats(self) -> dict:
+        if not self.samples:
+            return {"avg_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+        ordered = sorted(self.samples)
+        return {
+            "avg_ms": round(sum(ordered) / len(ordered), 2),
+            "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 2),
+            "max_ms": round(ordered[-1], 2),
+        }
+
+loop_lag = LoopLagMonitor()
+
 # ============================================
 # TERMINATOR VISION (Live Stream)
 # ============================================
@@ -464,6 +738,18 @@ import json
 from pathlib import Path
 from collections import deque
 
+def brief(value):
+    """Copy of a params/result value with large payloads (chunks, images) summarised, for logs."""
+    if isinstance(value, (bytes, bytearray)):
+        return f"<{len(value)} bytes>"
+    if isinstance(value, str) and len(value) > 200:
+        return value[:200] + f"... <{len(value)} chars>"
+    if isinstance(value, dict):
+        return {k: brief(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [brief(v) for v in value[:20]]
+    return value
+
 class SessionMemory:
     def __init__(self, max_size=100):
         self.history_file = Path.home() / 'AppData' / 'Roaming' / 'bridge-mcp' / 'session_history.json'
@@ -495,8 +781,8 @@ class SessionMemory:
         self.history.append({
             "timestamp": time.time(),
             "command": command,
-            "params": params,
-            "result": str(result)[:200]  # Truncate
+            "params": brief(params),
+            "result": str(brief(result))[:200]  # Truncate
         })
         self._save()
     
@@ -555,7 +841,8 @@ class CommandGuard:
         self.safe_mode = True
         self.pending_requests = {}
         self.dangerous_commands = {
-            "run_powershell", "run_cmd", "file_write", "file_delete"
+            "run_powershell", "run_cmd", "run_bash", "file_write", "file_delete",
+            "file_patch", "upload_begin", "sync_apply", "sync_delete"
         }
     
     def is_dangerous(self, command: str) -> bool:
@@ -577,6 +864,7 @@ class CommandGuard:
         }
         
         print(f"[Safety] Blocking command '{command}' - Waiting for approval ({request_id})")
+        push_event("approval_required", {"id": request_id, "command": command})
         
         # Show in AI Overlay
         if HAS_OVERLAY:
@@ -650,74 +938,365 @@ async def handle_safety_pending(request):
         "safe_mode": guard.safe_mode
     })
 
-async def handle_execute(request):
-    """Handle command execution requests."""
+def check_auth(request) -> Optional[web.Response]:
+    """Return a 401 response if the request lacks a valid token, else None."""
+    if AUTH_TOKEN:
+        auth_header = request.headers.get("Authorization")
+        if not auth_header or auth_header != f"Bearer {AUTH_TOKEN}":
+            log_command("unauthorized_access", error="Invalid token")
+            return web.json_response({"error": "Unauthorized: Invalid or missing token"}, status=401)
+    return None
+
+def json_safe(value):
+    """Base64-encode raw bytes (e.g. screenshots) so a result can go out as JSON."""
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode()
+    if isinstance(value, dict):
+        return {k: json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [json_safe(v) for v in value]
+    return value
+
+def wants_msgpack(accept: str) -> bool:
+    """Content negotiation: does the client accept the msgpack envelope?"""
+    return HAS_MSGPACK and MSGPACK_TYPE in (accept or "")
+
+async def read_body(request) -> dict:
+    """Request body as JSON, or msgpack (raw byte fields, e.g. upload chunks)."""
+    if HAS_MSGPACK and request.content_type == MSGPACK_TYPE:
+        return msgpack.unpackb(await request.read(), raw=False)
+    return await request.json()
+
+def encode_response(request, result, status: int = 200) -> web.Response:
+    """msgpack (raw bytes) if the client asked for it, else JSON (the default)."""
+    if wants_msgpack(request.headers.get("Accept")):
+        return web.Response(
+            body=msgpack.packb(result, use_bin_type=True), status=status, content_type=MSGPACK_TYPE
+        )
+    return web.json_response(json_safe(result), status=status)
+
+async def run_command(command: str, params: dict):
+    """
+    Run a single command (after auth and safety checks).
+    Returns (result, http_status).
+    """
+    # Check if user requested stop
+    if HAS_OVERLAY and is_stopped():
+        reset_stop()
+        error_msg = "Stopped by user via Overlay"
+        log_command("stop_request", error=error_msg)
+        return {
+            "error": error_msg,
+            "message": "User clicked STOP button"
+        }, 400
+
+    if command not in COMMANDS:
+        error_msg = f"Unknown command: {command}"
+        log_command(command, error=error_msg)
+        return {"error": error_msg}, 400
+    
+    # Show action in overlay
+    if HAS_OVERLAY:
+        action_text = f"{command}"
+        if params:
+            param_str = ", ".join(f"{k}={v}" for k, v in list(params.items())[:2])
+            action_text = f"{command}({param_str})"
+        show_action(action_text)
+
+    # Execute
+    agent_load["in_flight"] += 1
     try:
-        # Auth Check
-        if AUTH_TOKEN:
-            auth_header = request.headers.get("Authorization")
-            if not auth_header or auth_header != f"Bearer {AUTH_TOKEN}":
-                log_command("unauthorized_access", error="Invalid token")
-                return web.json_response({"error": "Unauthorized: Invalid or missing token"}, status=401)
-
-        data = await request.json()
-        command = data.get("command")
-        params = data.get("params", {})
+        result = await dispatch_command(command, params)
+    finally:
+        agent_load["in_flight"] -= 1
+    
+    # Record in session memory
+    session_memory.add(command, params, result)
         
+    summary = str(brief(result))
+    log_command(command, result=summary[:200] + "..." if len(summary) > 200 else brief(result))
+    return result, 200
+
+async def check_safety(command: str, params: dict) -> bool:
+    """Safety Sentinel gate: True if the command may run."""
+    if guard.safe_mode and guard.is_dangerous(command):
+        log_command(command, error="Blocked by Safety Sentinel - Waiting for approval")
+        approved = await guard.request_approval(command, params)
+        if not approved:
+            log_command(command, error="Denied by User")
+            return False
+        log_command(command, result="Approved by User - Executing...")
+    return True
+
+async def process_execute(data: dict):
+    """Run one {command, params} request (safety-gated). Returns (result, http_status)."""
+    command = data.get("command")
+    params = data.get("params", {})
+    try:
         # Safety Check
-        if guard.safe_mode and guard.is_dangerous(command):
-            log_command(command, error="Blocked by Safety Sentinel - Waiting for approval")
-            approved = await guard.request_approval(command, params)
-            if not approved:
-                log_command(command, error="Denied by User")
-                return web.json_response({"error": "Command denied by user security policy"}, status=403)
-            log_command(command, result="Approved by User - Executing...")
-
-        # Check if user requested stop
-        if HAS_OVERLAY and is_stopped():
-            reset_stop()
-            error_msg = "Stopped by user via Overlay"
-            log_command("stop_request", error=error_msg)
-            return web.json_response({
-                "error": error_msg,
-                "message": "User clicked STOP button"
-            }, status=400)
-
-        if command not in COMMANDS:
-            error_msg = f"Unknown command: {command}"
-            log_command(command, error=error_msg)
-            return web.json_response({"error": error_msg}, status=400)
-        
-        # Show action in overlay
-        if HAS_OVERLAY:
-            action_text = f"{command}"
-            if params:
-                param_str = ", ".join(f"{k}={v}" for k, v in list(params.items())[:2])
-                action_text = f"{command}({param_str})"
-            show_action(action_text)
-
-        # Execute
-        result = COMMANDS[command](params)
-        if asyncio.iscoroutine(result):
-            result = await result
-        
-        # Record in session memory
-        session_memory.add(command, params, result)
-            
-        log_command(command, result=str(result)[:200] + "..." if len(str(result)) > 200 else result)
-        return web.json_response(result)
+        if not await check_safety(command, params):
+            return {"error": "Command denied by user security policy"}, 403
+
+        return await run_command(command, params)
     
     except Exception as e:
-        log_command(command if 'command' in locals() else "unknown", error=str(e))
-        return web.json_response({"error": str(e)}, status=500)
+        log_command(command or "unknown", error=str(e))
+        return {"error": str(e)}, 500
+
+async def process_batch(data: dict):
+    """
+    Execute an ordered list of commands. Returns (response, http_status).
     
+    Body: {"items": [{"command": ..., "params": {...}}, ...],
+           "mode": "stop_on_error" | "continue"}
+    Dangerous items are approved once for the whole batch.
+    """
+    try:
+        items = data.get("items", [])
+        mode = data.get("mode", "stop_on_error")
+        if not isinstance(items, list) or not items:
+            return {"error": "Batch requires a non-empty 'items' list"}, 400
+        if mode not in ("stop_on_error", "continue"):
+            return {"error": f"Unknown batch mode: {mode}"}, 400
+
+        # Safety Check - one approval covering every dangerous item
+        if guard.safe_mode:
+            dangerous = [
+                {"index": i, "command": item.get("command"), "params": item.get("params", {})}
+                for i, item in enumerate(items)
+                if guard.is_dangerous(item.get("command"))
+            ]
+            if dangerous:
+                log_command("batch", error="Blocked by Safety Sentinel - Waiting for approval")
+                approved = await guard.request_approval("batch", {"count": len(items), "dangerous": dangerous})
+                if not approved:
+                    log_command("batch", error="Denied by User")
+                    return {"error": "Batch denied by user security policy"}, 403
+                log_command("batch", result="Approved by User - Executing...")
+
+        results = []
+        failed = 0
+        for i, item in enumerate(items):
+            command = item.get("command")
+            params = item.get("params", {})
+            try:
+                result, status = await run_command(command, params)
+            except Exception as e:
+                log_command(command or "unknown", error=str(e))
+                result, status = {"error": str(e)}, 500
+
+            ok = status == 200 and not (isinstance(result, dict) and "error" in result)
+            results.append({"index": i, "command": command, "ok": ok, "result": result})
+            if not ok:
+                failed += 1
+                if mode == "stop_on_error":
+                    break
+
+        for i in range(len(results), len(items)):
+            results.append({"index": i, "command": items[i].get("command"), "ok": False, "skipped": True})
+
+        return {
+            "results": results,
+            "executed": sum(1 for r in results if not r.get("skipped")),
+            "failed": failed,
+            "mode": mode
+        }, 200
+
+    except Exception as e:
+        log_command("batch", error=str(e))
+        return {"error": str(e)}, 500
+
+async def handle_execute(request):
+    """Handle command execution requests."""
+    # Auth Check
+    denied = check_auth(request)
+    if denied:
+        return denied
+    try:
+        data = await read_body(request)
+    except Exception as e:
+        return web.json_response({"error": f"Invalid JSON: {e}"}, status=400)
+    result, status = await process_execute(data)
+    return encode_response(request, result, status)
+
+async def handle_execute_batch(request):
+    """Execute an ordered list of commands in one request (see process_batch)."""
+    denied = check_auth(request)
+    if denied:
+        return denied
+    try:
+        data = await read_body(request)
+    except Exception as e:
+        return web.json_response({"error": f"Invalid JSON: {e}"}, status=400)
+    result, status = await process_batch(data)
+    return encode_response(request, result, status)
+
+# Shell commands that can stream their output
+STREAM_SHELLS = {
+    "run_powershell": "powershell",
+    "run_cmd": "cmd",
+    "run_bash": "bash",
+}
+
+def open_stream(command: str, params: dict):
+    """Event generator for a streamable command, or None if it cannot stream."""
+    shell = STREAM_SHELLS.get(command)
+    if shell is not None and "command" in params:
+        return shell_jobs.stream(
+            shell, params["command"],
+            timeout=params.get("timeout", 300),
+            max_output=params.get("max_output", 10 * 1024 * 1024),
+            job_id=params.get("job_id"),
+        )
+    if command == "file_grep" and "directory" in params and "pattern" in params:
+        return file_grep.grep_stream(params)
+    return None
+
+async def handle_execute_stream(request):
+    """
+    Run a shell command or file_grep and stream its results as they are produced.
+    
+    Body: {"command": "run_powershell" | "run_cmd" | "run_bash",
+           "params": {"command": ..., "timeout": 300, "max_output": bytes, "job_id": optional}}
+       or {"command": "file_grep", "params": {"directory": ..., "pattern": ..., ...}}
+    Response: chunked NDJSON, one event per line (see ShellJobs.stream / file_grep.grep_stream).
+    Disconnecting, or the shell_cancel command, stops the job.
+    """
+    denied = check_auth(request)
+    if denied:
+        return denied
+    try:
+        data = await request.json()
     except Exception as e:
-        log_command(command if 'command' in locals() else "unknown", error=str(e))
-        return web.json_response({"error": str(e)}, status=500)
+        return web.json_response({"error": f"Invalid JSON: {e}"}, status=400)
+    command = data.get("command")
+    params = data.get("params", {})
+    events = open_stream(command, params)
+    if events is None:
+        return web.json_response({"error": f"Command cannot be streamed: {command}"}, status=400)
+    if not await check_safety(command, params):
+        await events.aclose()
+        return web.json_response({"error": "Command denied by user security policy"}, status=403)
+
+    response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+    response.enable_chunked_encoding()
+    await response.prepare(request)
+
+    if HAS_OVERLAY:
+        show_action(f"{command} (streaming)")
+    agent_load["in_flight"] += 1
+    summary = None
+    try:
+        async with contextlib.aclosing(events):
+            async for event in events:
+                await response.write((json.dumps(event) + "\n").encode())
+                if event.get("event") == "exit":
+                    summary = event
+    except (ConnectionResetError, asyncio.CancelledError):
+        log_command(command, error="Stream client disconnected - job stopped")
+        raise
+    except Exception as e:
+        log_command(command, error=str(e))
+        await response.write((json.dumps({"event": "error", "error": str(e)}) + "\n").encode())
+    finally:
+        agent_load["in_flight"] -= 1
+
+    if summary:
+        session_memory.add(command, params, summary)
+        log_command(command, result=summary)
+    await response.write_eof()
+    return response
+
+# ============================================
+# WEBSOCKET COMMAND CHANNEL
+# ============================================
+
+# Same handlers as the HTTP routes, addressed by path
+WS_ROUTES = {
+    "/execute": process_execute,
+    "/execute_batch": process_batch,
+}
+
+# Connected relays -> send lock (one writer at a time per socket)
+ws_clients = {}
+
+async def _ws_send(ws, message: dict, binary: bool = False):
+    lock = ws_clients.get(ws)
+    if lock is None or ws.closed:
+        return
+    try:
+        async with lock:
+            if binary:
+                await ws.send_bytes(msgpack.packb(message, use_bin_type=True))
+            else:
+                await ws.send_json(json_safe(message))
+    except Exception:
+        pass
+
+def push_event(event: str, data: dict):
+    """Push an unsolicited event to every connected relay."""
+    for ws in list(ws_clients):
+        asyncio.ensure_future(_ws_send(ws, {"event": event, "data": data}))
+
+async def handle_ws(request):
+    """
+    Persistent command channel. Requests are multiplexed by id:
+    -> {"id": "1", "path": "/execute", "body": {"command": ..., "params": ...}}
+    <- {"id": "1", "status": 200, "body": {...}}
+    A request with "accept": "application/msgpack" gets a binary msgpack frame back.
+    Requests carrying raw bytes (upload chunks) arrive as binary msgpack frames.
+    The agent may also push {"event": ..., "data": ...} at any time.
+    """
+    denied = check_auth(request)
+    if denied:
+        return denied
+
+    ws = web.WebSocketResponse(heartbeat=30, max_msg_size=MAX_REQUEST_SIZE)
+    await ws.prepare(request)
+    ws_clients[ws] = asyncio.Lock()
+    tasks = set()
+
+    async def serve(message: dict):
+        handler = WS_ROUTES.get(message.get("path"))
+        if handler is None:
+            body, status = {"error": f"Unknown path: {message.get('path')}"}, 404
+        else:
+            body, status = await handler(message.get("body") or {})
+        await _ws_send(ws, {"id": message.get("id"), "status": status, "body": body},
+                       binary=wants_msgpack(message.get("accept")))
+
+    try:
+        async for msg in ws:
+            try:
+                if msg.type == web.WSMsgType.TEXT:
+                    message = json.loads(msg.data)
+                elif msg.type == web.WSMsgType.BINARY and HAS_MSGPACK:
+                    message = msgpack.unpackb(msg.data, raw=False)
+                else:
+                    continue
+            except Exception:
+                await _ws_send(ws, {"id": None, "status": 400, "body": {"error": "Invalid JSON"}})
+                continue
+            # Each request runs independently so many can be in flight
+            task = asyncio.ensure_future(serve(message))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    finally:
+        del ws_clients[ws]
+    return ws
 
 async def handle_health(request):
-    """Health check endpoint."""
-    return web.json_response({"status": "healthy", "agent": "Bridge MCP Local Agent"})
+    """Health check endpoint (also advertises tags and load for routing)."""
+    return web.json_response({
+        "status": "healthy",
+        "agent": "Bridge MCP Local Agent",
+        "tags": AGENT_TAGS,
+        "load": {
+            "in_flight": agent_load["in_flight"],
+            "queue_depth": len(guard.pending_requests)
+        },
+        "loop_lag": loop_lag.stats()
+    })
 
 async def handle_logs(request):
     """Return recent logs for dashboard."""
@@ -743,11 +1322,22 @@ async def main():
     """Run the local agent server."""
     # Try to auto-register on startup
     await auto_register_with_bridge()
-
-    app = web.Application()
+    asyncio.ensure_future(loop_lag.run())
+    
+    # Start a PowerShell in the background so the first run_powershell is warm
+    if os.name == 'nt':
+        worker_pool.submit(shell_pool.prewarm, "powershell")
+    # File index: only if roots are configured (env) or were added before (db exists)
+    if INDEX_ROOTS or INDEX_DB.exists():
+        worker_pool.submit(start_file_index)
+
+    app = web.Application(client_max_size=MAX_REQUEST_SIZE)
     
     # API Routes
     app.router.add_post("/execute", handle_execute)
+    app.router.add_post("/execute_batch", handle_execute_batch)
+    app.router.add_post("/execute_stream", handle_execute_stream)
+    app.router.add_get("/ws", handle_ws)
     app.router.add_get("/health", handle_health)
     app.router.add_get("/logs", handle_logs)
     
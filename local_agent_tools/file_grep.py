@@ -0,0 +1,360 @@
+"""
+Bridge MCP - Parallel Grep
+==========================
+Native content search over a directory tree, replacing findstr /
+Select-String round trips through a shell.
+
+- One thread walks the tree (os.scandir, excluded folders pruned) and
+  hands files to a pool of reader threads.
+- Each reader loads a file and runs the compiled pattern over the whole
+  buffer at once; lines are only split out around hits. File reads
+  release the GIL, so slow disks and antivirus scanning overlap.
+- `$` also matches before a CRLF line ending (it is rewritten to
+  (?=\r?$)), so anchored patterns work on Windows text files.
+- Files with a NUL byte in their first block are skipped as binary
+  (UTF-16 files with a BOM are decoded and searched instead).
+- Matches are handed to a callback per file as soon as that file is done,
+  which is how the streaming endpoint emits them while the search runs.
+"""
+
+import asyncio
+import codecs
+import fnmatch
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+GREP_WORKERS = min(32, (os.cpu_count() or 4) * 2)
+GREP_BATCH = 32  # files per pool task
+DEFAULT_MAX_MATCHES = 1000
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024  # total bytes read per search
+DEFAULT_MAX_FILE_SIZE = 64 * 1024 * 1024
+BINARY_SNIFF_BYTES = 8192
+MAX_LINE_CHARS = 500
+DEFAULT_EXCLUDES = [".git", ".svn", ".hg", "node_modules", "__pycache__", "$Recycle.Bin",
+                    "System Volume Information"]
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=GREP_WORKERS, thread_name_prefix="agent-grep")
+        return _pool
+
+
+def glob_matcher(patterns: Optional[List[str]]):
+    """One compiled regex for a list of globs, tested against a name or a relative path."""
+    if not patterns:
+        return None
+    flags = re.IGNORECASE if os.name == "nt" else 0
+    rx = re.compile("|".join(fnmatch.translate(p) for p in patterns), flags)
+    return lambda name, rel: rx.match(name) is not None or rx.match(rel) is not None
+
+
+def walk_files(directory: str, include: Optional[List[str]] = None, exclude: Optional[List[str]] = None,
+               stop: Optional[threading.Event] = None):
+    """(relative "/" path, absolute path) of every file to search."""
+    included, excluded = glob_matcher(include), glob_matcher(exclude)
+    stack = [("", directory)]
+    while stack and not (stop and stop.is_set()):
+        prefix, path = stack.pop()
+        try:
+            with os.scandir(path) as it:
+                entries = list(it)
+        except OSError:
+            if not prefix:
+                raise  # the searched directory itself is unreadable
+            continue
+        for entry in entries:
+            rel = prefix + entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if not (excluded and excluded(entry.name, rel)):
+                        stack.append((rel + "/", entry.path))
+                    continue
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+            except OSError:
+                continue
+            if included and not included(entry.name, rel):
+                continue
+            if excluded and excluded(entry.name, rel):
+                continue
+            yield rel, entry.path
+
+
+def crlf_anchors(pattern: str) -> str:
+    """Rewrite each unescaped `$` outside a character class as (?=\\r?$)."""
+    out = []
+    i, n = 0, len(pattern)
+    class_start = -1  # index of the open "[", or -1 outside a class
+    while i < n:
+        c = pattern[i]
+        if c == "\\":
+            out.append(pattern[i:i + 2])
+            i += 2
+            continue
+        if class_start >= 0:
+            # "]" first in the class (after an optional "^") is a literal
+            if c == "]" and i > class_start + 1 and not (i == class_start + 2 and pattern[i - 1] == "^"):
+                class_start = -1
+        elif c == "[":
+            class_start = i
+        elif c == "$":
+            out.append("(?=\\r?$)")
+            i += 1
+            continue
+        out.append(c)
+        i += 1
+    return "".join(out)
+
+
+def _line_text(line: str) -> str:
+    line = line.rstrip("\r")
+    return line if len(line) <= MAX_LINE_CHARS else line[:MAX_LINE_CHARS] + "..."
+
+
+def search_buffer(data, rx, max_matches: int, context: int = 0) -> list:
+    """
+    [{"line", "column", "text"[, "before", "after"]}] for each line of
+    `data` (bytes or str, matching `rx`) that contains a match.
+    """
+    newline = b"\n" if isinstance(data, bytes) else "\n"
+    decode = (lambda b: b.decode("utf-8", errors="replace")) if isinstance(data, bytes) else (lambda s: s)
+    results = []
+    pos = 0
+    line_no, counted = 1, 0
+    n = len(data)
+    while len(results) < max_matches and pos <= n:
+        m = rx.search(data, pos)
+        if m is None:
+            break
+        if m.start() == n and n and data[n - 1:n] == newline:
+            break  # empty match past the final newline
+        start = data.rfind(newline, 0, m.start()) + 1
+        end = data.find(newline, m.end() if m.end() > m.start() else m.start())
+        if end < 0:
+            end = n
+        line_no += data.count(newline, counted, start)
+        counted = start
+        hit = {
+            "line": line_no,
+            "column": len(decode(data[start:m.start()])) + 1,
+            "text": _line_text(decode(data[start:end])),
+        }
+        if context:
+            before_start = start
+            for _ in range(context):
+                if before_start == 0:
+                    break
+                before_start = data.rfind(newline, 0, before_start - 1) + 1
+            after_end = end
+            for _ in range(context):
+                if after_end >= n:
+                    break
+                nxt = data.find(newline, after_end + 1)
+                after_end = n if nxt < 0 else nxt
+            before = decode(data[before_start:start]).split("\n")[:-1] if before_start < start else []
+            after = decode(data[end + 1:after_end]).split("\n") if end + 1 < after_end else []
+            hit["before"] = [_line_text(line) for line in before]
+            hit["after"] = [_line_text(line) for line in after]
+        results.append(hit)
+        pos = end + 1
+    return results
+
+
+class GrepJob:
+    """State shared by the walker and reader threads of one search."""
+
+    def __init__(self, pattern: str, regex: bool, ignore_case: bool, max_matches: int,
+                 max_bytes: int, max_file_size: int, context: int):
+        flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+        source = crlf_anchors(pattern) if regex else re.escape(pattern)
+        self.rx_bytes = re.compile(source.encode("utf-8"), flags)
+        self.rx_text = re.compile(source, flags)
+        self.max_matches = max_matches
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self.context = context
+        self.stop = threading.Event()
+        self.lock = threading.Lock()
+        self.stats = {"files_searched": 0, "files_matched": 0, "matches": 0, "bytes_searched": 0,
+                      "skipped_binary": 0, "skipped_large": 0, "errors": 0}
+        self.truncated = False
+
+    def _reserve_bytes(self, size: int) -> bool:
+        with self.lock:
+            if self.stats["bytes_searched"] + size > self.max_bytes:
+                self.truncated = True
+                self.stop.set()
+                return False
+            self.stats["bytes_searched"] += size
+            return True
+
+    def search_file(self, rel: str, path: str) -> Optional[dict]:
+        if self.stop.is_set():
+            return None
+        try:
+            with open(path, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                if size > self.max_file_size:
+                    with self.lock:
+                        self.stats["skipped_large"] += 1
+                    return None
+                if not self._reserve_bytes(size):
+                    return None
+                data = f.read(size)
+        except OSError:
+            with self.lock:
+                self.stats["errors"] += 1
+            return None
+
+        rx = self.rx_bytes
+        if data.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+            data, rx = data.decode("utf-16", errors="replace"), self.rx_text
+        elif b"\0" in data[:BINARY_SNIFF_BYTES]:
+            with self.lock:
+                self.stats["skipped_binary"] += 1
+            return None
+        elif data.startswith(codecs.BOM_UTF8):
+            data = data[len(codecs.BOM_UTF8):]
+
+        hits = search_buffer(data, rx, self.max_matches, self.context)
+        with self.lock:
+            self.stats["files_searched"] += 1
+            if not hits:
+                return None
+            allowed = self.max_matches - self.stats["matches"]
+            if allowed <= 0:
+                self.truncated = True
+                self.stop.set()
+                return None
+            if len(hits) >= allowed:
+                hits = hits[:allowed]
+                self.truncated = True
+                self.stop.set()
+            self.stats["matches"] += len(hits)
+            self.stats["files_matched"] += 1
+        return {"path": rel, "matches": hits}
+
+
+def grep(directory: str, pattern: str, regex: bool = True, ignore_case: bool = False,
+         include: Optional[List[str]] = None, exclude: Optional[List[str]] = None,
+         max_matches: int = DEFAULT_MAX_MATCHES, max_bytes: int = DEFAULT_MAX_BYTES,
+         max_file_size: int = DEFAULT_MAX_FILE_SIZE, context: int = 0, timeout: Optional[float] = None,
+         on_file: Optional[Callable[[dict], None]] = None,
+         stop: Optional[threading.Event] = None) -> dict:
+    """
+    Search every file under `directory` for `pattern` in parallel.
+
+    Each file with hits is passed to `on_file` ({"path", "matches"}) as
+    soon as it is done; without a callback they are collected into
+    "files". Setting `stop`, or passing `timeout` seconds, ends the search early.
+    """
+    start = time.perf_counter()
+    if not os.path.isdir(directory):
+        return {"error": f"Not a directory: {directory}"}
+    try:
+        job = GrepJob(pattern, regex, ignore_case, max(1, int(max_matches)), int(max_bytes),
+                      int(max_file_size), max(0, min(int(context), 10)))
+    except re.error as e:
+        return {"error": f"Invalid pattern: {e}"}
+    if stop is not None:
+        job.stop = stop
+    exclude = DEFAULT_EXCLUDES if exclude is None else exclude
+    deadline = start + timeout if timeout else None
+    timed_out = False
+
+    collected = []
+    emit = on_file or collected.append
+    pool = _get_pool()
+    # Files go to the pool in small batches; the semaphore bounds how far
+    # the walker runs ahead, so memory stays at a few buffers per worker
+    slots = threading.BoundedSemaphore(GREP_WORKERS * 2)
+    futures = []
+
+    def run(batch):
+        try:
+            for rel, path in batch:
+                found = job.search_file(rel, path)
+                if found:
+                    emit(found)
+        finally:
+            slots.release()
+
+    def submit(batch):
+        slots.acquire()
+        futures.append(pool.submit(run, batch))
+
+    batch = []
+    for entry in walk_files(directory, include, exclude, job.stop):
+        batch.append(entry)
+        if len(batch) >= GREP_BATCH:
+            if deadline is not None and time.perf_counter() > deadline:
+                timed_out = True
+                job.stop.set()
+                break
+            submit(batch)
+            batch = []
+    if batch and not job.stop.is_set():
+        submit(batch)
+    for future in futures:
+        future.result()
+
+    result = {
+        "directory": directory,
+        "pattern": pattern,
+        **job.stats,
+        "truncated": job.truncated,
+        "timed_out": timed_out,
+        "cancelled": bool(stop is not None and stop.is_set() and not (job.truncated or timed_out)),
+        "duration": round(time.perf_counter() - start, 3),
+    }
+    if on_file is None:
+        result["files"] = collected
+    return result
+
+
+async def grep_stream(params: dict):
+    """
+    Run `grep` on a worker thread and yield events while it searches:
+    {"event": "started"}
+    {"path", "matches"}                               (one per file with hits)
+    {"event": "exit", ...search totals}
+    Closing the generator (client disconnect) stops the search.
+    """
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+    kwargs = {k: v for k, v in params.items() if k in GREP_PARAMS}
+
+    def on_file(found: dict):
+        loop.call_soon_threadsafe(events.put_nowait, found)
+
+    task = loop.run_in_executor(None, lambda: grep(on_file=on_file, stop=stop, **kwargs))
+    task.add_done_callback(lambda _: loop.call_soon_threadsafe(events.put_nowait, None))
+    try:
+        yield {"event": "started", "directory": params.get("directory"), "pattern": params.get("pattern")}
+        while True:
+            found = await events.get()
+            if found is None:
+                break
+            yield found
+        result = task.result()
+        if "error" in result:
+            yield {"event": "error", "error": result["error"]}
+        else:
+            yield {"event": "exit", **result}
+    finally:
+        stop.set()
+
+
+GREP_PARAMS = {"directory", "pattern", "regex", "ignore_case", "include", "exclude",
+               "max_matches", "max_bytes", "max_file_size", "context", "timeout"}
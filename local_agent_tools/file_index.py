@@ -0,0 +1,434 @@
+"""
+Bridge MCP - File Index
+=======================
+Optional background index of file names (and, per root, text contents)
+so "where is X" / "which files mention Y" are answered from SQLite in
+milliseconds instead of walking the disk through a shell.
+
+- Names and contents go into FTS5 tables with the trigram tokenizer, so
+  any substring of 3+ characters is an index lookup. SQLite builds
+  without trigram support fall back to LIKE on names and no content index.
+- Roots are rescanned every RESCAN_INTERVAL seconds; only files whose
+  size/mtime changed are re-read. If the optional `watchdog` package is
+  installed, change notifications are applied within a second.
+- Nothing runs unless a root is configured (BRIDGE_MCP_INDEX_ROOTS or
+  the file_index add command); roots persist in the database.
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+    HAS_WATCHDOG = True
+except ImportError:
+    HAS_WATCHDOG = False
+
+INDEX_DB = Path.home() / 'AppData' / 'Roaming' / 'bridge-mcp' / 'file_index.db'
+RESCAN_INTERVAL = 300  # seconds
+MAX_CONTENT_BYTES = 1024 * 1024
+COMMIT_EVERY = 2000
+DEFAULT_EXCLUDES = {".git", ".svn", "node_modules", "__pycache__", "$Recycle.Bin",
+                    "System Volume Information", ".bridge-part"}
+
+
+def _fts_literal(text: str) -> str:
+    """Quote user text as one FTS5 phrase (no query syntax)."""
+    return '"' + text.replace('"', '""') + '"'
+
+
+class FileIndex:
+    """SQLite-backed name / content index over configured roots."""
+
+    def __init__(self, db_path: Path = INDEX_DB):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._queue: queue.Queue = queue.Queue()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._observer = None
+        self.scanning: Optional[str] = None
+        self._requested: set = set()  # roots with a queued scan not yet started
+        self.has_trigram = False
+        self._init_db()
+
+    # ---------- storage ----------
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS roots (
+                root TEXT PRIMARY KEY, content INTEGER NOT NULL DEFAULT 0,
+                last_scan REAL, scan_seconds REAL
+            );
+            CREATE TABLE IF NOT EXISTS files (
+                id INTEGER PRIMARY KEY, root TEXT NOT NULL, dir TEXT NOT NULL, name TEXT NOT NULL,
+                size INTEGER, mtime REAL
+            );
+            CREATE UNIQUE INDEX IF NOT EXISTS files_dir_name ON files(dir, name);
+            CREATE INDEX IF NOT EXISTS files_root ON files(root);
+        """)
+        try:
+            conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS names USING fts5(name, tokenize='trigram')")
+            conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS contents USING fts5(body, tokenize='trigram')")
+            self.has_trigram = True
+        except sqlite3.OperationalError:
+            self.has_trigram = False
+        conn.commit()
+
+    # ---------- roots ----------
+
+    def roots(self) -> List[dict]:
+        rows = self._conn().execute("SELECT root, content, last_scan, scan_seconds FROM roots").fetchall()
+        return [{"root": r[0], "content": bool(r[1]), "last_scan": r[2], "scan_seconds": r[3]} for r in rows]
+
+    def add_root(self, root: str, content: bool = False) -> dict:
+        root = os.path.abspath(root)
+        if not os.path.isdir(root):
+            return {"error": f"Not a directory: {root}"}
+        conn = self._conn()
+        content = bool(content and self.has_trigram)
+        previous = conn.execute("SELECT content FROM roots WHERE root = ?", (root,)).fetchone()
+        conn.execute("INSERT INTO roots(root, content) VALUES (?, ?) "
+                     "ON CONFLICT(root) DO UPDATE SET content = excluded.content",
+                     (root, int(content)))
+        if previous is not None and bool(previous[0]) != content:
+            # Drop indexed bodies; forgetting size/mtime makes the next scan re-read every file
+            ids = [(r[0],) for r in conn.execute("SELECT id FROM files WHERE root = ?", (root,))]
+            if self.has_trigram:
+                conn.executemany("DELETE FROM contents WHERE rowid = ?", ids)
+            if content:
+                conn.execute("UPDATE files SET size = NULL, mtime = NULL WHERE root = ?", (root,))
+        conn.commit()
+        self.request_scan(root)
+        return {"status": "added", "root": root, "content": content}
+
+    def request_scan(self, root: str) -> dict:
+        """Queue a scan of an indexed root on the indexer thread (starting it if needed)."""
+        root = os.path.abspath(root)
+        if not any(info["root"] == root for info in self.roots()):
+            return {"error": f"Not an indexed root: {root}"}
+        if self._thread is None or not self._thread.is_alive():
+            self.start()  # its first sweep scans every root
+        elif root not in self._requested:
+            self._requested.add(root)
+            self._queue.put(("scan", root))
+        return {"status": "queued", "root": root, "scanning": self.scanning}
+
+    def remove_root(self, root: str) -> dict:
+        root = os.path.abspath(root)
+        conn = self._conn()
+        if not conn.execute("DELETE FROM roots WHERE root = ?", (root,)).rowcount:
+            return {"error": f"Not an indexed root: {root}"}
+        ids = [r[0] for r in conn.execute("SELECT id FROM files WHERE root = ?", (root,))]
+        self._delete_ids(conn, ids)
+        conn.commit()
+        self._restart_watch()
+        return {"status": "removed", "root": root, "files": len(ids)}
+
+    def _root_of(self, path: str) -> Optional[dict]:
+        for info in self.roots():
+            root = info["root"]
+            if path == root or path.startswith(root.rstrip(os.sep) + os.sep):
+                return info
+        return None
+
+    # ---------- indexing ----------
+
+    def _delete_ids(self, conn: sqlite3.Connection, ids: list):
+        for start in range(0, len(ids), 500):
+            batch = [(i,) for i in ids[start:start + 500]]
+            conn.executemany("DELETE FROM files WHERE id = ?", batch)
+            if self.has_trigram:
+                conn.executemany("DELETE FROM names WHERE rowid = ?", batch)
+                conn.executemany("DELETE FROM contents WHERE rowid = ?", batch)
+
+    @staticmethod
+    def _read_text(path: str) -> Optional[str]:
+        try:
+            with open(path, "rb") as f:
+                data = f.read(MAX_CONTENT_BYTES + 1)
+        except OSError:
+            return None
+        if len(data) > MAX_CONTENT_BYTES or b"\0" in data[:8192]:
+            return None
+        return data.decode("utf-8", errors="replace")
+
+    def _upsert(self, conn: sqlite3.Connection, root: str, content: bool, dirpath: str, name: str,
+                st: os.stat_result, known: Optional[tuple]):
+        if known is not None and known[1] == st.st_size and known[2] == st.st_mtime:
+            return False
+        if known is None:
+            file_id = conn.execute("INSERT INTO files(root, dir, name, size, mtime) VALUES (?, ?, ?, ?, ?)",
+                                   (root, dirpath, name, st.st_size, st.st_mtime)).lastrowid
+            if self.has_trigram:
+                conn.execute("INSERT INTO names(rowid, name) VALUES (?, ?)", (file_id, name))
+        else:
+            file_id = known[0]
+            conn.execute("UPDATE files SET size = ?, mtime = ? WHERE id = ?", (st.st_size, st.st_mtime, file_id))
+            if content:
+                conn.execute("DELETE FROM contents WHERE rowid = ?", (file_id,))
+        if content:
+            text = self._read_text(os.path.join(dirpath, name))
+            if text:
+                conn.execute("INSERT INTO contents(rowid, body) VALUES (?, ?)", (file_id, text))
+        return True
+
+    def _scan_dir(self, conn, root: str, content: bool, dirpath: str, recurse: bool, seen_dirs: set) -> int:
+        """Sync one directory's files with the index. Returns the number of rows changed."""
+        changed = uncommitted = 0
+        last_commit = time.monotonic()
+        stack = [dirpath]
+        while stack and not self._stop.is_set():
+            current = stack.pop()
+            seen_dirs.add(current)
+            known = {row[0]: row[1:] for row in conn.execute(
+                "SELECT name, id, size, mtime FROM files WHERE dir = ?", (current,))}
+            present = set()
+            try:
+                with os.scandir(current) as it:
+                    for entry in it:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if recurse and entry.name not in DEFAULT_EXCLUDES:
+                                    stack.append(entry.path)
+                                continue
+                            if not entry.is_file(follow_symlinks=False):
+                                continue
+                            present.add(entry.name)
+                            if self._upsert(conn, root, content, current, entry.name,
+                                            entry.stat(follow_symlinks=False), known.get(entry.name)):
+                                changed += 1
+                        except OSError:
+                            continue
+            except OSError:
+                pass
+            gone = [known[name][0] for name in known.keys() - present]
+            if gone:
+                self._delete_ids(conn, gone)
+            uncommitted += len(gone) + len(present)
+            changed += len(gone)
+            # Keep write transactions short so searches and root edits never wait long
+            if uncommitted >= COMMIT_EVERY or time.monotonic() - last_commit > 1:
+                conn.commit()
+                uncommitted, last_commit = 0, time.monotonic()
+        return changed
+
+    def scan(self, root: str) -> dict:
+        """Full mtime scan of one root: index new/changed files, drop deleted ones."""
+        info = next((r for r in self.roots() if r["root"] == root), None)
+        if info is None:
+            return {"error": f"Not an indexed root: {root}"}
+        conn = self._conn()
+        self._requested.discard(root)  # this scan covers any request queued before it
+        self.scanning = root
+        start = time.monotonic()
+        try:
+            seen_dirs: set = set()
+            changed = self._scan_dir(conn, root, info["content"], root, True, seen_dirs)
+            stale = [row[0] for row in conn.execute("SELECT DISTINCT dir FROM files WHERE root = ?", (root,))
+                     if row[0] not in seen_dirs]
+            for dirpath in stale:
+                ids = [r[0] for r in conn.execute("SELECT id FROM files WHERE dir = ?", (dirpath,))]
+                self._delete_ids(conn, ids)
+                changed += len(ids)
+            elapsed = round(time.monotonic() - start, 3)
+            conn.execute("UPDATE roots SET last_scan = ?, scan_seconds = ? WHERE root = ?", (time.time(), elapsed, root))
+            conn.commit()
+        finally:
+            self.scanning = None
+        return {"root": root, "changed": changed, "seconds": elapsed}
+
+    def refresh_path(self, path: str, recursive: bool = True):
+        """
+        Apply one change notification: re-index a file or directory (just its
+        own entries unless `recursive`), or drop whatever vanished.
+        """
+        info = self._root_of(path)
+        if info is None:
+            return
+        conn = self._conn()
+        if os.path.isdir(path):
+            self._scan_dir(conn, info["root"], info["content"], path, recursive, set())
+        elif os.path.isfile(path):
+            dirpath, name = os.path.split(path)
+            row = conn.execute("SELECT id, size, mtime FROM files WHERE dir = ? AND name = ?", (dirpath, name)).fetchone()
+            try:
+                self._upsert(conn, info["root"], info["content"], dirpath, name, os.stat(path), row)
+            except OSError:
+                pass
+        else:
+            dirpath, name = os.path.split(path)
+            prefix = path.rstrip(os.sep) + os.sep
+            ids = [r[0] for r in conn.execute(
+                "SELECT id FROM files WHERE (dir = ? AND name = ?) OR dir = ? OR substr(dir, 1, ?) = ?",
+                (dirpath, name, path, len(prefix), prefix))]
+            self._delete_ids(conn, ids)
+        conn.commit()
+
+    # ---------- background worker ----------
+
+    def start(self):
+        """Start the indexer thread (idempotent); no-op until a root is configured."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        if not self.roots():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="file-index", daemon=True)
+        self._thread.start()
+        self._restart_watch()
+
+    def stop(self):
+        self._stop.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer = None
+
+    def _restart_watch(self):
+        if not HAS_WATCHDOG:
+            return
+        if self._observer is not None:
+            self._observer.stop()
+        index = self
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                # A directory "modified" event only means its entry list changed
+                kind = "dir" if event.is_directory and event.event_type == "modified" else "path"
+                for path in (getattr(event, "src_path", None), getattr(event, "dest_path", None)):
+                    if path:
+                        index._queue.put((kind, os.path.abspath(path)))
+
+        observer = Observer()
+        for info in self.roots():
+            try:
+                observer.schedule(Handler(), info["root"], recursive=True)
+            except OSError:
+                pass
+        observer.daemon = True
+        observer.start()
+        self._observer = observer
+
+    def _run(self):
+        next_rescan = 0.0
+        while not self._stop.is_set():
+            if time.time() >= next_rescan:
+                for info in self.roots():
+                    try:
+                        self.scan(info["root"])
+                    except Exception as e:
+                        print(f"[Index] Scan of {info['root']} failed: {e}")
+                next_rescan = time.time() + RESCAN_INTERVAL
+            # Coalesce bursts of notifications (editors touch files several times)
+            pending = set()
+            try:
+                kind, target = self._queue.get(timeout=1)
+                pending.add((kind, target))
+                while True:
+                    pending.add(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            for kind, target in pending:
+                try:
+                    if kind == "scan":
+                        if target in self._requested:
+                            self.scan(target)
+                    else:
+                        self.refresh_path(target, recursive=(kind == "path"))
+                except Exception as e:
+                    print(f"[Index] Update of {target} failed: {e}")
+
+    # ---------- queries ----------
+
+    def search(self, query: str, mode: str = "name", root: Optional[str] = None, limit: int = 50) -> dict:
+        """
+        Find indexed files by name substring / glob (mode="name") or by text
+        they contain (mode="content", roots indexed with content=True).
+        """
+        start = time.perf_counter()
+        limit = max(1, min(int(limit), 1000))
+        conn = self._conn()
+        root_filter, args = "", []
+        if root:
+            root_filter, args = " AND f.root = ?", [os.path.abspath(root)]
+
+        if mode == "name":
+            if any(c in query for c in "*?["):
+                sql = f"SELECT f.dir, f.name, f.size, f.mtime FROM files f WHERE lower(f.name) GLOB ?{root_filter} LIMIT ?"
+                params = [query.lower()] + args + [limit]
+            elif self.has_trigram and len(query) >= 3:
+                sql = (f"SELECT f.dir, f.name, f.size, f.mtime FROM names JOIN files f ON f.id = names.rowid "
+                       f"WHERE names MATCH ?{root_filter} LIMIT ?")
+                params = [_fts_literal(query)] + args + [limit]
+            else:
+                sql = f"SELECT f.dir, f.name, f.size, f.mtime FROM files f WHERE f.name LIKE ? ESCAPE '\\'{root_filter} LIMIT ?"
+                escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+                params = [f"%{escaped}%"] + args + [limit]
+            rows = conn.execute(sql, params).fetchall()
+            results = [{"path": os.path.join(d, n), "size": s, "mtime": m} for d, n, s, m in rows]
+        elif mode == "content":
+            if not self.has_trigram:
+                return {"error": "Content search needs SQLite with the FTS5 trigram tokenizer"}
+            if len(query) < 3:
+                return {"error": "Content queries need at least 3 characters"}
+            rows = conn.execute(
+                f"SELECT f.dir, f.name, f.size, f.mtime, snippet(contents, 0, '[', ']', '...', 12) "
+                f"FROM contents JOIN files f ON f.id = contents.rowid WHERE contents MATCH ?{root_filter} LIMIT ?",
+                [_fts_literal(query)] + args + [limit]).fetchall()
+            results = [{"path": os.path.join(d, n), "size": s, "mtime": m, "snippet": snip}
+                       for d, n, s, m, snip in rows]
+        else:
+            return {"error": f"Unknown search mode '{mode}' (use 'name' or 'content')"}
+
+        return {
+            "query": query,
+            "mode": mode,
+            "results": results,
+            "count": len(results),
+            "took_ms": round((time.perf_counter() - start) * 1000, 2),
+            "scanning": self.scanning,
+        }
+
+    def status(self) -> dict:
+        conn = self._conn()
+        roots = self.roots()
+        for info in roots:
+            info["files"] = conn.execute("SELECT COUNT(*) FROM files WHERE root = ?", (info["root"],)).fetchone()[0]
+        return {
+            "roots": roots,
+            "running": self._thread is not None and self._thread.is_alive(),
+            "scanning": self.scanning,
+            "watching": self._observer is not None,
+            "trigram": self.has_trigram,
+            "db": str(self.db_path),
+        }
+
+
+# Global instance (created lazily: the database is only touched once the index is used)
+_file_index: Optional[FileIndex] = None
+_file_index_lock = threading.Lock()
+
+
+def get_file_index() -> FileIndex:
+    global _file_index
+    with _file_index_lock:
+        if _file_index is None:
+            _file_index = FileIndex()
+        return _file_index
@@ -0,0 +1,249 @@
+"""
+Bridge MCP - Delta Directory Sync
+=================================
+rsync-style transfer of a directory tree from the relay to an agent.
+
+1. The relay sends the size/mtime of every source file (sync_plan).
+   The agent answers "same", "missing", or, for changed files, the
+   block signatures of its copy: a rolling weak checksum (Adler-32)
+   plus a strong hash per block.
+2. The relay slides a window over its version of each changed file and
+   finds blocks the agent already has (compute_delta), so only the
+   changed bytes go over the wire as literals.
+3. The agent rebuilds the file from its old blocks plus the literals,
+   checks the SHA-256, replaces it atomically and sets the source mtime
+   so the next sync's quick check matches (apply_delta).
+
+Both sides import this module.
+"""
+
+import base64
+import fnmatch
+import hashlib
+import os
+import zlib
+from typing import Dict, List, Optional
+
+DEFAULT_BLOCK_SIZE = 4096
+ADLER_MOD = 65521
+COPY_BLOCK = 1024 * 1024
+SYNC_SUFFIX = ".bridge-sync"
+
+
+def strong_hash(block: bytes) -> bytes:
+    return hashlib.blake2b(block, digest_size=16).digest()
+
+
+def roll(weak: int, out_byte: int, in_byte: int, block_size: int) -> int:
+    """Slide an Adler-32 window one byte: drop `out_byte`, append `in_byte`."""
+    a = weak & 0xFFFF
+    b = weak >> 16
+    a = (a - out_byte + in_byte) % ADLER_MOD
+    b = (b - block_size * out_byte + a - 1) % ADLER_MOD
+    return (b << 16) | a
+
+
+def _as_bytes(data) -> bytes:
+    if isinstance(data, (bytes, bytearray)):
+        return bytes(data)
+    return base64.b64decode(data)
+
+
+def local_path(root: str, rel: str) -> str:
+    """Map a "/"-separated relative path onto `root`, refusing to leave it."""
+    path = os.path.normpath(os.path.join(root, *rel.split("/")))
+    if os.path.commonpath([os.path.abspath(root), os.path.abspath(path)]) != os.path.abspath(root):
+        raise ValueError(f"Path escapes sync root: {rel}")
+    return path
+
+
+def scan_tree(root: str, exclude: Optional[List[str]] = None) -> Dict[str, list]:
+    """{relative "/" path: [size, mtime]} for every file under root."""
+    exclude = exclude or []
+    files = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        rel_dir = os.path.relpath(dirpath, root).replace(os.sep, "/")
+        rel_dir = "" if rel_dir == "." else rel_dir + "/"
+        dirnames[:] = [d for d in dirnames if not any(fnmatch.fnmatch(rel_dir + d, p) or fnmatch.fnmatch(d, p)
+                                                      for p in exclude)]
+        for name in filenames:
+            rel = rel_dir + name
+            if name.endswith(SYNC_SUFFIX) or any(fnmatch.fnmatch(rel, p) or fnmatch.fnmatch(name, p)
+                                                 for p in exclude):
+                continue
+            try:
+                st = os.stat(os.path.join(dirpath, name))
+            except OSError:
+                continue
+            files[rel] = [st.st_size, st.st_mtime]
+    return files
+
+
+def block_signatures(path: str, block_size: int = DEFAULT_BLOCK_SIZE) -> list:
+    """[[weak, strong], ...] for each block of a file (the last may be short)."""
+    signatures = []
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            signatures.append([zlib.adler32(block), strong_hash(block)])
+    return signatures
+
+
+def sync_plan(directory: str, files: Dict[str, list], block_size: int = DEFAULT_BLOCK_SIZE,
+              checksum: bool = False, exclude: Optional[List[str]] = None,
+              delta_max: Optional[int] = None) -> dict:
+    """
+    Agent side: compare the relay's {path: [size, mtime]} with `directory`.
+    Files whose size and mtime match are "same" (unless checksum=True);
+    changed files come back with block signatures for delta transfer,
+    except those over `delta_max` bytes, which the relay sends whole.
+    Files only present on the agent are listed in "extra".
+    """
+    plan = {}
+    for rel, (size, mtime) in files.items():
+        path = local_path(directory, rel)
+        try:
+            st = os.stat(path)
+        except OSError:
+            plan[rel] = {"status": "missing"}
+            continue
+        if not checksum and st.st_size == size and abs(st.st_mtime - mtime) < 0.001:
+            plan[rel] = {"status": "same"}
+        elif delta_max is not None and size > delta_max:
+            plan[rel] = {"status": "changed", "size": st.st_size}
+        else:
+            plan[rel] = {"status": "changed", "size": st.st_size,
+                         "signatures": block_signatures(path, block_size)}
+    extra = []
+    if os.path.isdir(directory):
+        extra = sorted(set(scan_tree(directory, exclude)) - set(files))
+    return {"directory": directory, "block_size": block_size, "files": plan, "extra": extra}
+
+
+def compute_delta(path: str, signatures: list, base_size: int, block_size: int = DEFAULT_BLOCK_SIZE,
+                  max_literal: Optional[int] = None) -> Optional[dict]:
+    """
+    Relay side: encode `path` as ops against the signatures of the agent's
+    copy (`base_size` bytes).
+    Ops are [first_block, count] (copy from the agent's copy) or bytes
+    (literal data). Returns None once literals exceed `max_literal`, i.e.
+    the file is mostly new and is better sent whole.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    n = len(data)
+    table: Dict[int, Dict[bytes, int]] = {}
+    partial = None
+    for index, (weak, strong) in enumerate(signatures):
+        strong = _as_bytes(strong)
+        if (index + 1) * block_size > base_size:
+            # Only the final block can be short; it can only match the source's tail
+            partial = (index, strong, base_size - index * block_size)
+            continue
+        table.setdefault(weak, {}).setdefault(strong, index)
+
+    ops: list = []
+    literal = 0
+    i = lit_start = 0
+
+    def copy(index: int):
+        if ops and isinstance(ops[-1], list) and ops[-1][0] + ops[-1][1] == index:
+            ops[-1][1] += 1
+        else:
+            ops.append([index, 1])
+
+    weak = zlib.adler32(data[:block_size]) if n >= block_size else None
+    while i + block_size <= n:
+        candidates = table.get(weak)
+        if candidates:
+            index = candidates.get(strong_hash(data[i:i + block_size]))
+            if index is not None:
+                if lit_start < i:
+                    ops.append(data[lit_start:i])
+                    literal += i - lit_start
+                copy(index)
+                i += block_size
+                lit_start = i
+                if i + block_size <= n:
+                    weak = zlib.adler32(data[i:i + block_size])
+                continue
+        if max_literal is not None and i - lit_start + literal > max_literal:
+            return None
+        if i + block_size < n:
+            weak = roll(weak, data[i], data[i + block_size], block_size)
+        i += 1
+
+    # Tail shorter than a block: may equal the agent's (short) last block
+    tail_start = n
+    if partial is not None and n - lit_start >= partial[2] and strong_hash(data[n - partial[2]:]) == partial[1]:
+        tail_start = n - partial[2]
+    if lit_start < tail_start:
+        ops.append(data[lit_start:tail_start])
+        literal += tail_start - lit_start
+    if tail_start < n:
+        copy(partial[0])
+    if max_literal is not None and literal > max_literal:
+        return None
+    return {"ops": ops, "literal_bytes": literal, "size": n,
+            "sha256": hashlib.sha256(data).hexdigest()}
+
+
+def apply_delta(directory: str, rel: str, ops: list, size: int, sha256: str,
+                mtime: Optional[float] = None, block_size: int = DEFAULT_BLOCK_SIZE) -> dict:
+    """
+    Agent side: rebuild `rel` from its current blocks plus literal data,
+    verify size and SHA-256, then replace it atomically.
+    """
+    path = local_path(directory, rel)
+    tmp = path + SYNC_SUFFIX
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    digest = hashlib.sha256()
+    written = 0
+    base = open(path, "rb") if os.path.exists(path) else None
+    try:
+        with open(tmp, "wb") as out:
+            for op in ops:
+                if isinstance(op, (list, tuple)):
+                    if base is None:
+                        raise ValueError(f"Copy op for {rel} but no existing file")
+                    first, count = op
+                    base.seek(first * block_size)
+                    remaining = count * block_size
+                    while remaining:
+                        piece = base.read(min(remaining, COPY_BLOCK))
+                        if not piece:
+                            break
+                        out.write(piece)
+                        digest.update(piece)
+                        written += len(piece)
+                        remaining -= len(piece)
+                else:
+                    piece = _as_bytes(op)
+                    out.write(piece)
+                    digest.update(piece)
+                    written += len(piece)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    finally:
+        if base is not None:
+            base.close()
+
+    if written != size or digest.hexdigest() != sha256:
+        os.remove(tmp)
+        return {"error": f"Reconstructed {rel} does not match the source", "path": rel}
+    os.replace(tmp, path)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+    return {"path": rel, "status": "synced", "size": size}
+
+
+def delete_files(directory: str, paths: List[str]) -> dict:
+    """Agent side: remove files that no longer exist in the source tree."""
+    deleted, errors = [], {}
+    for rel in paths:
+        try:
+            os.remove(local_path(directory, rel))
+            deleted.append(rel)
+        except (OSError, ValueError) as e:
+            errors[rel] = str(e)
+    return {"deleted": deleted, "errors": errors}
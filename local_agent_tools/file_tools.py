@@ -0,0 +1,483 @@
+"""
+Bridge MCP - File Tools
+=======================
+File access for the local agent that stays cheap on huge files.
+
+Reads are bounded: a call returns at most MAX_READ_BYTES, plus the size,
+mtime and next offset so callers can page through a multi-GB log one
+window at a time. Line ranges are located with a memory-mapped newline
+scan instead of decoding the whole file.
+
+Edits are patches (unified diff or line/string edits) guarded by the
+file's SHA-256 and written atomically, so only the change crosses the wire.
+"""
+
+import base64
+import codecs
+import fnmatch
+import hashlib
+import heapq
+import json
+import mmap
+import os
+import re
+import stat
+import tempfile
+from typing import Iterator, List, Optional, Sequence
+
+MAX_READ_BYTES = 4 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+BINARY_SNIFF_BYTES = 8192
+
+
+def file_meta(path: str, st: os.stat_result = None) -> dict:
+    """Size / mtime fields included in every file response."""
+    st = st or os.stat(path)
+    return {"path": path, "size": st.st_size, "mtime": st.st_mtime}
+
+
+def is_binary(f) -> bool:
+    """Heuristic (same as git's): a NUL byte near the start means binary."""
+    pos = f.tell()
+    f.seek(0)
+    sample = f.read(BINARY_SNIFF_BYTES)
+    f.seek(pos)
+    return b"\0" in sample
+
+
+def _skip_lines(mm: mmap.mmap, count: int, pos: int = 0) -> int:
+    """Byte offset `count` lines after `pos` (file size if past the end)."""
+    size = len(mm)
+    # Skip whole blocks by counting their newlines, then walk the last one
+    while count and pos < size:
+        block_end = min(pos + CHUNK_SIZE, size)
+        newlines = mm[pos:block_end].count(b"\n")
+        if newlines >= count:
+            break
+        count -= newlines
+        pos = block_end
+    for _ in range(count):
+        nl = mm.find(b"\n", pos)
+        if nl < 0:
+            return len(mm)
+        pos = nl + 1
+    return pos
+
+
+def _tail_offset(f, size: int, count: int) -> int:
+    """Byte offset where the last `count` lines start, scanning backwards in chunks."""
+    pos = size
+    f.seek(max(size - 1, 0))
+    # A trailing newline ends the last line rather than starting an empty one
+    if size and f.read(1) == b"\n":
+        pos -= 1
+    seen = 0
+    while pos > 0:
+        start = max(pos - CHUNK_SIZE, 0)
+        f.seek(start)
+        block = f.read(pos - start)
+        idx = len(block)
+        while True:
+            idx = block.rfind(b"\n", 0, idx)
+            if idx < 0:
+                break
+            seen += 1
+            if seen == count:
+                return start + idx + 1
+        pos = start
+    return 0
+
+
+def read_file(path: str, offset: Optional[int] = None, length: Optional[int] = None,
+              lines: Optional[Sequence[int]] = None, tail: Optional[int] = None,
+              encoding: str = "utf-8", binary: bool = False,
+              max_bytes: int = MAX_READ_BYTES) -> dict:
+    """
+    Read part of a file.
+
+    Modes (pick one; default is from the start):
+    - offset/length: byte range
+    - lines=[start, end]: 1-based inclusive line range (end omitted/None = to EOF)
+    - tail=N: the last N lines
+
+    At most `max_bytes` are returned per call. Text comes back as "content";
+    binary files (or binary=True) as raw bytes in "data". The response
+    carries size, mtime, offset, length, next_offset and eof for paging.
+    """
+    max_bytes = max(1, min(int(max_bytes), MAX_READ_BYTES))
+    with open(path, "rb") as f:
+        st = os.fstat(f.fileno())
+        size = st.st_size
+        result = file_meta(path, st)
+
+        end = None
+        if tail is not None:
+            start = _tail_offset(f, size, max(int(tail), 1))
+        elif lines:
+            first = max(int(lines[0]), 1)
+            last = lines[1] if len(lines) > 1 else None
+            if last is not None and int(last) < first:
+                return {"error": f"Bad line range {lines[0]}-{last}: end is before start"}
+            if size:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    start = _skip_lines(mm, first - 1)
+                    if last is not None and int(last) >= first:
+                        end = _skip_lines(mm, int(last) - first + 1, start)
+            else:
+                start = 0
+            result["lines"] = [first, last]
+        else:
+            start = min(max(int(offset or 0), 0), size)
+            if length is not None:
+                end = start + max(int(length), 0)
+
+        end = min(size if end is None else end, size)
+        count = min(end - start, max_bytes)
+        f.seek(start)
+        chunk = f.read(count)
+        as_binary = binary or is_binary(f)
+        if not as_binary:
+            decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+            content = decoder.decode(chunk, final=start + len(chunk) >= size)
+            # A page smaller than one character is extended to hold it whole
+            while not content and decoder.getstate()[0] and start + len(chunk) < size:
+                extra = f.read(1)
+                chunk += extra
+                content = decoder.decode(extra, final=start + len(chunk) >= size)
+
+    next_offset = start + len(chunk)
+    if as_binary:
+        result["data"] = chunk
+        result["binary"] = True
+    else:
+        result["content"] = content
+        # Don't split a multi-byte character across pages: resume at its first byte
+        next_offset -= len(decoder.getstate()[0])
+    if start == 0 and len(chunk) == size:
+        # Whole file: the hash to pass as file_patch's expected_sha256
+        result["sha256"] = hashlib.sha256(chunk).hexdigest()
+    result.update({
+        "offset": start,
+        "length": next_offset - start,
+        "next_offset": next_offset,
+        "eof": next_offset >= size,
+        "truncated": next_offset < end,
+    })
+    return result
+
+
+# ---------- listing ----------
+
+LIST_SORT_KEYS = ("name", "path", "size", "mtime")
+DEFAULT_LIST_LIMIT = 1000
+MAX_LIST_LIMIT = 10000
+
+
+def _is_hidden(entry: os.DirEntry) -> bool:
+    if entry.name.startswith("."):
+        return True
+    attributes = getattr(entry.stat(follow_symlinks=False), "st_file_attributes", 0)
+    return bool(attributes & getattr(stat, "FILE_ATTRIBUTE_HIDDEN", 0))
+
+
+def walk_entries(directory: str, depth: int = 0, include_hidden: bool = True) -> Iterator[tuple]:
+    """(relative "/" path, DirEntry) for everything under `directory`, `depth` levels down (-1 = all)."""
+    stack = [("", directory, 0)]
+    while stack:
+        prefix, path, level = stack.pop()
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    if not include_hidden and _is_hidden(entry):
+                        continue
+                    rel = prefix + entry.name
+                    yield rel, entry
+                    if (depth < 0 or level < depth) and entry.is_dir(follow_symlinks=False):
+                        stack.append((rel + "/", entry.path, level + 1))
+        except OSError:
+            if not prefix:
+                raise  # the listed directory itself is unreadable
+            continue  # skip unreadable subdirectories
+
+
+def _entry_info(rel: str, entry: os.DirEntry) -> dict:
+    # DirEntry caches its stat (and on Windows it comes free with the listing)
+    st = entry.stat(follow_symlinks=False)
+    if entry.is_symlink():
+        kind = "link"
+    elif entry.is_dir(follow_symlinks=False):
+        kind = "dir"
+    else:
+        kind = "file"
+    info = {"name": entry.name, "path": rel, "type": kind, "mtime": st.st_mtime}
+    if kind != "dir":
+        info["size"] = st.st_size
+    return info
+
+
+def _sort_value(rel: str, entry: os.DirEntry, sort: str):
+    if sort == "name":
+        return entry.name.lower()
+    if sort == "path":
+        return rel.lower()
+    st = entry.stat(follow_symlinks=False)
+    if sort == "size":
+        return 0 if entry.is_dir(follow_symlinks=False) else st.st_size
+    return st.st_mtime
+
+
+def list_directory(directory: str, depth: int = 0, pattern: Optional[str] = None,
+                   extensions: Optional[List[str]] = None, entry_type: Optional[str] = None,
+                   include_hidden: bool = True, sort: str = "name", reverse: bool = False,
+                   limit: int = DEFAULT_LIST_LIMIT, cursor: Optional[str] = None) -> dict:
+    """
+    List a directory (optionally recursively) with type, size and mtime.
+
+    Filters: `pattern` (glob on the name), `extensions` ([".py", "txt"]),
+    `entry_type` ("file" / "dir" / "link"), `include_hidden`.
+    Pages are `limit` entries in `sort` order; pass the returned
+    `next_cursor` to get the next page. Each page is one scandir pass
+    that keeps only `limit` entries in memory (keyset pagination), so
+    huge directories stay cheap and pages stay consistent if files change.
+    """
+    if sort not in LIST_SORT_KEYS:
+        return {"error": f"Unknown sort '{sort}' (use one of {', '.join(LIST_SORT_KEYS)})"}
+    limit = max(1, min(int(limit), MAX_LIST_LIMIT))
+    exts = {e.lower() if e.startswith(".") else "." + e.lower() for e in extensions or []}
+    after = json.loads(base64.urlsafe_b64decode(cursor.encode())) if cursor else None
+    if after is not None:
+        after = tuple(after)
+
+    def candidates():
+        for rel, entry in walk_entries(directory, depth, include_hidden):
+            if pattern and not fnmatch.fnmatch(entry.name, pattern):
+                continue
+            if exts and os.path.splitext(entry.name)[1].lower() not in exts:
+                continue
+            if entry_type:
+                kind = "link" if entry.is_symlink() else "dir" if entry.is_dir(follow_symlinks=False) else "file"
+                if kind != entry_type:
+                    continue
+            key = (_sort_value(rel, entry, sort), rel)
+            if after is not None and (key <= after if not reverse else key >= after):
+                continue
+            yield key, rel, entry
+
+    total = 0
+
+    def counted(items):
+        nonlocal total
+        for item in items:
+            total += 1
+            yield item
+
+    select = heapq.nlargest if reverse else heapq.nsmallest
+    page = select(limit + 1, counted(candidates()), key=lambda item: item[0])
+    more = len(page) > limit
+    page = page[:limit]
+
+    result = {
+        "directory": directory,
+        "entries": [_entry_info(rel, entry) for _, rel, entry in page],
+        "count": len(page),
+        "remaining": total - len(page),
+        "next_cursor": None,
+    }
+    if more:
+        last = list(page[-1][0])
+        result["next_cursor"] = base64.urlsafe_b64encode(json.dumps(last).encode()).decode()
+    return result
+
+
+# ---------- patching ----------
+
+HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+LINE_BREAK = re.compile(r"\r?\n")
+
+
+class PatchError(ValueError):
+    """A patch that does not apply to the current file."""
+
+
+def atomic_write(path: str, data: bytes):
+    """Write via a temp file in the same directory and os.replace (keeps the file mode)."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix=".bridge-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.chmod(tmp, os.stat(path).st_mode & 0o7777)
+        except OSError:
+            pass
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def split_lines(text: str) -> List[str]:
+    """
+    Lines split on \\n / \\r\\n only (str.splitlines also breaks on form
+    feeds, \\x1c-\\x1e, \\x85 and \\u2028); a final newline ends the last line.
+    """
+    lines = LINE_BREAK.split(text)
+    if lines[-1] == "":
+        lines.pop()
+    return lines
+
+
+def parse_unified_diff(diff: str) -> List[dict]:
+    """Hunks of a single-file unified diff: {"old_start", "old": [...], "new": [...]}."""
+    hunks = []
+    hunk = None
+    for line in split_lines(diff):
+        match = HUNK_HEADER.match(line)
+        if match:
+            old_count = int(match.group(2)) if match.group(2) is not None else 1
+            hunk = {"old_start": int(match.group(1)), "old_count": old_count, "old": [], "new": [],
+                    "added": 0, "removed": 0}
+            hunks.append(hunk)
+        elif hunk is None or line.startswith(("--- ", "+++ ", "diff ", "index ")):
+            continue
+        elif line.startswith("\\"):
+            continue  # "\ No newline at end of file"
+        elif line.startswith("-"):
+            hunk["old"].append(line[1:])
+            hunk["removed"] += 1
+        elif line.startswith("+"):
+            hunk["new"].append(line[1:])
+            hunk["added"] += 1
+        else:
+            # Context (a blank line is context whose leading space was stripped)
+            hunk["old"].append(line[1:])
+            hunk["new"].append(line[1:])
+    if not hunks:
+        raise PatchError("No hunks found in diff")
+    return hunks
+
+
+def _find_block(lines: List[str], block: List[str], expected: int) -> int:
+    """Index where `block` occurs, nearest to `expected` first (like patch's offset search)."""
+    if not block:
+        return min(max(expected, 0), len(lines))
+    limit = len(lines) - len(block)
+    for distance in range(0, max(expected, limit - expected, 0) + 1):
+        for pos in (expected - distance, expected + distance) if distance else (expected,):
+            if 0 <= pos <= limit and lines[pos:pos + len(block)] == block:
+                return pos
+    return -1
+
+
+def apply_unified_diff(lines: List[str], diff: str) -> tuple:
+    """Apply a unified diff to a list of lines. Returns (lines, hunks, added, removed)."""
+    added = removed = 0
+    offset = 0
+    hunks = parse_unified_diff(diff)
+    for number, hunk in enumerate(hunks, 1):
+        # "-l,0" means insert after line l; otherwise the hunk starts at line l
+        expected = hunk["old_start"] + offset - (0 if hunk["old_count"] == 0 else 1)
+        pos = _find_block(lines, hunk["old"], expected)
+        if pos < 0:
+            raise PatchError(f"Hunk {number} (@@ -{hunk['old_start']}) does not apply: context not found")
+        lines[pos:pos + len(hunk["old"])] = hunk["new"]
+        offset += pos - expected + len(hunk["new"]) - len(hunk["old"])
+        added += hunk["added"]
+        removed += hunk["removed"]
+    return lines, len(hunks), added, removed
+
+
+def apply_edits(lines: List[str], edits: List[dict]) -> tuple:
+    """
+    Apply edits to a list of lines. Returns (lines, added, removed).
+
+    - {"start_line": a, "end_line": b, "content": "..."} replaces lines a..b
+      (1-based, inclusive; end_line = a - 1 inserts before line a). Line
+      numbers refer to the file before any edit; ranges must not overlap.
+    - {"old": "...", "new": "..."} replaces one exact, unique occurrence,
+      applied in order after the line edits.
+    """
+    added = removed = 0
+    ranged = sorted((e for e in edits if "start_line" in e), key=lambda e: e["start_line"], reverse=True)
+    floor = len(lines) + 1
+    for edit in ranged:
+        start = int(edit["start_line"])
+        end = int(edit.get("end_line", start))
+        if start < 1 or end < start - 1 or end > len(lines) or end >= floor:
+            raise PatchError(f"Bad or overlapping line range {start}-{end} (file has {len(lines)} lines)")
+        new = split_lines(edit.get("content", ""))
+        lines[start - 1:end] = new
+        added += len(new)
+        removed += end - start + 1
+        floor = start
+
+    text = "\n".join(lines)
+    for edit in edits:
+        if "start_line" in edit:
+            continue
+        if "old" not in edit:
+            raise PatchError(f"Edit needs start_line or old: {edit}")
+        old = edit["old"].replace("\r\n", "\n")
+        count = text.count(old) if old else 0
+        if count != 1:
+            raise PatchError(f"'old' text must occur exactly once (found {count}): {old[:80]!r}")
+        new = edit.get("new", "").replace("\r\n", "\n")
+        text = text.replace(old, new, 1)
+        added += new.count("\n") + 1
+        removed += old.count("\n") + 1
+    return text.split("\n") if lines or text else [], added, removed
+
+
+def patch_file(path: str, diff: Optional[str] = None, edits: Optional[List[dict]] = None,
+               expected_sha256: Optional[str] = None, encoding: str = "utf-8",
+               dry_run: bool = False) -> dict:
+    """
+    Apply a unified diff or a list of edits to a text file in place.
+
+    If `expected_sha256` is given and the file has changed since, nothing
+    is written and the current hash is returned (a conflict). The file's
+    line endings and trailing newline are kept. The result is written
+    atomically and its new hash returned for the next patch.
+    """
+    if bool(diff) == bool(edits):
+        return {"error": "Pass exactly one of diff or edits"}
+    with open(path, "rb") as f:
+        raw = f.read()
+    current = hashlib.sha256(raw).hexdigest()
+    if expected_sha256 and expected_sha256.lower() != current:
+        return {"error": "File changed since it was read (sha256 mismatch)", "conflict": True,
+                "expected_sha256": expected_sha256, "sha256": current}
+    try:
+        text = raw.decode(encoding)
+    except UnicodeDecodeError:
+        return {"error": f"File is not valid {encoding} text"}
+
+    newline = "\r\n" if "\r\n" in text else "\n"
+    trailing = text.endswith("\n") or not text
+    lines = split_lines(text)
+    try:
+        if diff:
+            lines, hunks, added, removed = apply_unified_diff(lines, diff.replace("\r\n", "\n"))
+        else:
+            hunks = len(edits)
+            lines, added, removed = apply_edits(lines, edits)
+    except PatchError as e:
+        return {"error": str(e), "sha256": current}
+
+    out = newline.join(lines) + (newline if trailing and lines else "")
+    data = out.encode(encoding)
+    result = {"path": path, "previous_sha256": current, "sha256": hashlib.sha256(data).hexdigest(),
+              "size": len(data), "hunks": hunks, "lines_added": added, "lines_removed": removed}
+    if dry_run:
+        result["status"] = "dry_run"
+        return result
+    if data != raw:
+        atomic_write(path, data)
+    result["status"] = "patched" if data != raw else "unchanged"
+    result["mtime"] = os.stat(path).st_mtime
+    return result
@@ -0,0 +1,208 @@
+"""
+Bridge MCP - Chunked File Transfer
+==================================
+Resumable, verified uploads and downloads in fixed-size chunks.
+
+Upload:   upload_begin -> upload_chunk (any order, in parallel) -> upload_finish
+Download: download_begin -> download_chunk (any order, in parallel)
+
+Uploads are written into "<path>.bridge-part" next to the target, with a
+"<path>.bridge-part.json" manifest listing the chunks received so far.
+Calling upload_begin again with the same file resumes where it stopped.
+Each chunk carries a SHA-256; the whole file is checked before it is
+moved into place. Nothing is ever held in memory beyond one chunk.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, Optional
+
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+MAX_CHUNK_SIZE = 16 * 1024 * 1024
+HASH_BLOCK = 1024 * 1024
+PART_SUFFIX = ".bridge-part"
+
+
+def sha256_file(path: str) -> str:
+    """Whole-file SHA-256, streamed."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_count(size: int, chunk_size: int) -> int:
+    return max(1, -(-size // chunk_size))
+
+
+def _chunk_size(chunk_size: Optional[int]) -> int:
+    return max(64 * 1024, min(int(chunk_size or DEFAULT_CHUNK_SIZE), MAX_CHUNK_SIZE))
+
+
+def _as_bytes(data) -> bytes:
+    """Chunk payloads arrive raw (msgpack) or base64 (JSON)."""
+    if isinstance(data, (bytes, bytearray)):
+        return bytes(data)
+    return base64.b64decode(data)
+
+
+class FileTransfers:
+    """Upload state (manifests on disk, cached here) and download chunk reads."""
+
+    def __init__(self):
+        self._uploads: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    # ---------- upload ----------
+
+    @staticmethod
+    def _save_manifest(upload: dict):
+        manifest = upload["part"] + ".json"
+        tmp = manifest + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "upload_id": upload["upload_id"], "path": upload["path"], "size": upload["size"],
+                "sha256": upload["sha256"], "chunk_size": upload["chunk_size"],
+                "received": sorted(upload["received"]),
+            }, f)
+        os.replace(tmp, manifest)
+
+    def upload_begin(self, path: str, size: int, sha256: str, chunk_size: Optional[int] = None,
+                     mtime: Optional[float] = None) -> dict:
+        """
+        Start (or resume) an upload of a file with the given size and hash.
+        Returns the upload id, chunk layout and the chunks already received.
+        `mtime`, if given, is applied to the finished file.
+        """
+        path = os.path.abspath(path)
+        chunk_size = _chunk_size(chunk_size)
+        upload_id = hashlib.sha256(f"{path}|{size}|{sha256}|{chunk_size}".encode()).hexdigest()[:16]
+        part = path + PART_SUFFIX
+
+        with self._lock:
+            upload = self._uploads.get(upload_id)
+            if upload is None:
+                received = []
+                try:
+                    with open(part + ".json", encoding="utf-8") as f:
+                        saved = json.load(f)
+                    if saved.get("upload_id") == upload_id and os.path.getsize(part) == size:
+                        received = saved.get("received", [])
+                except (OSError, ValueError):
+                    pass
+                if not received:
+                    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                    with open(part, "wb") as f:
+                        f.truncate(size)
+                upload = {
+                    "upload_id": upload_id, "path": path, "part": part, "size": size,
+                    "sha256": sha256.lower(), "chunk_size": chunk_size, "received": set(received),
+                    "mtime": mtime, "lock": threading.Lock(),
+                }
+                self._save_manifest(upload)
+                self._uploads[upload_id] = upload
+
+        return {
+            "upload_id": upload_id,
+            "chunk_size": chunk_size,
+            "chunks": chunk_count(size, chunk_size),
+            "received": sorted(upload["received"]),
+        }
+
+    def _get_upload(self, upload_id: str) -> dict:
+        upload = self._uploads.get(upload_id)
+        if upload is None:
+            raise KeyError(f"Unknown upload '{upload_id}' (call upload_begin to resume)")
+        return upload
+
+    def upload_chunk(self, upload_id: str, index: int, data, sha256: Optional[str] = None) -> dict:
+        """Verify one chunk and write it at its offset in the part file."""
+        upload = self._get_upload(upload_id)
+        data = _as_bytes(data)
+        offset = index * upload["chunk_size"]
+        expected = min(upload["chunk_size"], upload["size"] - offset)
+        if index < 0 or index >= chunk_count(upload["size"], upload["chunk_size"]) or len(data) != max(expected, 0):
+            return {"error": f"Chunk {index} has {len(data)} bytes, expected {expected}"}
+        if sha256 and hashlib.sha256(data).hexdigest() != sha256.lower():
+            return {"error": f"Checksum mismatch on chunk {index}", "index": index}
+
+        # Chunks cover disjoint ranges, so parallel writers each use their own handle
+        with open(upload["part"], "r+b") as f:
+            f.seek(offset)
+            f.write(data)
+        with upload["lock"]:
+            upload["received"].add(index)
+            self._save_manifest(upload)
+        return {"index": index, "received": len(upload["received"])}
+
+    def upload_finish(self, upload_id: str) -> dict:
+        """Check every chunk arrived and the whole-file hash matches, then move into place."""
+        upload = self._get_upload(upload_id)
+        missing = sorted(set(range(chunk_count(upload["size"], upload["chunk_size"]))) - upload["received"])
+        if missing:
+            return {"error": f"{len(missing)} chunks missing", "missing": missing[:100]}
+        actual = sha256_file(upload["part"])
+        if actual != upload["sha256"]:
+            # Start over on the next upload_begin
+            self.upload_abort(upload_id)
+            return {"error": "Whole-file checksum mismatch", "expected": upload["sha256"], "actual": actual}
+        os.replace(upload["part"], upload["path"])
+        if upload["mtime"] is not None:
+            os.utime(upload["path"], (upload["mtime"], upload["mtime"]))
+        with self._lock:
+            self._uploads.pop(upload_id, None)
+        try:
+            os.remove(upload["part"] + ".json")
+        except OSError:
+            pass
+        return {"status": "uploaded", "path": upload["path"], "size": upload["size"], "sha256": actual}
+
+    def upload_abort(self, upload_id: str) -> dict:
+        """Drop an upload and its partial file."""
+        with self._lock:
+            upload = self._uploads.pop(upload_id, None)
+        if upload is None:
+            return {"error": f"Unknown upload '{upload_id}'"}
+        for leftover in (upload["part"], upload["part"] + ".json"):
+            try:
+                os.remove(leftover)
+            except OSError:
+                pass
+        return {"status": "aborted", "upload_id": upload_id}
+
+    # ---------- download ----------
+
+    @staticmethod
+    def download_begin(path: str, chunk_size: Optional[int] = None) -> dict:
+        """Size, mtime, whole-file hash and chunk layout of a file to download."""
+        chunk_size = _chunk_size(chunk_size)
+        st = os.stat(path)
+        return {
+            "path": path,
+            "size": st.st_size,
+            "mtime": st.st_mtime,
+            "sha256": sha256_file(path),
+            "chunk_size": chunk_size,
+            "chunks": chunk_count(st.st_size, chunk_size),
+        }
+
+    @staticmethod
+    def download_chunk(path: str, index: int, chunk_size: Optional[int] = None,
+                       mtime: Optional[float] = None) -> dict:
+        """One chunk of a file (raw bytes) with its SHA-256."""
+        chunk_size = _chunk_size(chunk_size)
+        with open(path, "rb") as f:
+            if mtime is not None and os.fstat(f.fileno()).st_mtime != mtime:
+                return {"error": "File changed during download", "changed": True}
+            f.seek(index * chunk_size)
+            data = f.read(chunk_size)
+        return {"index": index, "offset": index * chunk_size, "data": data,
+                "sha256": hashlib.sha256(data).hexdigest()}
+
+
+# Global instance
+file_transfers = FileTransfers()
@@ -105,14 +105,15 @@ class BrowserManager:
         except Exception as e:
             return f"Error pressing '{key}': {e}"
 
-    async def screenshot(self):
-        """Take a screenshot of the browser page."""
+    async def screenshot_bytes(self) -> bytes:
+        """Take a screenshot of the browser page (raw PNG bytes)."""
         await self.ensure_page()
-        try:
-            bytes_img = await self.page.screenshot()
-            return base64.b64encode(bytes_img).decode()
-        except Exception as e:
-            raise e
+        return await self.page.screenshot()
+
+    async def screenshot(self):
+        """Take a screenshot of the browser page (base64)."""
+        bytes_img = await self.screenshot_bytes()
+        return base64.b64encode(bytes_img).decode()
 
     async def get_content(self):
         """Get page text content."""
@@ -0,0 +1,204 @@
+"""
+Bridge MCP - Screen Capture Pipeline
+====================================
+Capture -> crop -> grayscale -> downscale -> encode, with each step
+optional, so callers pay only for the pixels and bytes they need.
+
+- format: "png" (lossless), "jpeg" or "webp". PNG is written with zlib
+  level 1: about half the encode time of Pillow's default level 6 for
+  ~20% more bytes on a typical desktop.
+- scale / max_dimension shrink the image; integer factors go through
+  Image.reduce (box filter, several times faster than a full resample).
+- The result carries "scale" and "offset" so image coordinates map back
+  to the screen: screen_x = offset[0] + image_x / scale.
+- Every result has an "etag": a hash of the raw captured pixels plus the
+  encoding options. A caller passing it back as if_none_match gets
+  {"unchanged": true} when the screen is identical, and nothing is
+  encoded or sent. The whole buffer is hashed (not a downsampled copy)
+  so even a caret-sized change is seen.
+
+Run `python -m local_agent_tools.screen_capture [image]` on an agent to
+print bytes and milliseconds for each mode on its own screen.
+"""
+
+import hashlib
+import sys
+import time
+from io import BytesIO
+from typing import Optional
+
+import pyautogui
+from PIL import Image
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+FORMATS = {"png": "PNG", "jpeg": "JPEG", "jpg": "JPEG", "webp": "WEBP"}
+DEFAULT_QUALITY = 75
+PNG_COMPRESS_LEVEL = 1
+WEBP_METHOD = 0  # fastest encoder effort; 4 (Pillow's default) is ~3x slower for ~10% fewer bytes
+
+
+def parse_region(region) -> Optional[tuple]:
+    """(x, y, width, height) from [x, y, w, h] or {"x", "y", "width", "height"}."""
+    if not region:
+        return None
+    if isinstance(region, dict):
+        region = [region.get("x", 0), region.get("y", 0), region.get("width"), region.get("height")]
+    x, y, width, height = (int(v) for v in region)
+    if width <= 0 or height <= 0:
+        raise ValueError(f"Region must have a positive size, got {width}x{height}")
+    return x, y, width, height
+
+
+def capture(region=None) -> Image.Image:
+    """Grab the screen, or just `region`, as an RGB image."""
+    return pyautogui.screenshot(region=parse_region(region))
+
+
+def downscale(img: Image.Image, scale: Optional[float] = None,
+              max_dimension: Optional[int] = None) -> tuple:
+    """Shrink by `scale` and/or to fit `max_dimension`; returns (image, applied scale)."""
+    factor = 1.0
+    if scale:
+        factor = min(factor, float(scale))
+    if max_dimension:
+        factor = min(factor, int(max_dimension) / max(img.size))
+    if factor >= 1.0 or factor <= 0:
+        return img, 1.0
+    width = img.width
+    target = (max(1, round(img.width * factor)), max(1, round(img.height * factor)))
+    step = int(1 / factor)
+    if step >= 2:
+        img = img.reduce(step)
+    if img.size != target:
+        img = img.resize(target, Image.Resampling.BILINEAR)
+    return img, round(target[0] / width, 6)
+
+
+def encode(img: Image.Image, format: str = "png", quality: Optional[int] = None) -> bytes:
+    """Encode with the fast settings for each format (quality 100 = lossless WebP)."""
+    kind = format_name(format).upper()
+    quality = DEFAULT_QUALITY if quality is None else max(1, min(int(quality), 100))
+    buffer = BytesIO()
+    if kind == "PNG":
+        img.save(buffer, format="PNG", compress_level=PNG_COMPRESS_LEVEL)
+    elif kind == "JPEG":
+        img.save(buffer, format="JPEG", quality=quality)
+    else:
+        if quality >= 100:
+            # For lossless WebP "quality" is encoder effort; 0 is the fastest
+            img.save(buffer, format="WEBP", lossless=True, quality=0, method=WEBP_METHOD)
+        else:
+            img.save(buffer, format="WEBP", quality=quality, method=WEBP_METHOD)
+    return buffer.getvalue()
+
+
+def prepare(img: Image.Image, scale: Optional[float] = None, max_dimension: Optional[int] = None,
+            grayscale: bool = False) -> tuple:
+    """Grayscale and downscale a captured frame; returns (image, applied scale)."""
+    if grayscale:
+        img = img.convert("L")
+    return downscale(img, scale, max_dimension)
+
+
+def format_name(format: str) -> str:
+    """Canonical lowercase name ("jpg" -> "jpeg"); raises on unknown formats."""
+    kind = FORMATS.get(format.lower())
+    if kind is None:
+        raise ValueError(f"Unknown image format '{format}' (use png, jpeg or webp)")
+    return kind.lower()
+
+
+def render(img: Image.Image, format: str = "png", quality: Optional[int] = None, scale: Optional[float] = None,
+           max_dimension: Optional[int] = None, grayscale: bool = False, offset=(0, 0)) -> dict:
+    """Grayscale / downscale / encode an already captured frame into a screenshot result."""
+    start = time.perf_counter()
+    img, applied = prepare(img, scale, max_dimension, grayscale)
+    data = encode(img, format, quality)
+    return {
+        "image": data,
+        "format": format_name(format),
+        "width": img.width,
+        "height": img.height,
+        "scale": applied,
+        "offset": list(offset),
+        "bytes": len(data),
+        "encode_ms": round((time.perf_counter() - start) * 1000, 1),
+    }
+
+
+def frame_etag(img: Image.Image, *options) -> str:
+    """Hash of the raw pixels (no encoding) plus the options that shape the encoded result."""
+    # np.asarray exposes the pixels as a buffer without tobytes()' extra copy
+    digest = hashlib.sha1(np.asarray(img) if HAS_NUMPY else img.tobytes())
+    digest.update(repr((img.size, img.mode) + options).encode())
+    return digest.hexdigest()[:24]
+
+
+def screenshot(format: str = "png", quality: Optional[int] = None, scale: Optional[float] = None,
+               max_dimension: Optional[int] = None, region=None, grayscale: bool = False,
+               if_none_match: Optional[str] = None) -> dict:
+    """
+    Capture and encode in one step (see render for the result fields).
+    If the frame's etag equals `if_none_match`, only {"unchanged": true,
+    "etag"} is returned.
+    """
+    start = time.perf_counter()
+    box = parse_region(region)
+    img = capture(box)
+    capture_ms = round((time.perf_counter() - start) * 1000, 1)
+    start = time.perf_counter()
+    etag = frame_etag(img, format_name(format), quality, scale, max_dimension, box, grayscale)
+    hash_ms = round((time.perf_counter() - start) * 1000, 1)
+    if if_none_match and if_none_match == etag:
+        return {"unchanged": True, "etag": etag, "capture_ms": capture_ms, "hash_ms": hash_ms}
+    result = render(img, format, quality, scale, max_dimension, grayscale, offset=box[:2] if box else (0, 0))
+    result.update({"etag": etag, "capture_ms": capture_ms, "hash_ms": hash_ms})
+    return result
+
+
+# Modes compared by benchmark(): label -> render() arguments
+BENCHMARK_MODES = {
+    "png (level 6, old default)": None,
+    "png": {"format": "png"},
+    "png gray": {"format": "png", "grayscale": True},
+    "png 1/2": {"format": "png", "scale": 0.5},
+    "jpeg q75": {"format": "jpeg"},
+    "jpeg q50": {"format": "jpeg", "quality": 50},
+    "jpeg q75 1/2": {"format": "jpeg", "scale": 0.5},
+    "jpeg q75 max 1280": {"format": "jpeg", "max_dimension": 1280},
+    "jpeg q75 gray": {"format": "jpeg", "grayscale": True},
+    "webp q75": {"format": "webp"},
+    "webp lossless": {"format": "webp", "quality": 100},
+}
+
+
+def benchmark(img: Optional[Image.Image] = None, repeat: int = 3) -> list:
+    """[{"mode", "bytes", "ms"}] per mode (best of `repeat`) for one frame."""
+    img = img if img is not None else capture()
+    rows = []
+    for label, options in BENCHMARK_MODES.items():
+        best, size = None, 0
+        for _ in range(repeat):
+            start = time.perf_counter()
+            if options is None:
+                buffer = BytesIO()
+                img.save(buffer, format="PNG")
+                size = len(buffer.getvalue())
+            else:
+                size = render(img, **options)["bytes"]
+            elapsed = (time.perf_counter() - start) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        rows.append({"mode": label, "bytes": size, "ms": round(best, 1)})
+    return rows
+
+
+if __name__ == "__main__":
+    frame = Image.open(sys.argv[1]).convert("RGB") if len(sys.argv) > 1 else capture()
+    print(f"{frame.width}x{frame.height}")
+    for row in benchmark(frame):
+        print(f"{row['mode']:<28}{row['bytes']:>12,} B{row['ms']:>10.1f} ms")
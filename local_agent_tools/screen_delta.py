@@ -0,0 +1,193 @@
+"""
+Bridge MCP - Delta Screenshots
+==============================
+Send only the parts of the screen that changed since the caller's last
+frame.
+
+The agent keeps the last captured frame per session. A new frame is
+split into tiles (64x64 by default); tiles whose pixels differ are found
+with one vectorised NumPy comparison. Changed tiles are merged into
+rectangles (runs along a row, then identical runs stacked vertically) and
+each rectangle is encoded on its own. A full keyframe is sent instead
+when there is no usable previous frame, when the caller asks for one, or
+when the changed area passes `keyframe_ratio`.
+
+Every frame gets an id that is unique across agents and restarts.
+Deltas name the frame they apply to (base_frame), and a caller that
+passes any other base_frame gets a keyframe, so a lost response or a
+switch to another agent can never leave it with a corrupt image.
+
+Both sides import this module: the agent builds deltas (FrameTracker),
+clients rebuild full frames with reassemble().
+"""
+
+import base64
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
+from typing import Callable, Optional
+
+from PIL import Image
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+DEFAULT_TILE = 64
+DEFAULT_KEYFRAME_RATIO = 0.5
+MAX_RECTS = 32       # more changed regions than this are sent as their bounding box
+MAX_SESSIONS = 16    # frames kept (one per session, least recently used dropped)
+
+
+def changed_tiles(prev: "np.ndarray", cur: "np.ndarray", tile: int) -> "np.ndarray":
+    """Boolean grid (rows x cols of tiles): True where any pixel in the tile differs."""
+    h, w = cur.shape[:2]
+    ne = (prev != cur).reshape(h, -1)
+    step = tile * (ne.shape[1] // w)
+    full_rows, full_cols = h // tile, w // tile
+    rows = ne[:full_rows * tile].reshape(full_rows, tile, ne.shape[1]).any(axis=1)
+    if h % tile:
+        rows = np.vstack([rows, ne[full_rows * tile:].any(axis=0)])
+    grid = rows[:, :full_cols * step].reshape(rows.shape[0], full_cols, step).any(axis=2)
+    if w % tile:
+        grid = np.hstack([grid, rows[:, full_cols * step:].any(axis=1, keepdims=True)])
+    return grid
+
+
+def merge_rects(grid: "np.ndarray", tile: int, width: int, height: int) -> list:
+    """Pixel rectangles (x, y, w, h) covering the changed tiles."""
+    spans = {}   # (first col, last col) -> [first row, last row] of the open rectangle
+    rects = []
+    for r in range(grid.shape[0]):
+        row = grid[r]
+        runs = []
+        c = 0
+        while c < len(row):
+            if row[c]:
+                start = c
+                while c + 1 < len(row) and row[c + 1]:
+                    c += 1
+                runs.append((start, c))
+            c += 1
+        for key in list(spans):
+            if key not in runs:
+                rects.append((key, spans.pop(key)))
+        for key in runs:
+            if key in spans and spans[key][1] == r - 1:
+                spans[key][1] = r
+            else:
+                spans[key] = [r, r]
+    rects.extend(spans.items())
+    out = []
+    for (c0, c1), (r0, r1) in rects:
+        x, y = c0 * tile, r0 * tile
+        out.append((x, y, min((c1 + 1) * tile, width) - x, min((r1 + 1) * tile, height) - y))
+    return sorted(out, key=lambda rect: (rect[1], rect[0]))
+
+
+class FrameTracker:
+    """Last frame per session, and delta encoding against it."""
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self._frames: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._epoch = os.urandom(4).hex()
+        self._counter = itertools.count(1)
+
+    def _remember(self, session: str, pixels, frame_id: str):
+        with self._lock:
+            self._frames[session] = {"pixels": pixels, "frame": frame_id}
+            self._frames.move_to_end(session)
+            while len(self._frames) > self.max_sessions:
+                self._frames.popitem(last=False)
+
+    def delta(self, session: str, img: Image.Image, encode: Callable[[Image.Image], bytes],
+              keyframe: bool = False, base_frame: Optional[str] = None, tile: int = DEFAULT_TILE,
+              keyframe_ratio: float = DEFAULT_KEYFRAME_RATIO) -> dict:
+        """
+        Compare `img` with the session's last frame and encode either the
+        changed rectangles ("tiles") or a full keyframe ("image").
+        """
+        start = time.perf_counter()
+        tile = max(16, int(tile))
+        with self._lock:
+            previous = self._frames.get(session)
+        frame_id = f"{self._epoch}-{next(self._counter)}"
+        result = {"session": session, "frame": frame_id, "width": img.width, "height": img.height}
+
+        reason = None
+        if not HAS_NUMPY:
+            reason = "numpy not installed"
+        elif keyframe:
+            reason = "requested"
+        elif previous is None:
+            reason = "no previous frame"
+        elif base_frame is not None and base_frame != previous["frame"]:
+            reason = f"caller has frame {base_frame}, agent has {previous['frame']}"
+
+        pixels = np.asarray(img) if HAS_NUMPY else None
+        if reason is None and previous["pixels"].shape != pixels.shape:
+            reason = "screen size changed"
+
+        rects = []
+        if reason is None:
+            grid = changed_tiles(previous["pixels"], pixels, tile)
+            rects = merge_rects(grid, tile, img.width, img.height)
+            if len(rects) > MAX_RECTS:
+                left = min(x for x, _, _, _ in rects)
+                top = min(y for _, y, _, _ in rects)
+                right = max(x + w for x, _, w, _ in rects)
+                bottom = max(y + h for _, y, _, h in rects)
+                rects = [(left, top, right - left, bottom - top)]
+            changed = sum(w * h for _, _, w, h in rects) / float(img.width * img.height)
+            result["changed_ratio"] = round(changed, 4)
+            if changed > keyframe_ratio:
+                reason = f"{changed:.0%} of the screen changed"
+        result["diff_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+        start = time.perf_counter()
+        if reason is not None:
+            result["keyframe"] = True
+            result["reason"] = reason
+            result["image"] = encode(img)
+        else:
+            result["keyframe"] = False
+            result["base_frame"] = previous["frame"]
+            result["tiles"] = [
+                {"x": x, "y": y, "width": w, "height": h, "image": encode(img.crop((x, y, x + w, y + h)))}
+                for x, y, w, h in rects
+            ]
+        result["encode_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        if pixels is not None:
+            self._remember(session, pixels, frame_id)
+        return result
+
+
+def _image_bytes(data) -> bytes:
+    return data if isinstance(data, (bytes, bytearray)) else base64.b64decode(data)
+
+
+def reassemble(frame: Optional[Image.Image], delta: dict) -> Image.Image:
+    """
+    Reference client: apply a screenshot_delta result to the previous full
+    frame (None before the first keyframe) and return the new full frame.
+    """
+    if delta.get("keyframe"):
+        return Image.open(BytesIO(_image_bytes(delta["image"]))).convert("RGB")
+    if frame is None:
+        raise ValueError(f"Delta for frame {delta.get('frame')} needs the previous frame")
+    frame = frame.copy()
+    for part in delta.get("tiles", []):
+        patch = Image.open(BytesIO(_image_bytes(part["image"]))).convert(frame.mode)
+        frame.paste(patch, (part["x"], part["y"]))
+    return frame
+
+
+# Global instance (agent side)
+frame_tracker = FrameTracker()
@@ -0,0 +1,136 @@
+"""
+Bridge MCP - Screen Change / Settle Waits
+=========================================
+Agent-side polling so a caller waiting for a page load, dialog or
+animation makes one request instead of a wait(1) + screenshot loop.
+
+Each sample is captured (optionally just a region), shrunk so its longer
+side is at most SAMPLE_SIZE pixels and converted to grayscale; two
+samples are compared with ImageChops. A sample pixel counts as changed
+when it differs by more than PIXEL_TOLERANCE, and two frames differ when
+the changed fraction exceeds `threshold`. The default threshold ignores
+a blinking caret or a ticking clock but not a dialog or a repainted page.
+"""
+
+import time
+
+from PIL import Image, ImageChops
+
+from local_agent_tools import screen_capture
+
+SAMPLE_SIZE = 400
+PIXEL_TOLERANCE = 8
+DEFAULT_THRESHOLD = 0.001
+DEFAULT_INTERVAL_MS = 100
+MAX_TIMEOUT = 300
+
+# Lookup table for ImageChops.difference -> changed-pixel mask
+_MASK = [0] * (PIXEL_TOLERANCE + 1) + [255] * (255 - PIXEL_TOLERANCE)
+
+
+class Sampler:
+    """Downsampled grayscale captures of the screen or a region."""
+
+    def __init__(self, region=None):
+        self.box = screen_capture.parse_region(region)
+        self.offset = self.box[:2] if self.box else (0, 0)
+        self.factor = 1
+        self.count = 0
+
+    def sample(self) -> Image.Image:
+        img = screen_capture.capture(self.box)
+        self.factor = max(1, -(-max(img.size) // SAMPLE_SIZE))
+        self.count += 1
+        if self.factor > 1:
+            img = img.reduce(self.factor)
+        return img.convert("L")
+
+    def compare(self, before: Image.Image, after: Image.Image) -> tuple:
+        """(changed fraction, changed bounding box in screen coordinates or None)."""
+        if before.size != after.size:
+            return 1.0, None
+        mask = ImageChops.difference(before, after).point(_MASK)
+        changed = mask.histogram()[255] / float(mask.width * mask.height)
+        box = mask.getbbox()
+        if box is None:
+            return changed, None
+        left, top, right, bottom = (v * self.factor for v in box)
+        return changed, [self.offset[0] + left, self.offset[1] + top, right - left, bottom - top]
+
+
+def _attach_frame(result: dict, region, screenshot) -> dict:
+    """Add the final frame (screenshot=True or a dict of screenshot options)."""
+    if screenshot:
+        options = {k: v for k, v in screenshot.items() if k != "region"} if isinstance(screenshot, dict) else {}
+        result.update(screen_capture.screenshot(region=region, **options))
+    return result
+
+
+def _limits(timeout: float, interval_ms: int) -> tuple:
+    return min(max(float(timeout), 0), MAX_TIMEOUT), max(int(interval_ms), 10) / 1000.0
+
+
+def wait_for_change(region=None, threshold: float = DEFAULT_THRESHOLD, timeout: float = 10,
+                    interval_ms: int = DEFAULT_INTERVAL_MS, screenshot=False) -> dict:
+    """
+    Sample until the screen (or region) differs from how it looked when the
+    call started, or until `timeout` seconds pass.
+    """
+    timeout, interval = _limits(timeout, interval_ms)
+    sampler = Sampler(region)
+    start = time.monotonic()
+    baseline = sampler.sample()
+    changed, box = 0.0, None
+    while True:
+        elapsed = time.monotonic() - start
+        if elapsed >= timeout:
+            break
+        time.sleep(min(interval, timeout - elapsed))
+        changed, box = sampler.compare(baseline, sampler.sample())
+        if changed > threshold:
+            break
+    result = {
+        "changed": changed > threshold,
+        "changed_ratio": round(changed, 5),
+        "bbox": box,
+        "timed_out": changed <= threshold,
+        "elapsed_ms": round((time.monotonic() - start) * 1000),
+        "samples": sampler.count,
+    }
+    return _attach_frame(result, region, screenshot)
+
+
+def wait_for_stable(region=None, quiet_ms: int = 500, threshold: float = DEFAULT_THRESHOLD,
+                    timeout: float = 10, interval_ms: int = DEFAULT_INTERVAL_MS, screenshot=False) -> dict:
+    """
+    Sample until the screen (or region) has not changed for `quiet_ms`
+    milliseconds, or until `timeout` seconds pass.
+    """
+    timeout, interval = _limits(timeout, interval_ms)
+    quiet = max(int(quiet_ms), 0) / 1000.0
+    sampler = Sampler(region)
+    start = time.monotonic()
+    previous = sampler.sample()
+    last_change = start
+    stable = False
+    while True:
+        now = time.monotonic()
+        if now - last_change >= quiet:
+            stable = True
+            break
+        if now - start >= timeout:
+            break
+        time.sleep(min(interval, max(timeout - (now - start), 0)))
+        current = sampler.sample()
+        changed, _ = sampler.compare(previous, current)
+        if changed > threshold:
+            last_change = time.monotonic()
+        previous = current
+    result = {
+        "stable": stable,
+        "timed_out": not stable,
+        "elapsed_ms": round((time.monotonic() - start) * 1000),
+        "last_change_ms": round((last_change - start) * 1000),
+        "samples": sampler.count,
+    }
+    return _attach_frame(result, region, screenshot)
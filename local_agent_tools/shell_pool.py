@@ -0,0 +1,312 @@
+"""
+Bridge MCP - Warm Shell Sessions
+================================
+Long-lived PowerShell / CMD / bash processes that take commands over stdin.
+
+Starting `powershell -Command ...` for every call costs hundreds of
+milliseconds to seconds. Instead we keep shells running and frame each
+command with a unique sentinel line on stdout (carrying the exit code) and
+on stderr, so output can be split per command.
+
+- Anonymous calls borrow an idle session and run isolated (subshell /
+  script block / pushd-popd) so state doesn't leak between callers.
+- Named sessions keep state (cwd, variables) between calls.
+- A session that times out or dies is killed and replaced.
+"""
+
+import atexit
+import base64
+import queue
+import subprocess
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+SHELLS = {
+    "powershell": {
+        "argv": ["powershell", "-NoLogo", "-NoProfile", "-NonInteractive",
+                 "-ExecutionPolicy", "Bypass", "-OutputFormat", "Text", "-Command", "-"],
+        "init": "$ProgressPreference = 'SilentlyContinue'; "
+                "[Console]::OutputEncoding = [Text.Encoding]::UTF8\n",
+    },
+    "cmd": {
+        "argv": ["cmd", "/Q"],
+        "init": "chcp 65001 >NUL\n",
+    },
+    "bash": {
+        "argv": ["bash", "--noprofile", "--norc"],
+        "init": "",
+    },
+}
+
+MAX_IDLE_PER_SHELL = 2
+MAX_NAMED_SESSIONS = 16
+NAMED_SESSION_IDLE_TIMEOUT = 30 * 60  # seconds
+STARTUP_TIMEOUT = 30
+
+
+def _frame_powershell(command: str, marker: str, isolate: bool) -> str:
+    src = base64.b64encode(command.encode("utf-8")).decode()
+    decode = f"[Text.Encoding]::UTF8.GetString([Convert]::FromBase64String('{src}'))"
+    invoke = f"& ([ScriptBlock]::Create({decode}))" if isolate else f"Invoke-Expression ({decode})"
+    push, pop = ("Push-Location; ", " finally { Pop-Location }") if isolate else ("", "")
+    return (
+        "$global:LASTEXITCODE = 0; $__bridge_errs = $Error.Count; $__bridge_ok = $true; "
+        f"{push}try {{ {invoke} 2>&1 | ForEach-Object {{ "
+        "if ($_ -is [System.Management.Automation.ErrorRecord]) { [Console]::Error.WriteLine($_.ToString()) } "
+        "else { ($_ | Out-String -Stream -Width 4096) | ForEach-Object { [Console]::Out.WriteLine($_) } } }; "
+        "$__bridge_ok = ($Error.Count -eq $__bridge_errs) "
+        "} catch { [Console]::Error.WriteLine($_.ToString()); $__bridge_ok = $false }"
+        f"{pop}; "
+        "$__bridge_rc = if ($LASTEXITCODE) { $LASTEXITCODE } elseif ($__bridge_ok) { 0 } else { 1 }; "
+        f"[Console]::Out.WriteLine(''); [Console]::Out.WriteLine('{marker} ' + $__bridge_rc); "
+        f"[Console]::Error.WriteLine(''); [Console]::Error.WriteLine('{marker}')\n"
+    )
+
+
+def _frame_cmd(command: str, marker: str, isolate: bool) -> str:
+    # cmd has no heredoc: one line, statements chained with &
+    line = " & ".join(part for part in command.splitlines() if part.strip()) or "rem"
+    if isolate:
+        line = f"pushd . & {line} & call echo.& call echo {marker} %^errorlevel%& popd"
+    else:
+        line = f"{line} & call echo.& call echo {marker} %^errorlevel%"
+    return f"{line}& (echo.& echo {marker})1>&2\n"
+
+
+def _frame_bash(command: str, marker: str, isolate: bool) -> str:
+    src = base64.b64encode(command.encode("utf-8")).decode()
+    body = f'eval "$(printf %s {src} | base64 -d)"'
+    if isolate:
+        body = f"( {body} )"
+    return (
+        f"{body} </dev/null; __bridge_rc=$?; "
+        f"printf '\\n{marker} %d\\n' \"$__bridge_rc\"; printf '\\n{marker}\\n' >&2\n"
+    )
+
+
+FRAMERS = {
+    "powershell": _frame_powershell,
+    "cmd": _frame_cmd,
+    "bash": _frame_bash,
+}
+
+
+class ShellSession:
+    """One running shell process with sentinel-framed command execution."""
+
+    def __init__(self, shell: str, name: Optional[str] = None):
+        if shell not in SHELLS:
+            raise ValueError(f"Unknown shell: {shell}")
+        self.shell = shell
+        self.name = name
+        self.lock = threading.Lock()
+        self.last_used = time.time()
+        self.proc = subprocess.Popen(
+            SHELLS[shell]["argv"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            text=True, encoding="utf-8", errors="replace", bufsize=1,
+            creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0),
+        )
+        self._stdout: queue.Queue = queue.Queue()
+        self._stderr: queue.Queue = queue.Queue()
+        for stream, q in ((self.proc.stdout, self._stdout), (self.proc.stderr, self._stderr)):
+            threading.Thread(target=self._pump, args=(stream, q), daemon=True).start()
+
+        if SHELLS[shell]["init"]:
+            self._write(SHELLS[shell]["init"])
+        # Round-trip once so banners/startup noise are consumed and the shell is warm
+        result = self.run("", timeout=STARTUP_TIMEOUT, isolate=False)
+        if result.get("error"):
+            self.kill()
+            raise RuntimeError(f"Could not start {shell}: {result['error']}")
+
+    @staticmethod
+    def _pump(stream, q: queue.Queue):
+        try:
+            for line in iter(stream.readline, ""):
+                q.put(line)
+        except (OSError, ValueError):
+            pass
+        q.put(None)  # EOF
+
+    @property
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def _write(self, text: str):
+        self.proc.stdin.write(text)
+        self.proc.stdin.flush()
+
+    @staticmethod
+    def _collect(q: queue.Queue, marker: str, deadline: float) -> Tuple[str, Optional[str], str]:
+        """
+        Read lines until the sentinel. Returns (output, sentinel_suffix, state)
+        where state is "done", "timeout" or "exited".
+        """
+        lines: List[str] = []
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return "".join(lines), None, "timeout"
+            try:
+                line = q.get(timeout=remaining)
+            except queue.Empty:
+                return "".join(lines), None, "timeout"
+            if line is None:
+                return "".join(lines), None, "exited"
+            if line.startswith(marker):
+                output = "".join(lines)
+                # Drop the newline we print in front of the sentinel
+                if output.endswith("\r\n"):
+                    output = output[:-2]
+                elif output.endswith("\n"):
+                    output = output[:-1]
+                return output, line[len(marker):].strip(), "done"
+            lines.append(line)
+
+    def run(self, command: str, timeout: float = 30, isolate: bool = True) -> dict:
+        """Run one command and wait for its sentinel (caller holds self.lock)."""
+        self.last_used = time.time()
+        marker = f"__BRIDGE_{uuid.uuid4().hex}__"
+        deadline = time.monotonic() + timeout
+        try:
+            self._write(FRAMERS[self.shell](command, marker, isolate))
+        except (OSError, ValueError) as e:
+            return {"stdout": "", "stderr": "", "returncode": self.proc.poll(), "error": f"Shell unavailable: {e}"}
+
+        stdout, code, state = self._collect(self._stdout, marker, deadline)
+        stderr = ""
+        if state == "done":
+            stderr, _, state = self._collect(self._stderr, marker, deadline)
+
+        result = {"stdout": stdout, "stderr": stderr}
+        if state == "done":
+            try:
+                result["returncode"] = int(code)
+            except (TypeError, ValueError):
+                result["returncode"] = None
+        elif state == "timeout":
+            self.kill()
+            result["returncode"] = None
+            result["error"] = f"Command timed out after {timeout}s (session recycled)"
+        else:
+            self.proc.wait(timeout=5)
+            result["returncode"] = self.proc.returncode
+            result["error"] = "Shell exited while running the command (session recycled)"
+        return result
+
+    def kill(self):
+        try:
+            self.proc.kill()
+            self.proc.wait(timeout=5)
+        except Exception:
+            pass
+
+
+class ShellPool:
+    """Idle anonymous sessions per shell, plus named stateful sessions."""
+
+    def __init__(self):
+        self._idle: Dict[str, List[ShellSession]] = {}
+        self._named: Dict[Tuple[str, str], ShellSession] = {}
+        self._lock = threading.Lock()
+
+    def _acquire(self, shell: str) -> ShellSession:
+        with self._lock:
+            idle = self._idle.setdefault(shell, [])
+            while idle:
+                session = idle.pop()
+                if session.alive:
+                    return session
+        return ShellSession(shell)
+
+    def _release(self, session: ShellSession):
+        if not session.alive:
+            return
+        with self._lock:
+            idle = self._idle.setdefault(session.shell, [])
+            if len(idle) < MAX_IDLE_PER_SHELL:
+                idle.append(session)
+                return
+        session.kill()
+
+    def _named_session(self, shell: str, name: str) -> ShellSession:
+        with self._lock:
+            self._expire_named()
+            session = self._named.get((shell, name))
+            if session is not None and session.alive:
+                return session
+            if session is None and len(self._named) >= MAX_NAMED_SESSIONS:
+                raise RuntimeError(f"Too many named shell sessions (max {MAX_NAMED_SESSIONS})")
+        session = ShellSession(shell, name)
+        with self._lock:
+            self._named[(shell, name)] = session
+        return session
+
+    def _expire_named(self):
+        cutoff = time.time() - NAMED_SESSION_IDLE_TIMEOUT
+        for key, session in list(self._named.items()):
+            if not session.alive or (session.last_used < cutoff and not session.lock.locked()):
+                session.kill()
+                del self._named[key]
+
+    def run(self, shell: str, command: str, timeout: float = 30, session: Optional[str] = None) -> dict:
+        """
+        Run a command in a warm shell. With `session`, the named session's
+        state (cwd, variables) persists across calls.
+        """
+        if session:
+            sess = self._named_session(shell, session)
+            with sess.lock:
+                result = sess.run(command, timeout=timeout, isolate=False)
+            result["session"] = session
+            return result
+
+        sess = self._acquire(shell)
+        with sess.lock:
+            result = sess.run(command, timeout=timeout, isolate=True)
+        self._release(sess)
+        return result
+
+    def prewarm(self, shell: str, count: int = 1):
+        """Start idle sessions ahead of time (e.g. at agent startup)."""
+        for _ in range(count):
+            try:
+                self._release(ShellSession(shell))
+            except Exception as e:
+                print(f"[Shell] Could not prewarm {shell}: {e}")
+                return
+
+    def close_session(self, shell: str, name: str) -> dict:
+        """Close a named session."""
+        with self._lock:
+            session = self._named.pop((shell, name), None)
+        if session is None:
+            return {"error": f"No {shell} session named '{name}'"}
+        session.kill()
+        return {"status": "closed", "shell": shell, "session": name}
+
+    def list_sessions(self) -> dict:
+        with self._lock:
+            return {
+                "named": [
+                    {"shell": shell, "session": name, "alive": s.alive, "idle_seconds": round(time.time() - s.last_used, 1)}
+                    for (shell, name), s in self._named.items()
+                ],
+                "idle": {shell: len(sessions) for shell, sessions in self._idle.items()},
+            }
+
+    def shutdown(self):
+        with self._lock:
+            sessions = [s for idle in self._idle.values() for s in idle] + list(self._named.values())
+            self._idle.clear()
+            self._named.clear()
+        for session in sessions:
+            session.kill()
+
+
+# Global instance
+shell_pool = ShellPool()
+atexit.register(shell_pool.shutdown)
@@ -0,0 +1,172 @@
+"""
+Bridge MCP - Streaming Shell Jobs
+=================================
+Runs a shell command as an asyncio subprocess and yields its stdout/stderr
+incrementally, for long builds and log tails that would otherwise return
+nothing until they exit (or hit the 30s buffered timeout).
+
+Each job has an id so it can be cancelled while running, a per-call
+timeout, and a cap on total output bytes.
+"""
+
+import asyncio
+import codecs
+import os
+import signal
+import time
+import uuid
+from typing import AsyncIterator, Dict, Optional
+
+# Fresh process per streamed job; UTF-8 output is forced where the shell allows it
+STREAM_ARGV = {
+    "powershell": lambda cmd: ["powershell", "-NoLogo", "-NoProfile", "-NonInteractive", "-Command",
+                               "[Console]::OutputEncoding = [Text.Encoding]::UTF8; " + cmd],
+    "cmd": lambda cmd: ["cmd", "/c", "chcp 65001 >NUL & " + cmd],
+    "bash": lambda cmd: ["bash", "-c", cmd],
+}
+
+CHUNK_SIZE = 64 * 1024
+DEFAULT_TIMEOUT = 300
+DEFAULT_MAX_OUTPUT = 10 * 1024 * 1024  # bytes
+
+
+async def kill_tree(proc: asyncio.subprocess.Process):
+    """Kill a job's process and everything it started (pipelines, child builds)."""
+    if proc.returncode is not None:
+        return
+    try:
+        if os.name == 'nt':
+            killer = await asyncio.create_subprocess_exec(
+                "taskkill", "/F", "/T", "/PID", str(proc.pid),
+                stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+            )
+            await killer.wait()
+        else:
+            os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError, OSError):
+        pass
+    if proc.returncode is None:
+        try:
+            proc.kill()
+        except ProcessLookupError:
+            pass
+
+
+class ShellJobs:
+    """Registry of running streamed commands."""
+
+    def __init__(self):
+        self.jobs: Dict[str, dict] = {}
+
+    async def stream(self, shell: str, command: str, timeout: float = DEFAULT_TIMEOUT,
+                     max_output: int = DEFAULT_MAX_OUTPUT, job_id: Optional[str] = None) -> AsyncIterator[dict]:
+        """
+        Run `command` and yield events:
+        {"event": "started", "job_id", "pid"}
+        {"stream": "stdout" | "stderr", "data": "..."}   (repeated)
+        {"event": "exit", "returncode", "timed_out", "truncated", "cancelled", "bytes", "duration"}
+        """
+        if shell not in STREAM_ARGV:
+            raise ValueError(f"Unknown shell: {shell}")
+        job_id = job_id or uuid.uuid4().hex[:12]
+        start = time.monotonic()
+        proc = await asyncio.create_subprocess_exec(
+            *STREAM_ARGV[shell](command),
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=(os.name != 'nt'),
+        )
+        job = {"job_id": job_id, "shell": shell, "command": command, "pid": proc.pid,
+               "proc": proc, "started": time.time(), "cancelled": False}
+        self.jobs[job_id] = job
+
+        chunks: asyncio.Queue = asyncio.Queue()
+
+        async def pump(stream, name):
+            while True:
+                chunk = await stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                await chunks.put((name, chunk))
+            await chunks.put((name, None))
+
+        pumps = [asyncio.ensure_future(pump(proc.stdout, "stdout")),
+                 asyncio.ensure_future(pump(proc.stderr, "stderr"))]
+        decoders = {name: codecs.getincrementaldecoder("utf-8")(errors="replace") for name in ("stdout", "stderr")}
+        total, open_streams = 0, 2
+        timed_out = truncated = False
+        deadline = start + timeout
+        exited = False
+
+        try:
+            yield {"event": "started", "job_id": job_id, "pid": proc.pid}
+            while open_streams:
+                remaining = deadline - time.monotonic()
+                try:
+                    name, chunk = await asyncio.wait_for(chunks.get(), max(remaining, 0))
+                except asyncio.TimeoutError:
+                    timed_out = True
+                    break
+                if chunk is None:
+                    open_streams -= 1
+                    tail = decoders[name].decode(b"", final=True)
+                    if tail:
+                        yield {"stream": name, "data": tail}
+                    continue
+                allowed = max_output - total
+                piece = chunk[:allowed]
+                total += len(piece)
+                text = decoders[name].decode(piece)
+                if text:
+                    yield {"stream": name, "data": text}
+                if len(chunk) > allowed:
+                    truncated = True
+                    break
+            exited = not open_streams
+        finally:
+            if exited:
+                # Both pipes hit EOF: reap the process instead of signalling it,
+                # since a kill racing asyncio's child reaping loses the exit code
+                try:
+                    await asyncio.wait_for(proc.wait(), max(deadline - time.monotonic(), 1))
+                except asyncio.TimeoutError:
+                    timed_out = True
+            for task in pumps:
+                task.cancel()
+            if proc.returncode is None:
+                await kill_tree(proc)
+            await proc.wait()
+            self.jobs.pop(job_id, None)
+
+        yield {
+            "event": "exit",
+            "job_id": job_id,
+            "returncode": proc.returncode,
+            "timed_out": timed_out,
+            "truncated": truncated,
+            "cancelled": job["cancelled"],
+            "bytes": total,
+            "duration": round(time.monotonic() - start, 3),
+        }
+
+    async def cancel(self, job_id: str) -> dict:
+        """Kill a running job; its stream then ends with cancelled=True."""
+        job = self.jobs.get(job_id)
+        if job is None:
+            return {"error": f"No running job '{job_id}'"}
+        job["cancelled"] = True
+        await kill_tree(job["proc"])
+        return {"status": "cancelled", "job_id": job_id}
+
+    def list_jobs(self) -> dict:
+        now = time.time()
+        return {"jobs": [
+            {"job_id": j["job_id"], "shell": j["shell"], "command": j["command"][:200],
+             "pid": j["pid"], "running_seconds": round(now - j["started"], 1)}
+            for j in self.jobs.values()
+        ]}
+
+
+# Global instance
+shell_jobs = ShellJobs()
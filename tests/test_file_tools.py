@@ -0,0 +1,53 @@
+from local_agent_tools import file_tools
+
+
+def test_patch_keeps_control_characters_in_untouched_lines(tmp_path):
+    path = tmp_path / "ff.txt"
+    path.write_bytes(b"a\n\x0c\nb\nx\x0by\nc\n")
+
+    result = file_tools.patch_file(str(path), edits=[{"old": "b", "new": "B"}])
+
+    assert "error" not in result
+    assert path.read_bytes() == b"a\n\x0c\nB\nx\x0by\nc\n"
+
+
+def test_diff_and_line_edits_keep_crlf_and_form_feeds(tmp_path):
+    path = tmp_path / "crlf.txt"
+    path.write_bytes(b"one\r\n\x0c\r\ntwo\r\nthree\x1cfour\r\n")
+
+    diff = "--- a\n+++ b\n@@ -2,2 +2,2 @@\n \x0c\n-two\n+TWO\n"
+    assert "error" not in file_tools.patch_file(str(path), diff=diff)
+    assert path.read_bytes() == b"one\r\n\x0c\r\nTWO\r\nthree\x1cfour\r\n"
+
+    result = file_tools.patch_file(str(path), edits=[{"start_line": 1, "end_line": 1, "content": "1\x0b1\n"}])
+    assert "error" not in result
+    assert path.read_bytes() == b"1\x0b1\r\n\x0c\r\nTWO\r\nthree\x1cfour\r\n"
+
+
+def test_pages_smaller_than_a_character_still_advance(tmp_path):
+    text = "a€😀b"
+    path = tmp_path / "utf8.txt"
+    path.write_bytes(text.encode("utf-8"))
+
+    pages, offset = [], 0
+    while True:
+        page = file_tools.read_file(str(path), offset=offset, max_bytes=1)
+        assert page["content"]
+        pages.append(page["content"])
+        offset = page["next_offset"]
+        if page["eof"]:
+            break
+    assert pages == list(text)
+
+    page = file_tools.read_file(str(path), offset=0, max_bytes=5)
+    assert page["content"] == "a€" and page["next_offset"] == 4
+
+
+def test_line_ranges_and_tail(tmp_path):
+    path = tmp_path / "lines.txt"
+    path.write_bytes(b"".join(b"l%d\n" % n for n in range(1, 9)))
+
+    assert file_tools.read_file(str(path), lines=[3, 5])["content"] == "l3\nl4\nl5\n"
+    assert file_tools.read_file(str(path), lines=[7])["content"] == "l7\nl8\n"
+    assert file_tools.read_file(str(path), tail=2)["content"] == "l7\nl8\n"
+    assert "error" in file_tools.read_file(str(path), lines=[5, 3])
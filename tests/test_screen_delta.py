@@ -0,0 +1,30 @@
+import random
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from local_agent_tools.screen_delta import FrameTracker, reassemble
+
+
+def png(img):
+    buffer = BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("size", [(100, 56), (40, 30), (64, 20), (20, 64), (150, 70)])
+def test_frames_smaller_than_a_tile_roundtrip(size):
+    rng = random.Random(size[0] * 1000 + size[1])
+    tracker = FrameTracker()
+    pixels = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+    frame = None
+    for n in range(6):
+        if n:
+            x, y = rng.randrange(size[0]), rng.randrange(size[1])
+            pixels[y:y + 3, x:x + 3] = rng.randrange(1, 256)
+        delta = tracker.delta("s", Image.fromarray(pixels.copy()), png, keyframe_ratio=1.0)
+        frame = reassemble(frame, delta)
+        assert n == 0 or not delta["keyframe"]
+        assert np.array_equal(np.asarray(frame), pixels)